@@ -0,0 +1,203 @@
+import pandas as pd
+import os
+import click
+import joblib
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from hyperparameter_search import SEARCH_STRATEGIES
+from model_registry import fingerprint_train_data
+from demand_forecasting_model import (FORECAST_MODES, open_connection, close_connection, get_train_window, query_train_data, slice_train_data,
+                                      get_product_codes, get_model_train_data, get_forecast_input, create_model, predict_demand, score_forecast,
+                                      get_worker_jobs)
+
+BACKENDS = ['onehot', 'categorical']
+
+# Fit budget of every search of the backtest, which runs one per fold and variant
+BACKTEST_MAX_FITS = 100
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### VARIANT FUNCTIONS #####
+
+# Function to parse model variants written as backend:forecast_mode:search
+def parse_variants(ctx, param, values):
+
+    variants = []
+    for value in values:
+        parts = value.split(':')
+        if len(parts) != 3 or parts[0] not in BACKENDS or parts[1] not in FORECAST_MODES or parts[2] not in SEARCH_STRATEGIES:
+            raise click.BadParameter(f"'{value}' is not of the form backend:forecast_mode:search with backend in {BACKENDS}, "
+                                     f"forecast_mode in {FORECAST_MODES} and search in {SEARCH_STRATEGIES}.")
+        variants.append(tuple(parts))
+
+    return variants
+
+##### FOLD FUNCTIONS #####
+
+# Function to get the actual monthly demand of a year from the queried history
+def get_fold_actual_demand(history, fold_year):
+
+    actual_demand = history.loc[history['Order Year'] == fold_year, ['Order Month', 'Product Id', 'Total Quantity Purchased']]
+
+    return actual_demand.rename(columns={'Total Quantity Purchased': 'Actual Quantity'}).reset_index(drop=True)
+
+def get_fold_matrices(train_data, fold_year, cache_dir, backend='onehot', forecast_mode='recursive'):
+    """
+    Build the training matrices and forecasting input of a fold, or load them from the cache when the fold's
+    training data has been seen before. The cache is keyed on the fingerprint of the training data so that it
+    is invalidated when the underlying sales change.
+
+    Returns:
+    - X_train, Y_train, the forecasting input and whether they were read from the cache.
+    """
+
+    data_fingerprint, _ = fingerprint_train_data(train_data)
+    cache_path = os.path.join(cache_dir, f"fold_{fold_year}_{backend}_{forecast_mode}_{data_fingerprint[:12]}.pkl")
+
+    if os.path.exists(cache_path):
+        X_train, Y_train, input_for_forecast = joblib.load(cache_path)
+        return X_train, Y_train, input_for_forecast, True
+
+    product_codes = get_product_codes(train_data)
+    X_train, Y_train = get_model_train_data(train_data, backend=backend, forecast_mode=forecast_mode, product_codes=product_codes)
+    input_for_forecast = get_forecast_input(train_data, fold_year, backend=backend, forecast_mode=forecast_mode, product_codes=product_codes)
+
+    # Write to a temporary file first so that folds running in parallel never read a partial matrix
+    joblib.dump((X_train, Y_train, input_for_forecast), cache_path + f'.{os.getpid()}.tmp')
+    os.replace(cache_path + f'.{os.getpid()}.tmp', cache_path)
+
+    return X_train, Y_train, input_for_forecast, False
+
+# Function to train and score one variant on one fold, run inside a worker process
+def run_fold(train_data, actual_demand, fold_year, variant, cache_dir, max_fits=None, max_time=None, n_jobs=1):
+
+    backend, forecast_mode, search = variant
+
+    start_time = perf_counter()
+    X_train, Y_train, input_for_forecast, cached = get_fold_matrices(train_data, fold_year, cache_dir, backend=backend, forecast_mode=forecast_mode)
+    feature_time = perf_counter() - start_time
+
+    # The fit time includes the hyperparameter search
+    start_time = perf_counter()
+    model = create_model(X_train, Y_train, backend=backend, search=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+    fit_time = perf_counter() - start_time
+
+    start_time = perf_counter()
+    forecasted_data = predict_demand(model, input_for_forecast, forecast_mode=forecast_mode)
+    predict_time = perf_counter() - start_time
+
+    print(f"{nowtime()} Fold {fold_year} of {':'.join(variant)} scored.")
+
+    return {
+        'variant': ':'.join(variant),
+        'backend': backend,
+        'forecast_mode': forecast_mode,
+        'search': search,
+        'fold_year': fold_year,
+        'training_rows': len(X_train),
+        'cached_features': cached,
+        **score_forecast(forecasted_data, actual_demand),
+        'feature_time_seconds': feature_time,
+        'fit_time_seconds': fit_time,
+        'predict_time_seconds': predict_time
+    }
+
+##### BACKTEST FUNCTIONS #####
+
+def run_backtest(history, fold_years, variants, cache_dir, workers=None, max_fits=BACKTEST_MAX_FITS, max_time=None):
+    """
+    Rolling-origin backtest: every fold year is forecast from a model trained on the window ending the December
+    before it, exactly as in production, and scored against its actual demand. All (variant, fold) pairs run in
+    parallel worker processes.
+
+    Returns:
+    - DataFrame with the accuracy metrics and timings of every variant on every fold.
+    """
+
+    folds = {}
+    for fold_year in fold_years:
+        train_data, actual_demand = slice_train_data(history, fold_year), get_fold_actual_demand(history, fold_year)
+        if train_data.empty or actual_demand.empty:
+            print(f"{nowtime()} Not enough sales data to backtest {fold_year}, skipping.")
+            continue
+        folds[fold_year] = (train_data, actual_demand)
+
+    tasks = [(fold_year, variant) for fold_year in folds for variant in variants]
+
+    workers, n_jobs = get_worker_jobs(len(tasks), workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_fold, *folds[fold_year], fold_year, variant, cache_dir, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+            for fold_year, variant in tasks
+        ]
+        fold_results = pd.DataFrame([future.result() for future in futures])
+
+    print(f"{nowtime()} {len(tasks)} folds backtested using {workers} workers.")
+
+    return fold_results
+
+# Function to average the metrics and add up the timings of every variant over its folds
+def summarise_backtest(fold_results):
+
+    summary = fold_results.groupby('variant').agg(
+        folds=('fold_year', 'count'),
+        MAE=('MAE', 'mean'),
+        RMSE=('RMSE', 'mean'),
+        WAPE=('WAPE', 'mean'),
+        Bias=('Bias', 'mean'),
+        fit_time_seconds=('fit_time_seconds', 'sum'),
+        predict_time_seconds=('predict_time_seconds', 'sum')
+    ).sort_values('WAPE').reset_index()
+
+    print(f"{nowtime()} Backtest summary:\n{summary}")
+
+    return summary
+
+@click.command()
+@click.argument('output_dir', type=click.Path(exists=True))
+@click.argument('start_year', type=int)
+@click.argument('end_year', type=int)
+@click.argument('model_dir', type=click.Path(exists=True))
+@click.argument('database_path', type=click.Path(exists=True))
+@click.option('--variant', 'variants', multiple=True, callback=parse_variants, default=['onehot:recursive:random', 'onehot:direct:random', 'categorical:recursive:random'],
+              help='Model variant to backtest as backend:forecast_mode:search. Can be given several times.')
+@click.option('--max-fits', type=int, default=BACKTEST_MAX_FITS, help='Maximum number of fits of every fold and variant for the non-grid search strategies.')
+@click.option('--max-time', type=float, default=None, help='Wall-clock cap in seconds for the non-grid search strategies.')
+@click.option('--workers', type=int, default=None, help='Number of folds run in parallel. Defaults to one per fold up to the number of cores.')
+@click.option('--cache-dir', type=click.Path(), default=None, help='Directory of the cached fold matrices. Defaults to backtest_cache in the model directory.')
+
+def main(output_dir, start_year, end_year, model_dir, database_path, variants, max_fits, max_time, workers, cache_dir):
+
+    # 2015 is the first year of sales data and has no history to train on
+    fold_years = list(range(max(start_year, 2016), end_year + 1))
+    if not fold_years:
+        print(f"{nowtime()} No years to backtest between {start_year} and {end_year}.")
+        return
+
+    cache_dir = cache_dir or os.path.join(model_dir, 'backtest_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Load the training windows and the actual demand of all the folds at once
+    conn = open_connection(database_path)
+    history = query_train_data(conn, get_train_window(fold_years[0])[0], f"{fold_years[-1]}-12")
+    close_connection(conn)
+
+    fold_results = run_backtest(history, fold_years, variants, cache_dir, workers=workers, max_fits=max_fits, max_time=max_time)
+    if fold_results.empty:
+        return
+
+    summary = summarise_backtest(fold_results)
+
+    fold_results.to_csv(os.path.join(output_dir, f'{start_year}_{end_year}_backtest_folds.csv'), index=False)
+    summary.to_csv(os.path.join(output_dir, f'{start_year}_{end_year}_backtest_summary.csv'), index=False)
+    print(f"{nowtime()} Backtest results saved!")
+
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+#!/bin/bash
+
+# Purpose: This script is used to backtest demand forecasting model variants on a range of years
+# backtest_start_year=2016
+# backtest_end_year=2017
+# backtest_variants="onehot:recursive:random onehot:direct:random"
+
+# Set up --------------------------------------------------
+backtesting_log="${report_dir}/backtesting.log"
+
+# Backtest options
+backtest_options=()
+for variant in $backtest_variants; do
+    backtest_options+=(--variant "$variant")
+done
+[ -n "$search_max_fits" ] && backtest_options+=(--max-fits "$search_max_fits")
+[ -n "$search_max_time" ] && backtest_options+=(--max-time "$search_max_time")
+[ -n "$forecast_workers" ] && backtest_options+=(--workers "$forecast_workers")
+
+## Begin Log
+echo "----- Start Run -----" | tee "$backtesting_log"
+
+# Backtest the model variants
+python "$backtesting_script" \
+    "$report_dir" \
+    "$backtest_start_year" \
+    "$backtest_end_year" \
+    "$model_dir" \
+    "$database_path" \
+    "${backtest_options[@]}" | tee -a "$backtesting_log"
+
+# End Log
+echo "----- End Run -----" | tee -a "$backtesting_log"
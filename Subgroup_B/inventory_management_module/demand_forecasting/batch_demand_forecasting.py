@@ -0,0 +1,122 @@
+import pandas as pd
+import os
+import click
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from hyperparameter_search import SEARCH_STRATEGIES
+from demand_forecasting_model import (FORECAST_MODES, open_connection, close_connection, get_train_window, query_train_data,
+                                      slice_train_data, forecast_year, plot_forecast, get_worker_jobs)
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### HISTORY FUNCTIONS #####
+
+def get_history(conn, years):
+    """
+    Query the union of the training windows of all the years at once, so that overlapping history is read a single time.
+    """
+
+    windows = [get_train_window(year) for year in years]
+    start_year_month, end_year_month = min(window[0] for window in windows), max(window[1] for window in windows)
+
+    history = query_train_data(conn, start_year_month, end_year_month)
+    print(f"{nowtime()} History from {start_year_month} to {end_year_month} loaded for {len(years)} years ({len(history)} rows).")
+
+    return history
+
+##### BATCH FORECASTING FUNCTIONS #####
+
+# Function to train and forecast a single year, run inside a worker process
+def forecast_batch_year(train_data, input_year, output_dir, model_dir, backend='onehot', forecast_mode='recursive',
+                        search='grid', max_fits=None, max_time=None, n_jobs=1):
+
+    start_time = perf_counter()
+
+    year_of_interest_dir = os.path.join(output_dir, str(input_year))
+    os.makedirs(year_of_interest_dir, exist_ok=True)
+
+    forecasted_data = forecast_year(train_data, input_year, year_of_interest_dir, model_dir, backend=backend, forecast_mode=forecast_mode,
+                                    search=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+
+    plot_forecast(forecasted_data, year_of_interest_dir, input_year)
+    forecasted_data.to_csv(os.path.join(year_of_interest_dir, 'demand_forecast.csv'), index=False)
+    print(f"{nowtime()} Demand forecast for {input_year} saved to {year_of_interest_dir}")
+
+    return {
+        'input_year': input_year,
+        'training_rows': len(train_data),
+        'products': forecasted_data['Product Id'].nunique(),
+        'total_predicted_quantity': forecasted_data['Predicted Quantity'].sum(),
+        'run_time_seconds': perf_counter() - start_time
+    }
+
+def forecast_years(history, years, output_dir, model_dir, workers=None, backend='onehot', forecast_mode='recursive',
+                   search='grid', max_fits=None, max_time=None):
+    """
+    Slice each year's training window out of the shared history and train and forecast the years in parallel worker processes.
+
+    Returns:
+    - DataFrame summarising the run of every year.
+    """
+
+    year_train_data = {year: slice_train_data(history, year) for year in years}
+
+    for year in [year for year, train_data in year_train_data.items() if train_data.empty]:
+        print(f"{nowtime()} No sales data available to forecast {year}, skipping.")
+        del year_train_data[year]
+
+    workers, n_jobs = get_worker_jobs(len(year_train_data), workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(forecast_batch_year, train_data, year, output_dir, model_dir, backend=backend, forecast_mode=forecast_mode,
+                            search=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+            for year, train_data in year_train_data.items()
+        ]
+        summary = pd.DataFrame([future.result() for future in futures])
+
+    print(f"{nowtime()} {len(summary)} years forecasted using {workers} workers.")
+
+    return summary
+
+@click.command()
+@click.argument('output_dir', type=click.Path(exists=True))
+@click.argument('start_year', type=int)
+@click.argument('end_year', type=int)
+@click.argument('model_dir', type=click.Path(exists=True))
+@click.argument('database_path', type=click.Path(exists=True))
+@click.option('--search', type=click.Choice(SEARCH_STRATEGIES), default='grid', help='Hyperparameter search strategy.')
+@click.option('--max-fits', type=int, default=None, help='Maximum number of fits for the non-grid search strategies.')
+@click.option('--max-time', type=float, default=None, help='Wall-clock cap in seconds for the non-grid search strategies.')
+@click.option('--backend', type=click.Choice(['onehot', 'categorical']), default='onehot', help='One-hot products with gradient boosting or categorical products with histogram gradient boosting.')
+@click.option('--forecast-mode', type=click.Choice(FORECAST_MODES), default='recursive', help='Recursive month by month forecasting or direct multi-horizon forecasting.')
+@click.option('--workers', type=int, default=None, help='Number of years forecasted in parallel. Defaults to one per year up to the number of cores.')
+
+def main(output_dir, start_year, end_year, model_dir, database_path, search, max_fits, max_time, backend, forecast_mode, workers):
+
+    # 2015 is the first year of sales data and cannot be forecasted
+    years = list(range(max(start_year, 2016), end_year + 1))
+    if not years:
+        print(f"{nowtime()} No years to forecast between {start_year} and {end_year}.")
+        return
+
+    # Load the history shared by all the years once
+    conn = open_connection(database_path)
+    history = get_history(conn, years)
+    close_connection(conn)
+
+    # Train and forecast the years in parallel
+    summary = forecast_years(history, years, output_dir, model_dir, workers=workers, backend=backend, forecast_mode=forecast_mode,
+                             search=search, max_fits=max_fits, max_time=max_time)
+
+    summary.to_csv(os.path.join(output_dir, f'{start_year}_{end_year}_batch_forecast_summary.csv'), index=False)
+    print(f"{nowtime()} Batch forecast summary saved!")
+
+    return
+
+if __name__ == "__main__":
+    main()
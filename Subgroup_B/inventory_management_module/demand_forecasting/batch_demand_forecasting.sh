@@ -0,0 +1,32 @@
+#!/bin/bash
+
+# Purpose: This script is used to forecast demand for a range of years, loading the shared sales history once
+# batch_start_year=2016
+# batch_end_year=2018
+# log_dir="${output_dir}/log"
+
+# Set up --------------------------------------------------
+batch_log_dir="${output_dir}/log"
+[ ! -d "$batch_log_dir" ] && mkdir -p "$batch_log_dir"
+batch_demand_forecasting_log="${batch_log_dir}/batch_demand_forecasting.log"
+
+# Model options
+search_options=(--backend "$forecast_backend" --forecast-mode "$forecast_mode" --search "$search_strategy")
+[ -n "$search_max_fits" ] && search_options+=(--max-fits "$search_max_fits")
+[ -n "$search_max_time" ] && search_options+=(--max-time "$search_max_time")
+[ -n "$forecast_workers" ] && search_options+=(--workers "$forecast_workers")
+
+## Begin Log
+echo "----- Start Run -----" | tee "$batch_demand_forecasting_log"
+
+# Forecast every year of the range
+python "$batch_demand_forecasting_script" \
+    "$output_dir" \
+    "$batch_start_year" \
+    "$batch_end_year" \
+    "$model_dir" \
+    "$database_path" \
+    "${search_options[@]}" | tee -a "$batch_demand_forecasting_log"
+
+# End Log
+echo "----- End Run -----" | tee -a "$batch_demand_forecasting_log"
@@ -3,10 +3,18 @@ import numpy as np
 import sqlite3
 import os
 import click
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.model_selection import GridSearchCV
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
 import joblib
 import matplotlib.pyplot as plt
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from hyperparameter_search import SEARCH_STRATEGIES, run_search, compare_search_strategies
+import model_registry
+
+MONTH_MAPPING = {month: i+1 for i, month in enumerate(['January', 'February', 'March', 'April', 'May', 'June', 
+                                                      'July', 'August', 'September', 'October', 'November', 'December'])}
+
+FORECAST_MODES = ['recursive', 'direct']
 
 def nowtime():
 
@@ -42,24 +50,65 @@ def close_connection(conn):
 
 ##### MODEL DATA PREPROCESSING FUNCTIONS #####
 
-def get_train_data(input_year, conn):
+# Function to index the order data by month and product so that the training window is read as a range scan
+def create_train_data_index(conn):
+
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_cleaned_order_data_year_month_product
+    ON cleaned_order_data ("Order Year-Month", "Product Id", "Total Quantity Purchased");
+    ''')
+    conn.commit()
+
+    return
+
+# Function to get the first and last Order Year-Month used to train the model for a year
+def get_train_window(input_year):
 
-    if input_year == 2015:
-        print(f"{nowtime()} Unable to forecast for 2015 as this is the first year of sales data.")
-        exit()
     if input_year == 2016 or input_year == "2016":
         start_year_month = "2015-01"
     else:
         start_year_month = f"{input_year-2}-12"
 
+    return start_year_month, f"{input_year-1}-12"
+
+def query_train_data(conn, start_year_month, end_year_month):
+    """
+    Extract the monthly quantity of every product between two Order Year-Months, with the previous month's quantity
+    computed by SQLite. The covering index keeps the extraction proportional to the window rather than the table.
+
+    Returns:
+    - DataFrame with the integer Order Year and Order Month, Product Id, Total Quantity Purchased and
+      Quantity from previous month (empty for the first month of each product), ordered by Product Id and month.
+    """
+
     train_data_query = f'''
-    SELECT "Order Year", "Order Month", "Product Id", SUM("Total Quantity Purchased") AS "Total Quantity Purchased"
-    FROM cleaned_order_data
-    WHERE "Order Year-Month" BETWEEN "{start_year_month}" AND "{input_year-1}-12"
-    GROUP BY "Product Id", "Order Year-Month";
+    WITH monthly_quantities AS (
+        SELECT "Order Year-Month", "Product Id", SUM("Total Quantity Purchased") AS "Total Quantity Purchased"
+        FROM cleaned_order_data
+        WHERE "Order Year-Month" BETWEEN "{start_year_month}" AND "{end_year_month}"
+        GROUP BY "Order Year-Month", "Product Id"
+    )
+    SELECT
+        CAST(SUBSTR("Order Year-Month", 1, 4) AS INTEGER) AS "Order Year",
+        CAST(SUBSTR("Order Year-Month", 6, 2) AS INTEGER) AS "Order Month",
+        "Product Id",
+        "Total Quantity Purchased",
+        LAG("Total Quantity Purchased") OVER (PARTITION BY "Product Id" ORDER BY "Order Year-Month") AS "Quantity from previous month"
+    FROM monthly_quantities
+    ORDER BY "Product Id", "Order Year-Month";
     '''
+    create_train_data_index(conn)
+
+    return query_data(conn, train_data_query)
+
+def get_train_data(input_year, conn):
+
+    if input_year == 2015:
+        print(f"{nowtime()} Unable to forecast for 2015 as this is the first year of sales data.")
+        exit()
+
     try:
-        train_data = query_data(conn, train_data_query)
+        train_data = query_train_data(conn, *get_train_window(input_year))
 
         if train_data.empty:
             print(f"{nowtime()} No sales data available for training model.")
@@ -71,21 +120,56 @@ def get_train_data(input_year, conn):
 
     return train_data
 
-def preprocess_train_data(train_data):
+# Function to cut the training data of one year out of history queried over several years
+def slice_train_data(history, input_year):
+
+    start_year_month, end_year_month = get_train_window(input_year)
+    year_months = history['Order Year'].astype(str) + '-' + history['Order Month'].map('{:02d}'.format)
+
+    train_data = history[year_months.between(start_year_month, end_year_month)].reset_index(drop=True)
+
+    # The first month of each product in the window has no previous month, as when the window is queried on its own
+    train_data.loc[~train_data['Product Id'].duplicated(), 'Quantity from previous month'] = np.nan
+
+    return train_data
+
+# Function to get the integer code of every product in the queried data
+def get_product_codes(queried_train_data):
 
-    # Encode Order Month as numeric and convert to account for cyclic features
-    month_mapping = {month: i+1 for i, month in enumerate(['January', 'February', 'March', 'April', 'May', 'June', 
-                                                        'July', 'August', 'September', 'October', 'November', 'December'])}
-    train_data['Order Month'] = train_data['Order Month'].map(month_mapping)
+    product_codes = pd.Index(np.sort(queried_train_data['Product Id'].unique()), name='Product Id')
 
-    # Ensure that train_data is sorted in order of Product Id and month
-    train_data = train_data.sort_values(['Product Id', 'Order Year', 'Order Month'])
+    return product_codes
 
-    # Get the previous month's quantity for each product
-    train_data['Quantity from previous month'] = train_data.groupby('Product Id')['Total Quantity Purchased'].shift(1)
-    print(f"{nowtime()} Previous month's quantity added.")
+# Function to encode the Product Id for the chosen model backend
+def encode_products(data, backend='onehot', product_codes=None):
+    """
+    Replace the Product Id column with the product features consumed by the model.
+    
+    Parameters:
+    - data: DataFrame containing a Product Id column.
+    - backend: 'onehot' for one boolean column per product, 'categorical' for a single integer coded Product Code column.
+    - product_codes: Index of all product ids, used so that every run produces the same encoding. 
+                     If None, the products present in data are used.
     
-    # Remove rows with NaN values
+    Returns:
+    - DataFrame with the Product Id column replaced.
+    """
+
+    if product_codes is None:
+        product_codes = get_product_codes(data)
+
+    if backend == 'categorical':
+        data['Product Code'] = product_codes.get_indexer(data['Product Id'])
+        data = data.drop('Product Id', axis=1)
+    else:
+        products = pd.Categorical(data['Product Id'], categories=product_codes)
+        data = data.join(pd.get_dummies(products, prefix='Product').set_index(data.index)).drop('Product Id', axis=1)
+
+    return data
+
+def preprocess_train_data(train_data, backend='onehot', product_codes=None):
+
+    # Remove the first month of each product, which has no previous month's quantity
     train_data = train_data.dropna()
 
     # Add in cyclic features for Order Month
@@ -93,10 +177,10 @@ def preprocess_train_data(train_data):
     train_data['Month_cos'] = np.cos(2 * np.pi * train_data['Order Month'] / 12)
     print(f"{nowtime()} Cyclic Features Added.")
 
-    # Sort and one hot encode the data
+    # Sort and encode the products
     train_data = train_data.sort_values(by=['Order Year', 'Order Month', 'Product Id'])
-    train_data = train_data.join(pd.get_dummies(train_data['Product Id'], prefix='Product')).drop('Product Id', axis=1)
-    print(f"{nowtime()} Data sorted and one-hot encoded.")
+    train_data = encode_products(train_data, backend=backend, product_codes=product_codes)
+    print(f"{nowtime()} Data sorted and {backend} encoded.")
 
     X_train = train_data.drop(columns=["Total Quantity Purchased", "Order Year", "Order Month"])
     Y_train = train_data["Total Quantity Purchased"]
@@ -106,140 +190,571 @@ def preprocess_train_data(train_data):
 
 ##### MODEL TRAINING FUNCTIONS #####
 
-# Function to read in the model
-def read_model(model_path):
+# Function to get the default hyperparameter grid
+def get_GB_param_grid():
 
-    model = joblib.load(model_path)
-    print(f"{nowtime()} Model loaded from {model_path}")
+    param_grid = {
+        'n_estimators': [100, 200, 300],                # Number of boosting stages
+        'learning_rate': [0.01, 0.05, 0.1, 0.2],        # Controls the contribution of each tree
+        'max_depth': [3, 5, 7],                     # Controls the depth of each tree
+        'min_samples_split': [2, 5, 10],                # Minimum samples required to split a node
+        'min_samples_leaf': [1, 2, 4],                  # Minimum samples required at a leaf node
+        'subsample': [0.7, 0.85, 1.0],                  # Fraction of samples used for each tree
+        'max_features': ['sqrt', 'log2', None]          # Number of features to consider at each split
+    }
 
-    return model
+    return param_grid
 
 # Function to create the model
-def create_GB_model(X_train, Y_train, param_grid=None):
+def create_GB_model(X_train, Y_train, param_grid=None, search='grid', max_fits=None, max_time=None, n_jobs=-1):
 
     if param_grid is None:
-        param_grid = {
-            'n_estimators': [100, 200, 300],                # Number of boosting stages
-            'learning_rate': [0.01, 0.05, 0.1, 0.2],        # Controls the contribution of each tree
-            'max_depth': [3, 5, 7],                     # Controls the depth of each tree
-            'min_samples_split': [2, 5, 10],                # Minimum samples required to split a node
-            'min_samples_leaf': [1, 2, 4],                  # Minimum samples required at a leaf node
-            'subsample': [0.7, 0.85, 1.0],                  # Fraction of samples used for each tree
-            'max_features': ['sqrt', 'log2', None]          # Number of features to consider at each split
-        }
+        param_grid = get_GB_param_grid()
 
     # Create the model
     model = GradientBoostingRegressor(random_state=42)
     print(f"{nowtime()} Model created. Begin Hyperparameter Tuning...")
 
-    grid_search_gb = GridSearchCV(model, param_grid, cv=5, verbose=2, n_jobs=-1)
-    grid_search_gb.fit(X_train, Y_train)
-    print(f"{nowtime()} Beginning hyperparameter tuning...")
+    best_model, _ = run_search(model, param_grid, X_train, Y_train, strategy=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+
+    return best_model
+
+# Function to get the default hyperparameter grid for the histogram based model
+def get_HGB_param_grid():
+
+    param_grid = {
+        'max_iter': [100, 200, 300],                    # Number of boosting stages
+        'learning_rate': [0.01, 0.05, 0.1, 0.2],        # Controls the contribution of each tree
+        'max_depth': [3, 5, 7],                         # Controls the depth of each tree
+        'max_leaf_nodes': [15, 31, 63],                 # Maximum number of leaves in each tree
+        'min_samples_leaf': [5, 10, 20],                # Minimum samples required at a leaf node
+        'l2_regularization': [0.0, 0.1, 1.0]            # Penalty on the leaf values
+    }
+
+    return param_grid
 
-    # Display best parameters
-    best_model = grid_search_gb.best_estimator_
-    print(f"{nowtime()} Best parameters: {grid_search_gb.best_params_}")
+# Function to create the untuned histogram based model
+def get_HGB_model(X_train):
+
+    # Categorical splits are limited to max_bins categories, larger catalogs fall back to the integer coding
+    if X_train['Product Code'].max() < 255:
+        categorical_features = ['Product Code']
+    else:
+        categorical_features = None
+        print(f"{nowtime()} Too many products for categorical splits, using integer coded products.")
+
+    model = HistGradientBoostingRegressor(categorical_features=categorical_features, early_stopping=False, random_state=42)
+
+    return model
+
+# Function to create the histogram based model with Product Code as a native categorical feature
+def create_HGB_model(X_train, Y_train, param_grid=None, search='grid', max_fits=None, max_time=None, n_jobs=-1):
+
+    if param_grid is None:
+        param_grid = get_HGB_param_grid()
+
+    model = get_HGB_model(X_train)
+    print(f"{nowtime()} Model created. Begin Hyperparameter Tuning...")
+
+    best_model, _ = run_search(model, param_grid, X_train, Y_train, strategy=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
 
     return best_model
 
+# Function to create the model for the chosen backend
+def create_model(X_train, Y_train, backend='onehot', search='grid', max_fits=None, max_time=None, n_jobs=-1):
+
+    if backend == 'categorical':
+        model = create_HGB_model(X_train, Y_train, search=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+    else:
+        model = create_GB_model(X_train, Y_train, search=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+
+    return model
+
+# Function to get the path of the saved model for the chosen backend and forecast mode
+def get_model_path(model_dir, input_year, backend='onehot', forecast_mode='recursive', partition=None):
+
+    model_name = f"{input_year}_demand_forecasting_model"
+
+    if partition is not None:
+        model_name += f"_partition_{partition}"
+    if forecast_mode == 'direct':
+        model_name += "_direct"
+    if backend == 'categorical':
+        model_name += "_categorical"
+
+    return os.path.join(model_dir, f"{model_name}.pkl")
+
+# Function to compare a search strategy against the full grid search
+def create_search_report(X_train, Y_train, output_dir, input_year, search, max_fits=None, max_time=None, backend='onehot'):
+
+    if backend == 'categorical':
+        model, param_grid = get_HGB_model(X_train), get_HGB_param_grid()
+    else:
+        model, param_grid = GradientBoostingRegressor(random_state=42), get_GB_param_grid()
+
+    report = compare_search_strategies(model, param_grid, X_train, Y_train, [search], max_fits=max_fits, max_time=max_time)
+
+    report.to_csv(os.path.join(output_dir, f'{input_year}_search_report.csv'), index=False)
+    print(f"{nowtime()} Search report saved!")
+
+    return report
+
 def evaluate_model(model, X_train, Y_train):
 
     # Get the model score
     score = model.score(X_train, Y_train)
     print(f"{nowtime()} Model Score: {score}")
 
-    return
+    return score
+
+def get_registered_model(model_dir, input_year, train_data, X_train, Y_train, backend='onehot', forecast_mode='recursive',
+                         search='grid', max_fits=None, max_time=None, n_jobs=-1, partition=None):
+    """
+    Get the model for the training data from the model registry. A model trained on the same data and configuration 
+    is reused, a model trained on the same data minus some newly appended months is warm started, 
+    and otherwise a new model is trained. New and warm started models are registered with their metadata.
+    """
+
+    name = os.path.basename(get_model_path(model_dir, input_year, backend=backend, forecast_mode=forecast_mode, partition=partition))[:-len('.pkl')]
+    # The year is left out of the configuration so that next year's model can warm start from this year's
+    config = {
+        'backend': backend,
+        'forecast_mode': forecast_mode,
+        'search': search,
+        'max_fits': max_fits,
+        'max_time': max_time,
+        'param_grid': get_HGB_param_grid() if backend == 'categorical' else get_GB_param_grid()
+    }
+    if partition is not None:
+        config['partition'] = partition
+    config_fingerprint = model_registry.fingerprint_config(config)
+    data_fingerprint, period_fingerprints = model_registry.fingerprint_train_data(train_data)
+    products = get_product_codes(train_data).tolist()
+
+    entries = model_registry.load_registry(model_dir)
+
+    entry = model_registry.find_model(entries, config_fingerprint, data_fingerprint)
+    if entry is not None:
+        print(f"{nowtime()} Training data and configuration unchanged, reusing registered model.")
+        return model_registry.read_registered_model(model_dir, entry)
+
+    start_time = perf_counter()
+    model, warm_started_from = None, None
+
+    base_entry = model_registry.find_warm_start_base(entries, config_fingerprint, period_fingerprints, products)
+    if base_entry is not None:
+        print(f"{nowtime()} Training window continues the window of {base_entry['model_file']}, warm starting...")
+        base_model = model_registry.read_registered_model(model_dir, base_entry)
+        new_share = (~model_registry.get_train_periods(train_data).isin(list(base_entry['period_fingerprints']))).mean()
+        model = model_registry.warm_start_model(base_model, X_train, Y_train, new_share)
+        warm_started_from = base_entry['model_file']
+
+    if model is None:
+        model = create_model(X_train, Y_train, backend=backend, search=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+        warm_started_from = None
+
+    training_time = perf_counter() - start_time
+    score = evaluate_model(model, X_train, Y_train)
+
+    model_registry.register_model(model_dir, model, name, config, config_fingerprint, data_fingerprint, period_fingerprints, products,
+                                  len(X_train), training_time, score, warm_started_from=warm_started_from)
 
-##### DEMAND FORECASTING FUNCTIONS #####
-
-def convert_to_month(month_sin, month_cos):
-
-    angle = np.arctan2(month_sin, month_cos)
-    month = (angle / (2 * np.pi) * 12) % 12
-    month = np.round(month).astype(int)
-    month[month == 0] = 12  # Adjust for 0 to be December
-
-    return month
+    return model
 
-def prepare_forecast_data(queried_train_data, input_year):
+##### DEMAND FORECASTING FUNCTIONS #####
 
-    carried_over_quantities = queried_train_data.groupby('Product Id')['Total Quantity Purchased'].last().reset_index()
+def prepare_forecast_data(queried_train_data, input_year, backend='onehot', product_codes=None):
+    """
+    Build the forecast grid of every product and month of the next year as a Cartesian product of the product keys
+    and the months. January carries over the last observed quantity of each product, the later months start at 0
+    and are filled in by forecast_demand.
 
-    carried_over_quantities["Order Month"] = 1
-    carried_over_quantities["Order Year"] = input_year+1
-    carried_over_quantities.rename(columns={"Total Quantity Purchased": "Quantity from previous month"}, inplace=True)
+    Returns:
+    - DataFrame sorted by Order Month and Product Id with the integer keys and the model features.
+    """
 
-    # Generate new rows for each Product Id for months 2 to 12, setting Quantity from previous month to 0
-    new_rows = []
-    for product_id in carried_over_quantities['Product Id'].unique():
-        for month in range(2, 13):
-            new_rows.append({'Product Id': product_id, 'Quantity from previous month': 0, 'Order Month': month, 'Order Year': 2016})
+    carried_over_quantities = queried_train_data.groupby('Product Id')['Total Quantity Purchased'].last()
+    product_ids = carried_over_quantities.index.to_numpy()
+    n_products = len(product_ids)
 
-    # Append new rows to the original DataFrame
-    forecast_data = pd.concat([carried_over_quantities, pd.DataFrame(new_rows)], ignore_index=True)
+    # Only January has a known previous month's quantity
+    previous_quantities = np.zeros(12 * n_products, dtype=carried_over_quantities.dtype)
+    previous_quantities[:n_products] = carried_over_quantities.to_numpy()
 
-    # Sort the DataFrame for readability
-    forecast_data.sort_values(by=['Order Month', 'Product Id'], inplace=True)
-    forecast_data.reset_index(drop=True, inplace=True)
+    forecast_data = pd.DataFrame({
+        'Product Id': np.tile(product_ids, 12),
+        'Quantity from previous month': previous_quantities,
+        'Order Month': np.repeat(np.arange(1, 13), n_products)
+    })
 
     # Add in cyclic features for Order Month
     forecast_data['Month_sin'] = np.sin(2 * np.pi * forecast_data['Order Month'] / 12)
     forecast_data['Month_cos'] = np.cos(2 * np.pi * forecast_data['Order Month'] / 12)
     print(f"{nowtime()} Cyclic Features Added.")
 
-    # One hot encode the data
-    forecast_data = forecast_data.join(pd.get_dummies(forecast_data['Product Id'], prefix='Product')).drop('Product Id', axis=1)
-    print(f"{nowtime()} Data sorted and one-hot encoded.")
-
-    # Remove columns
-    forecast_data = forecast_data.drop(columns=["Order Year", "Order Month"])
-    print(f"{nowtime()} Training Data preprocessed.")
+    # Encode the products, keeping the integer Product Id as a key
+    product_ids = forecast_data['Product Id']
+    forecast_data = encode_products(forecast_data, backend=backend, product_codes=product_codes)
+    forecast_data['Product Id'] = product_ids
+    print(f"{nowtime()} Forecast grid of {n_products} products built and {backend} encoded.")
 
     return forecast_data
 
+# Function to check that the forecast input has exactly the features the model was trained on, besides its key columns
+def check_forecast_features(model, data, keys=('Order Month', 'Product Id')):
+
+    model_features = model.feature_names_in_.tolist()
+    features = [col for col in data.columns if col not in keys]
+    missing = [col for col in model_features if col not in features]
+    unexpected = [col for col in features if col not in model_features]
+
+    if missing or unexpected:
+        raise ValueError(f"Forecast features do not match the model. Missing: {missing}. Unexpected: {unexpected}.")
+
+    return
+
 # Forecasting for the next year
-def forecast_demand(model, data, tolerance=1e-6):
-    results = pd.DataFrame()
-    previous_month_quantity = [None] * len(data[data['Month_sin'] == np.sin(2 * np.pi * (1 / 12))])
+def forecast_demand(model, data):
+    """
+    Recursively forecast the 12 months of the next year for all products, feeding each month's prediction
+    into the next month's Quantity from previous month.
+    
+    Parameters:
+    - model: Fitted model.
+    - data: Forecast grid from prepare_forecast_data with one row per (Order Month, Product Id) key.
+    
+    Returns:
+    - DataFrame with the Predicted Quantity for each Order Month and Product Id.
+    """
+
+    # Order the grid by month then product so that every month is a contiguous block of rows
+    data = data.sort_values(by=['Order Month', 'Product Id'])
+    product_ids = data.loc[data['Order Month'] == 1, 'Product Id'].to_numpy()
+    n_products = len(product_ids)
+
+    # Build the feature matrix once in the column order the model was trained on
+    check_forecast_features(model, data)
+    features = data[model.feature_names_in_].reset_index(drop=True)
+    previous_month_column = features.columns.get_loc('Quantity from previous month')
+
+    # Preallocated (products x months) array of predictions
+    predictions = np.empty((n_products, 12))
 
     for month in range(1, 13):
-        month_sin = np.sin(2 * np.pi * (month / 12))
-        month_cos = np.cos(2 * np.pi * (month / 12))
+        month_rows = slice((month - 1) * n_products, month * n_products)
 
-        # Filter data for the current month based on cyclical encoding with tolerance
-        current_month_data = data[(np.abs(data['Month_sin'] - month_sin) < tolerance) & 
-                                  (np.abs(data['Month_cos'] - month_cos) < tolerance)].copy()
-        
         if month != 1:
-            current_month_data['Quantity from previous month'] = previous_month_quantity
+            features.iloc[month_rows, previous_month_column] = predictions[:, month - 2]
 
-        prediction = model.predict(current_month_data)
-        prediction = np.round(prediction)
+        predictions[:, month - 1] = np.round(model.predict(features.iloc[month_rows]))
 
-        temp = pd.concat([current_month_data.reset_index(drop=True), pd.Series(prediction, name='Predicted Quantity')], axis=1)
-        previous_month_quantity = prediction
-        results = pd.concat([results, temp], ignore_index=True)
+    results = pd.DataFrame({
+        'Order Month': np.repeat(np.arange(1, 13), n_products),
+        'Product Id': np.tile(product_ids, 12),
+        'Predicted Quantity': predictions.T.ravel()
+    })
 
-    results['Order Month'] = convert_to_month(results['Month_sin'], results['Month_cos'])
+    print(f"{nowtime()} Demand Forecasted.")
 
-    # Find the column names that start with 'Product_'
-    product_columns = [col for col in results.columns if col.startswith('Product_')]
-    
-    # Create the 'Product Id' column by finding the column with True (or 1) for each row
-    results['Product Id'] = results[product_columns].idxmax(axis=1)
-    
-    # Extract the numeric Product Id from the column name (e.g., 'Product_37' -> 37)
-    results['Product Id'] = results['Product Id'].str.extract('(\d+)').astype(float)
+    return results
+
+##### DIRECT MULTI-HORIZON FORECASTING FUNCTIONS #####
+
+def preprocess_direct_train_data(train_data, backend='onehot', product_codes=None, max_horizon=12):
+    """
+    Build the training data for the direct forecasting mode. Every observed (product, month) is paired with the 
+    same product's quantity 1 to max_horizon calendar months later, with the horizon and target month as features,
+    so a single model predicts any month of the next year from the last observed quantity.
     
-    # Drop the one-hot encoded columns
-    results = results.drop(columns=product_columns)
+    Returns:
+    - X_train and Y_train with the columns Quantity at origin, Horizon, Month_sin, Month_cos and the product features.
+    """
+
+    series = train_data[['Product Id', 'Order Year', 'Order Month', 'Total Quantity Purchased']].copy()
+    series['Period'] = series['Order Year'] * 12 + series['Order Month']
+
+    origins = series[['Product Id', 'Period', 'Total Quantity Purchased']].rename(columns={'Total Quantity Purchased': 'Quantity at origin'})
+
+    # Pair every origin with its target horizon months later
+    horizon_data = []
+    for horizon in range(1, max_horizon + 1):
+        targets = series[['Product Id', 'Period', 'Order Month', 'Total Quantity Purchased']].copy()
+        targets['Period'] = targets['Period'] - horizon
+        pairs = origins.merge(targets, on=['Product Id', 'Period'], how='inner')
+        pairs['Horizon'] = horizon
+        horizon_data.append(pairs)
+
+    direct_data = pd.concat(horizon_data, ignore_index=True)
+    print(f"{nowtime()} {len(direct_data)} origin-target pairs built for {max_horizon} horizons.")
+
+    # Add in cyclic features for the target month
+    direct_data['Month_sin'] = np.sin(2 * np.pi * direct_data['Order Month'] / 12)
+    direct_data['Month_cos'] = np.cos(2 * np.pi * direct_data['Order Month'] / 12)
+
+    direct_data = direct_data.sort_values(by=['Period', 'Horizon', 'Product Id'])
+    direct_data = encode_products(direct_data, backend=backend, product_codes=product_codes)
+
+    X_train = direct_data[['Quantity at origin', 'Horizon', 'Month_sin', 'Month_cos'] + [col for col in direct_data.columns if col.startswith('Product')]]
+    Y_train = direct_data['Total Quantity Purchased']
+    print(f"{nowtime()} Direct Training Data preprocessed.")
+
+    return X_train, Y_train
+
+def prepare_direct_forecast_data(queried_train_data, backend='onehot', product_codes=None):
 
-    results = results[['Order Month', 'Product Id', 'Predicted Quantity']]
+    # The last observed quantity of every product is the origin of all 12 horizons
+    carried_over_quantities = queried_train_data.groupby('Product Id')['Total Quantity Purchased'].last()
+    product_ids = carried_over_quantities.index.to_numpy()
+    n_products = len(product_ids)
+
+    forecast_data = pd.DataFrame({
+        'Product Id': np.tile(product_ids, 12),
+        'Order Month': np.repeat(np.arange(1, 13), n_products),
+        'Quantity at origin': np.tile(carried_over_quantities.to_numpy(), 12)
+    })
+    forecast_data['Horizon'] = forecast_data['Order Month']
+    forecast_data['Month_sin'] = np.sin(2 * np.pi * forecast_data['Order Month'] / 12)
+    forecast_data['Month_cos'] = np.cos(2 * np.pi * forecast_data['Order Month'] / 12)
+
+    # Encode the products, keeping the integer Product Id as a key
+    product_ids = forecast_data['Product Id']
+    forecast_data = encode_products(forecast_data, backend=backend, product_codes=product_codes)
+    forecast_data['Product Id'] = product_ids
+    print(f"{nowtime()} Direct forecast data prepared.")
+
+    return forecast_data
+
+# Forecasting all months of the next year in one call
+def forecast_demand_direct(model, data):
+
+    check_forecast_features(model, data)
+    features = data[model.feature_names_in_]
+    predictions = np.round(model.predict(features))
+
+    results = pd.DataFrame({
+        'Order Month': data['Order Month'].to_numpy(),
+        'Product Id': data['Product Id'].to_numpy(),
+        'Predicted Quantity': predictions
+    })
 
     print(f"{nowtime()} Demand Forecasted.")
 
     return results
 
+##### TRAINING AND FORECASTING #####
+
+# Function to build the training data for the chosen forecast mode
+def get_model_train_data(train_data, backend='onehot', forecast_mode='recursive', product_codes=None):
+
+    if forecast_mode == 'direct':
+        return preprocess_direct_train_data(train_data, backend=backend, product_codes=product_codes)
+
+    return preprocess_train_data(train_data, backend=backend, product_codes=product_codes)
+
+# Function to build the forecasting input of the next year for the chosen forecast mode
+def get_forecast_input(train_data, input_year, backend='onehot', forecast_mode='recursive', product_codes=None):
+
+    if forecast_mode == 'direct':
+        return prepare_direct_forecast_data(train_data, backend=backend, product_codes=product_codes)
+
+    return prepare_forecast_data(train_data, input_year, backend=backend, product_codes=product_codes)
+
+# Function to forecast the next year from the forecasting input with the chosen forecast mode
+def predict_demand(model, input_for_forecast, forecast_mode='recursive'):
+
+    if forecast_mode == 'direct':
+        return forecast_demand_direct(model, input_for_forecast)
+
+    return forecast_demand(model, input_for_forecast)
+
+# Function to forecast the next year with the chosen forecast mode
+def run_forecast(model, train_data, input_year, backend='onehot', forecast_mode='recursive', product_codes=None):
+
+    input_for_forecast = get_forecast_input(train_data, input_year, backend=backend, forecast_mode=forecast_mode, product_codes=product_codes)
+
+    return predict_demand(model, input_for_forecast, forecast_mode=forecast_mode)
+
+def forecast_year(train_data, input_year, output_dir, model_dir, backend='onehot', forecast_mode='recursive',
+                  search='grid', max_fits=None, max_time=None, search_report=False, n_jobs=-1):
+
+    # Get the product encoding shared by the training and forecasting data
+    product_codes = get_product_codes(train_data)
+
+    # Preprocess the training data to obtain X_train and Y_train
+    X_train, Y_train = get_model_train_data(train_data, backend=backend, forecast_mode=forecast_mode, product_codes=product_codes)
+
+    # Load the model from the registry, warm starting or training it if the training data changed
+    model = get_registered_model(model_dir, input_year, train_data, X_train, Y_train, backend=backend, forecast_mode=forecast_mode,
+                                 search=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+
+    # Keep the latest model at its usual path
+    model_path = get_model_path(model_dir, input_year, backend=backend, forecast_mode=forecast_mode)
+    joblib.dump(model, model_path)
+    print(f"{nowtime()} Model saved to {model_path}")
+
+    if search_report:
+        create_search_report(X_train, Y_train, output_dir, input_year, search, max_fits=max_fits, max_time=max_time, backend=backend)
+
+    # Forecast the demand
+    return run_forecast(model, train_data, input_year, backend=backend, forecast_mode=forecast_mode, product_codes=product_codes)
+
+##### PARTITIONED FORECASTING FUNCTIONS #####
+
+# Function to share the cores between the worker processes so that the searches inside them do not oversubscribe the node
+def get_worker_jobs(n_tasks, workers=None):
+
+    workers = workers or max(1, min(n_tasks, os.cpu_count()))
+    n_jobs = max(1, os.cpu_count() // workers)
+
+    return workers, n_jobs
+
+PARTITION_METHODS = ['none', 'category', 'hash']
+
+def get_product_partitions(conn, train_data, partition_by='hash', n_partitions=4, min_partition_rows=50):
+    """
+    Assign every product in the training data to a partition, either by its Product Category or by a hash of its Product Id.
+    Partitions with fewer than min_partition_rows training rows are merged together so that every partition can be cross validated.
+    
+    Returns:
+    - Series mapping each Product Id to its partition.
+    """
+
+    product_ids = pd.Series(np.sort(train_data['Product Id'].unique()), name='Product Id')
+
+    if partition_by == 'category':
+        product_category_query = '''
+        SELECT "Product Id", MIN(TRIM("Product Category")) AS "Product Category"
+        FROM cleaned_order_data
+        GROUP BY "Product Id";
+        '''
+        product_categories = query_data(conn, product_category_query).set_index('Product Id')['Product Category']
+        partitions = product_ids.map(product_categories).fillna('Unknown')
+    else:
+        partitions = (product_ids % n_partitions).astype(str)
+
+    partitions.index = product_ids
+
+    # Merge the partitions that are too small to train on
+    partition_rows = train_data['Product Id'].map(partitions).value_counts()
+    small_partitions = partition_rows[partition_rows < min_partition_rows].index
+    partitions[partitions.isin(small_partitions)] = 'Other'
+
+    print(f"{nowtime()} {len(product_ids)} products split into {partitions.nunique()} partitions by {partition_by}.")
+
+    return partitions
+
+# Function to train and forecast a single partition, run inside a worker process
+def forecast_partition(partition, train_data, input_year, model_dir, backend='onehot', forecast_mode='recursive',
+                       search='grid', max_fits=None, max_time=None, n_jobs=1):
+
+    product_codes = get_product_codes(train_data)
+    X_train, Y_train = get_model_train_data(train_data, backend=backend, forecast_mode=forecast_mode, product_codes=product_codes)
+
+    model = get_registered_model(model_dir, input_year, train_data, X_train, Y_train, backend=backend, forecast_mode=forecast_mode,
+                                 search=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs, partition=partition)
+
+    forecasted_data = run_forecast(model, train_data, input_year, backend=backend, forecast_mode=forecast_mode, product_codes=product_codes)
+    print(f"{nowtime()} Partition {partition} forecasted.")
+
+    return forecasted_data
+
+def forecast_partitions(conn, train_data, input_year, model_dir, partition_by='hash', n_partitions=4, workers=None,
+                        backend='onehot', forecast_mode='recursive', search='grid', max_fits=None, max_time=None):
+    """
+    Train and forecast each product partition in its own worker process and merge the forecasts
+    back into the demand_forecast.csv layout.
+    """
+
+    partitions = get_product_partitions(conn, train_data, partition_by=partition_by, n_partitions=n_partitions)
+    partition_labels = train_data['Product Id'].map(partitions)
+
+    workers, n_jobs = get_worker_jobs(partitions.nunique(), workers)
+
+    # Partition names can contain any character, so the models are named by partition number
+    partition_numbers = {label: number for number, label in enumerate(sorted(partitions.unique()))}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(forecast_partition, str(partition_numbers[label]), partition_data.reset_index(drop=True), input_year, model_dir,
+                            backend=backend, forecast_mode=forecast_mode, search=search, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+            for label, partition_data in train_data.groupby(partition_labels)
+        ]
+        forecasted_data = pd.concat([future.result() for future in futures], ignore_index=True)
+
+    forecasted_data = forecasted_data.sort_values(by=['Order Month', 'Product Id']).reset_index(drop=True)
+    print(f"{nowtime()} {len(futures)} partition forecasts merged using {workers} workers.")
+
+    return forecasted_data
+
+##### BACKTESTING FUNCTIONS #####
+
+def get_actual_demand(year, conn):
+
+    actual_demand_query = f'''
+    SELECT "Order Month", "Product Id", SUM("Total Quantity Purchased") AS "Actual Quantity"
+    FROM cleaned_order_data
+    WHERE "Order Year" = {year}
+    GROUP BY "Product Id", "Order Month";
+    '''
+    actual_demand = query_data(conn, actual_demand_query)
+    actual_demand['Order Month'] = actual_demand['Order Month'].map(MONTH_MAPPING)
+
+    return actual_demand
+
+def score_forecast(forecasted_data, actual_demand):
+
+    # Months without sales count as zero demand
+    scored = forecasted_data.merge(actual_demand, on=['Order Month', 'Product Id'], how='left').fillna({'Actual Quantity': 0})
+    errors = scored['Predicted Quantity'] - scored['Actual Quantity']
+
+    return {
+        'MAE': errors.abs().mean(),
+        'RMSE': np.sqrt((errors ** 2).mean()),
+        'WAPE': errors.abs().sum() / max(scored['Actual Quantity'].sum(), 1),
+        'Bias': errors.mean()
+    }
+
+def backtest_forecast_modes(conn, input_year, backend='onehot', search='grid', max_fits=None, max_time=None):
+    """
+    Train both forecast modes on the window before the previous year, forecast the previous year 
+    and compare their accuracy against the actual demand along with their training and forecasting time.
+    """
+
+    backtest_year = input_year - 1
+    if backtest_year <= 2015:
+        print(f"{nowtime()} Unable to backtest {backtest_year} as there is no earlier sales data.")
+        return None
+
+    train_data = get_train_data(backtest_year, conn)
+    actual_demand = get_actual_demand(backtest_year, conn)
+    product_codes = get_product_codes(train_data)
+
+    backtest_results = []
+    for forecast_mode in FORECAST_MODES:
+        print(f"{nowtime()} Backtesting {forecast_mode} forecasting on {backtest_year}...")
+
+        start_time = perf_counter()
+        X_train, Y_train = get_model_train_data(train_data, backend=backend, forecast_mode=forecast_mode, product_codes=product_codes)
+        model = create_model(X_train, Y_train, backend=backend, search=search, max_fits=max_fits, max_time=max_time)
+        train_time = perf_counter() - start_time
+
+        start_time = perf_counter()
+        forecasted_data = run_forecast(model, train_data, backtest_year, backend=backend, forecast_mode=forecast_mode, product_codes=product_codes)
+        forecast_time = perf_counter() - start_time
+
+        backtest_results.append({
+            'forecast_mode': forecast_mode,
+            'backtest_year': backtest_year,
+            **score_forecast(forecasted_data, actual_demand),
+            'train_time_seconds': train_time,
+            'forecast_time_seconds': forecast_time
+        })
+
+    backtest_results = pd.DataFrame(backtest_results)
+    print(f"{nowtime()} Forecast mode backtest:\n{backtest_results}")
+
+    return backtest_results
+
 def plot_forecast(forecasted_data, output_dir, input_year):
 
     forecast = forecasted_data.groupby('Order Month')['Predicted Quantity'].sum().reset_index()
@@ -254,6 +769,7 @@ def plot_forecast(forecasted_data, output_dir, input_year):
     plt.grid(True)
     
     plt.savefig(os.path.join(output_dir, f'{input_year}_demand_forecast.png'))
+    plt.close()
     print(f"{nowtime()} Forecast plot saved!")
 
     return
@@ -263,8 +779,19 @@ def plot_forecast(forecasted_data, output_dir, input_year):
 @click.argument('input_year', type=int)
 @click.argument('model_dir', type=click.Path(exists=True))
 @click.argument('database_path', type=click.Path(exists=True))
-
-def main(output_dir, input_year, model_dir, database_path):
+@click.option('--search', type=click.Choice(SEARCH_STRATEGIES), default='grid', help='Hyperparameter search strategy.')
+@click.option('--max-fits', type=int, default=None, help='Maximum number of fits for the non-grid search strategies.')
+@click.option('--max-time', type=float, default=None, help='Wall-clock cap in seconds for the non-grid search strategies.')
+@click.option('--search-report', is_flag=True, default=False, help='Also run the full grid search and report the comparison.')
+@click.option('--backend', type=click.Choice(['onehot', 'categorical']), default='onehot', help='One-hot products with gradient boosting or categorical products with histogram gradient boosting.')
+@click.option('--forecast-mode', type=click.Choice(FORECAST_MODES), default='recursive', help='Recursive month by month forecasting or direct multi-horizon forecasting.')
+@click.option('--backtest', is_flag=True, default=False, help='Also backtest both forecast modes on the previous year.')
+@click.option('--partition-by', type=click.Choice(PARTITION_METHODS), default='none', help='Train and forecast product partitions in parallel worker processes.')
+@click.option('--partitions', type=int, default=4, help='Number of partitions when partitioning by Product Id hash.')
+@click.option('--workers', type=int, default=None, help='Number of worker processes for partitioned forecasting. Defaults to one per partition up to the number of cores.')
+
+def main(output_dir, input_year, model_dir, database_path, search, max_fits, max_time, search_report, backend, forecast_mode, backtest,
+         partition_by, partitions, workers):
 
     # Connect to the database
     conn = open_connection(database_path)
@@ -272,26 +799,25 @@ def main(output_dir, input_year, model_dir, database_path):
     # Get the training data
     train_data = get_train_data(input_year, conn)
 
-    # Prepare inputs for forecasting
-    input_for_forecast = prepare_forecast_data(train_data, input_year)
+    if partition_by == 'none':
+        # Train or reuse the model and forecast the demand
+        forecasted_data = forecast_year(train_data, input_year, output_dir, model_dir, backend=backend, forecast_mode=forecast_mode,
+                                        search=search, max_fits=max_fits, max_time=max_time, search_report=search_report)
 
-    # Preprocess the training data to obtain X_train and Y_train
-    X_train, Y_train = preprocess_train_data(train_data)
-
-    # Load the model
-    model_path = os.path.join(model_dir, f"{input_year}_demand_forecasting_model.pkl")
-
-    if os.path.exists(model_path):
-        model = read_model(model_path)
     else:
-        # Create the model
-        model = create_GB_model(X_train, Y_train)
-        joblib.dump(model, model_path)
-        print(f"{nowtime()} Model saved to {model_path}")
-        evaluate_model(model, X_train, Y_train)
-
-    # Forecast the demand
-    forecasted_data = forecast_demand(model, input_for_forecast)
+        # Train and forecast every product partition in parallel
+        forecasted_data = forecast_partitions(conn, train_data, input_year, model_dir, partition_by=partition_by, n_partitions=partitions,
+                                              workers=workers, backend=backend, forecast_mode=forecast_mode, search=search,
+                                              max_fits=max_fits, max_time=max_time)
+
+        if search_report:
+            print(f"{nowtime()} Search report is only available without partitioning.")
+
+    if backtest:
+        backtest_results = backtest_forecast_modes(conn, input_year, backend=backend, search=search, max_fits=max_fits, max_time=max_time)
+        if backtest_results is not None:
+            backtest_results.to_csv(os.path.join(output_dir, f'{input_year}_forecast_mode_backtest.csv'), index=False)
+            print(f"{nowtime()} Forecast mode backtest saved!")
 
     # Plot the forecasted data
     plot_forecast(forecasted_data, output_dir, input_year)
@@ -11,6 +11,15 @@
 # Set up --------------------------------------------------
 demand_forecasting_log="${log_dir}/demand_forecasting.log"
 
+# Model options
+search_options=(--backend "$forecast_backend" --forecast-mode "$forecast_mode" --search "$search_strategy")
+[ -n "$search_max_fits" ] && search_options+=(--max-fits "$search_max_fits")
+[ -n "$search_max_time" ] && search_options+=(--max-time "$search_max_time")
+[ "$search_report" = "True" ] && search_options+=(--search-report)
+[ "$forecast_backtest" = "True" ] && search_options+=(--backtest)
+search_options+=(--partition-by "$forecast_partition_by" --partitions "$forecast_partitions")
+[ -n "$forecast_workers" ] && search_options+=(--workers "$forecast_workers")
+
 ## Begin Log
 echo "----- Start Run -----" | tee "$demand_forecasting_log"
 
@@ -19,7 +28,8 @@ python "$demand_forecasting_script" \
     "$year_of_interest_dir" \
     "$input_year" \
     "$model_dir" \
-    "$database_path" | tee -a "$demand_forecasting_log"
+    "$database_path" \
+    "${search_options[@]}" | tee -a "$demand_forecasting_log"
 
 # End Log
 echo "----- End Run -----" | tee -a "$demand_forecasting_log"
\ No newline at end of file
@@ -0,0 +1,256 @@
+import pandas as pd
+import numpy as np
+from time import perf_counter
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.base import clone
+from sklearn.model_selection import GridSearchCV, KFold, ParameterGrid, ParameterSampler
+
+SEARCH_STRATEGIES = ['grid', 'halving', 'random', 'early_stopping']
+
+# Fit budget of the randomized searches when none is given, a fraction of the full grid
+DEFAULT_RANDOM_MAX_FITS = 300
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### CANDIDATE EVALUATION FUNCTIONS #####
+
+# Function to fit a candidate on one fold and score it on the held out rows
+def fit_and_score(model, params, X, Y, train_index, test_index):
+
+    candidate = clone(model).set_params(**params)
+    candidate.fit(X.iloc[train_index], Y.iloc[train_index])
+
+    return candidate.score(X.iloc[test_index], Y.iloc[test_index])
+
+def evaluate_candidates(model, candidates, X, Y, cv=5, max_fits=None, max_time=None, n_jobs=-1, start_time=None):
+    """
+    Cross validate the candidates in parallel batches, stopping once the fit budget or the wall-clock cap is reached.
+    At least one candidate is always evaluated so that a best-so-far model exists.
+
+    Parameters:
+    - model: Unfitted estimator used as the template for every candidate.
+    - candidates: List of parameter dictionaries to evaluate in order.
+    - cv: Number of folds.
+    - max_fits: Maximum number of fits (candidates x folds). None for no limit.
+    - max_time: Wall-clock cap in seconds, measured from start_time. None for no limit.
+
+    Returns:
+    - DataFrame with the mean cross validation score of each evaluated candidate, and the number of fits used.
+    """
+
+    if start_time is None:
+        start_time = perf_counter()
+
+    folds = list(KFold(n_splits=cv).split(X))
+    batch_size = max(1, effective_n_jobs(n_jobs) // cv)
+
+    results = []
+    fits = 0
+
+    for batch_start in range(0, len(candidates), batch_size):
+
+        if results:
+            if max_time is not None and perf_counter() - start_time >= max_time:
+                print(f"{nowtime()} Wall-clock cap reached after {len(results)} candidates.")
+                break
+            if max_fits is not None and fits + cv > max_fits:
+                print(f"{nowtime()} Fit budget reached after {len(results)} candidates.")
+                break
+
+        batch = candidates[batch_start:batch_start + batch_size]
+        if max_fits is not None and results:
+            batch = batch[:max(1, (max_fits - fits) // cv)]
+
+        scores = Parallel(n_jobs=n_jobs)(
+            delayed(fit_and_score)(model, params, X, Y, train_index, test_index)
+            for params in batch for train_index, test_index in folds
+        )
+        scores = np.array(scores).reshape(len(batch), cv)
+        fits += scores.size
+
+        for params, candidate_scores in zip(batch, scores):
+            results.append({'params': params, 'mean_score': candidate_scores.mean()})
+
+    return pd.DataFrame(results), fits
+
+##### SEARCH STRATEGIES #####
+
+def grid_search(model, param_grid, X, Y, cv=5, n_jobs=-1):
+
+    grid_search_model = GridSearchCV(model, param_grid, cv=cv, verbose=2, n_jobs=n_jobs)
+    grid_search_model.fit(X, Y)
+
+    fits = len(ParameterGrid(param_grid)) * cv
+
+    return grid_search_model.best_params_, grid_search_model.best_score_, fits
+
+def random_search(model, param_grid, X, Y, cv=5, max_fits=None, max_time=None, random_state=42, n_jobs=-1):
+
+    # Without a budget the search would fit the whole grid in a shuffled order
+    if max_fits is None:
+        max_fits = DEFAULT_RANDOM_MAX_FITS
+
+    n_candidates = min(len(ParameterGrid(param_grid)), max(1, max_fits // cv))
+
+    candidates = list(ParameterSampler(param_grid, n_iter=n_candidates, random_state=random_state))
+    results, fits = evaluate_candidates(model, candidates, X, Y, cv=cv, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+
+    best = results.loc[results['mean_score'].idxmax()]
+
+    return best['params'], best['mean_score'], fits
+
+def successive_halving_search(model, param_grid, X, Y, cv=5, max_fits=None, max_time=None, factor=3, random_state=42, n_jobs=-1):
+    """
+    Successive halving with the number of training rows as the resource. Every round keeps the best 1/factor
+    of the candidates and trains them on factor times more rows, the final round using all rows.
+    When a cap is hit, the best candidate of the last round that was evaluated is kept.
+    """
+
+    start_time = perf_counter()
+
+    # Number of rounds so that the first round still has enough rows for every fold
+    min_rows = min(len(X), max(cv * 20, 100))
+    n_rounds = int(np.floor(np.log(len(X) / min_rows) / np.log(factor))) + 1
+
+    n_candidates = min(len(ParameterGrid(param_grid)), factor ** n_rounds)
+    if max_fits is not None:
+        # Spread the fit budget over the rounds instead of spending it all on the first one
+        n_candidates = min(n_candidates, max(1, max_fits // (cv * n_rounds)))
+    candidates = list(ParameterSampler(param_grid, n_iter=n_candidates, random_state=random_state))
+
+    # Shuffle the rows once so that every subsample keeps a mix of products and months
+    row_order = np.random.default_rng(random_state).permutation(len(X))
+
+    best_params, best_score = candidates[0], -np.inf
+    fits = 0
+
+    for round_number in range(n_rounds):
+
+        n_rows = len(X) if round_number == n_rounds - 1 else min_rows * factor ** round_number
+        rows = np.sort(row_order[:n_rows])
+
+        remaining_fits = None if max_fits is None else max_fits - fits
+        if remaining_fits is not None and remaining_fits < cv and round_number > 0:
+            print(f"{nowtime()} Fit budget reached, keeping best candidate so far.")
+            break
+
+        results, round_fits = evaluate_candidates(model, candidates, X.iloc[rows], Y.iloc[rows], cv=cv,
+                                                  max_fits=remaining_fits, max_time=max_time, n_jobs=n_jobs, start_time=start_time)
+        fits += round_fits
+
+        results = results.sort_values('mean_score', ascending=False)
+        best_params, best_score = results.iloc[0]['params'], results.iloc[0]['mean_score']
+        print(f"{nowtime()} Halving round {round_number + 1}: {len(results)} candidates on {n_rows} rows, best score {best_score:.4f}")
+
+        if max_time is not None and perf_counter() - start_time >= max_time:
+            print(f"{nowtime()} Wall-clock cap reached, keeping best candidate so far.")
+            break
+
+        candidates = list(results['params'].iloc[:max(1, len(results) // factor)])
+
+    return best_params, best_score, fits
+
+def early_stopping_search(model, param_grid, X, Y, cv=5, max_fits=None, max_time=None, random_state=42, n_jobs=-1):
+    """
+    Randomized search where every candidate stops adding trees once the validation score stops improving,
+    so the n_estimators values of the grid act as upper bounds instead of fixed sizes.
+    """
+
+    if 'early_stopping' in model.get_params():
+        model = clone(model).set_params(early_stopping=True, n_iter_no_change=10, validation_fraction=0.1)
+    else:
+        model = clone(model).set_params(n_iter_no_change=10, validation_fraction=0.1)
+
+    # Only the largest number of estimators is needed, early stopping finds the right size
+    param_grid = dict(param_grid)
+    for resource in ['n_estimators', 'max_iter']:
+        if resource in param_grid:
+            param_grid[resource] = [max(param_grid[resource])]
+
+    best_params, best_score, fits = random_search(model, param_grid, X, Y, cv=cv, max_fits=max_fits,
+                                                  max_time=max_time, random_state=random_state, n_jobs=n_jobs)
+    best_params = {**best_params, **{key: model.get_params()[key] for key in ['n_iter_no_change', 'validation_fraction']}}
+    if 'early_stopping' in model.get_params():
+        best_params['early_stopping'] = True
+
+    return best_params, best_score, fits
+
+def run_search(model, param_grid, X, Y, strategy='grid', cv=5, max_fits=None, max_time=None, n_jobs=-1):
+    """
+    Tune the model with the chosen search strategy and refit the best candidate on all rows.
+
+    Parameters:
+    - model: Unfitted estimator.
+    - param_grid: Dictionary of hyperparameter values to search over.
+    - strategy: One of 'grid', 'halving', 'random' or 'early_stopping'. 'grid' is exhaustive and ignores the caps.
+    - max_fits: Maximum number of fits (candidates x folds) for the other strategies. The randomized searches default
+                to DEFAULT_RANDOM_MAX_FITS.
+    - max_time: Wall-clock cap in seconds for the other strategies.
+    - n_jobs: Number of parallel fits.
+
+    Returns:
+    - Fitted best model and a dictionary summarising the search.
+    """
+
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unknown search strategy '{strategy}'. Choose from {SEARCH_STRATEGIES}.")
+
+    print(f"{nowtime()} Beginning {strategy} hyperparameter search...")
+    start_time = perf_counter()
+
+    if strategy == 'grid':
+        best_params, best_score, fits = grid_search(model, param_grid, X, Y, cv=cv, n_jobs=n_jobs)
+    elif strategy == 'halving':
+        best_params, best_score, fits = successive_halving_search(model, param_grid, X, Y, cv=cv, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+    elif strategy == 'random':
+        best_params, best_score, fits = random_search(model, param_grid, X, Y, cv=cv, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+    else:
+        best_params, best_score, fits = early_stopping_search(model, param_grid, X, Y, cv=cv, max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+
+    search_time = perf_counter() - start_time
+
+    # Refit the best candidate on all the training data
+    best_model = clone(model).set_params(**best_params)
+    best_model.fit(X, Y)
+
+    summary = {
+        'strategy': strategy,
+        'best_params': best_params,
+        'cv_score': best_score,
+        'fits': fits,
+        'search_time_seconds': search_time,
+        'total_time_seconds': perf_counter() - start_time
+    }
+
+    print(f"{nowtime()} Best parameters: {best_params}")
+    print(f"{nowtime()} {strategy} search used {fits} fits in {search_time:.1f}s (cv score {best_score:.4f}).")
+
+    return best_model, summary
+
+##### SEARCH REPORT #####
+
+def compare_search_strategies(model, param_grid, X, Y, strategies, cv=5, max_fits=None, max_time=None):
+    """
+    Run each strategy and the full grid on the same data and report their scores and times side by side.
+    """
+
+    if 'grid' not in strategies:
+        strategies = list(strategies) + ['grid']
+
+    summaries = []
+    for strategy in strategies:
+        _, summary = run_search(model, param_grid, X, Y, strategy=strategy, cv=cv, max_fits=max_fits, max_time=max_time)
+        summaries.append(summary)
+
+    report = pd.DataFrame(summaries)
+    grid_row = report[report['strategy'] == 'grid'].iloc[0]
+    report['score_vs_grid'] = report['cv_score'] - grid_row['cv_score']
+    report['speedup_vs_grid'] = grid_row['total_time_seconds'] / report['total_time_seconds']
+
+    print(f"{nowtime()} Search strategy comparison:\n{report[['strategy', 'cv_score', 'fits', 'total_time_seconds', 'score_vs_grid', 'speedup_vs_grid']]}")
+
+    return report
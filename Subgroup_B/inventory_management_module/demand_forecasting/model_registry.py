@@ -0,0 +1,208 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import joblib
+import fcntl
+from contextlib import contextmanager
+
+REGISTRY_FILE = 'model_registry.json'
+
+# Size past which a model is retrained from scratch instead of being warm started again, every yearly warm start
+# adding about as many trees as the model was searched with
+MAX_WARM_START_ESTIMATORS = 1000
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### FINGERPRINT FUNCTIONS #####
+
+# Function to fingerprint the rows of a DataFrame
+def fingerprint_frame(df):
+
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+# Function to get the zero padded Order Year-Month of every row, so that the periods sort chronologically
+def get_train_periods(train_data):
+
+    months = train_data['Order Month']
+    if not pd.api.types.is_numeric_dtype(months):
+        months = pd.to_datetime(months, format='%B').dt.month
+
+    return train_data['Order Year'].astype(str) + '-' + months.map('{:02d}'.format)
+
+# Function to fingerprint the training query result, overall and per month
+def fingerprint_train_data(train_data):
+    """
+    Fingerprint the queried training data independently of the row order. The Quantity from previous month is left
+    out of the month fingerprints: it repeats the previous month's quantity and is cut at the start of every training
+    window, so leaving it out lets the months shared by two windows match.
+
+    Returns:
+    - Fingerprint of the whole training data and a dictionary of fingerprints per Order Year-Month.
+    """
+
+    periods = get_train_periods(train_data)
+
+    order = np.lexsort((train_data['Product Id'].to_numpy(), periods.to_numpy()))
+    train_data, periods = train_data.iloc[order].reset_index(drop=True), periods.iloc[order].reset_index(drop=True)
+
+    period_data = train_data.drop(columns='Quantity from previous month', errors='ignore')
+    period_fingerprints = {period: fingerprint_frame(rows) for period, rows in period_data.groupby(periods, sort=False)}
+
+    return fingerprint_frame(train_data), period_fingerprints
+
+# Function to fingerprint the model configuration
+def fingerprint_config(config):
+
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+##### REGISTRY FUNCTIONS #####
+
+# Lock the registry so that parallel workers do not overwrite each other's entries
+@contextmanager
+def registry_lock(model_dir):
+
+    with open(os.path.join(model_dir, REGISTRY_FILE + '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load_registry(model_dir):
+
+    registry_path = os.path.join(model_dir, REGISTRY_FILE)
+
+    if not os.path.exists(registry_path):
+        return []
+
+    with open(registry_path) as f:
+        return json.load(f)
+
+def save_registry(model_dir, entries):
+
+    registry_path = os.path.join(model_dir, REGISTRY_FILE)
+
+    # Write to a temporary file first so that an interrupted run never leaves a corrupt registry
+    with open(registry_path + '.tmp', 'w') as f:
+        json.dump(entries, f, indent=2, default=str)
+    os.replace(registry_path + '.tmp', registry_path)
+
+    return
+
+# Function to find a model trained on exactly the same data and configuration
+def find_model(entries, config_fingerprint, data_fingerprint):
+
+    for entry in reversed(entries):
+        if entry['config_fingerprint'] == config_fingerprint and entry['data_fingerprint'] == data_fingerprint:
+            return entry
+
+    return None
+
+def find_warm_start_base(entries, config_fingerprint, period_fingerprints, products):
+    """
+    Find a model whose training window the new training window continues: the months both windows share are
+    unchanged, the new months all come after the old window and the old months left out all come before the new
+    window. This covers months appended to a window as well as the window sliding on to the next year.
+    """
+
+    for entry in reversed(entries):
+        # The product encoding has to be unchanged for the existing trees to stay valid
+        if entry['config_fingerprint'] != config_fingerprint or entry['products'] != products:
+            continue
+
+        old_periods = entry['period_fingerprints']
+        shared_periods = [period for period in period_fingerprints if period in old_periods]
+        new_periods = [period for period in period_fingerprints if period not in old_periods]
+        dropped_periods = [period for period in old_periods if period not in period_fingerprints]
+
+        unchanged = shared_periods and all(period_fingerprints[period] == old_periods[period] for period in shared_periods)
+        appended = new_periods and min(new_periods) > max(old_periods)
+        slid = all(period < min(period_fingerprints) for period in dropped_periods)
+
+        if unchanged and appended and slid:
+            return entry
+
+    return None
+
+def read_registered_model(model_dir, entry):
+
+    model = joblib.load(os.path.join(model_dir, entry['model_file']))
+    print(f"{nowtime()} Registered model {entry['model_file']} loaded (trained {entry['trained_at']}, score {entry['score']}).")
+
+    return model
+
+def register_model(model_dir, model, name, config, config_fingerprint, data_fingerprint, period_fingerprints, products,
+                   n_rows, training_time, score, warm_started_from=None):
+
+    model_file = f"{name}_{data_fingerprint[:12]}_{config_fingerprint[:12]}.pkl"
+    joblib.dump(model, os.path.join(model_dir, model_file))
+
+    entry = {
+        'name': name,
+        'model_file': model_file,
+        'config': config,
+        'config_fingerprint': config_fingerprint,
+        'data_fingerprint': data_fingerprint,
+        'period_fingerprints': period_fingerprints,
+        'products': products,
+        'rows': n_rows,
+        'trained_at': pd.Timestamp('now').isoformat(timespec='seconds'),
+        'training_time_seconds': training_time,
+        'score': score,
+        'warm_started_from': warm_started_from
+    }
+
+    # The new model supersedes the models of the same name and configuration trained on older data
+    with registry_lock(model_dir):
+        entries = load_registry(model_dir)
+        superseded = [old for old in entries if old['name'] == name and old['config_fingerprint'] == config_fingerprint]
+        entries = [old for old in entries if old not in superseded] + [entry]
+        save_registry(model_dir, entries)
+
+    for old in superseded:
+        old_path = os.path.join(model_dir, old['model_file'])
+        if old['model_file'] != model_file and os.path.exists(old_path):
+            os.remove(old_path)
+
+    print(f"{nowtime()} Model registered as {model_file}, {len(superseded)} superseded models removed.")
+
+    return entry
+
+##### INCREMENTAL TRAINING FUNCTIONS #####
+
+def warm_start_model(model, X_train, Y_train, new_share):
+    """
+    Continue boosting a fitted model on the new training data, adding trees in proportion to the share of the
+    rows that belong to months the model was not trained on, instead of refitting from scratch.
+
+    Returns:
+    - The updated model, or None if the model cannot be warm started on this data.
+    """
+
+    if list(getattr(model, 'feature_names_in_', [])) != list(X_train.columns):
+        print(f"{nowtime()} Feature layout changed, unable to warm start.")
+        return None
+
+    n_estimators_param = 'max_iter' if 'max_iter' in model.get_params() else 'n_estimators'
+    n_estimators = model.get_params()[n_estimators_param]
+
+    added_estimators = max(10, int(np.ceil(n_estimators * new_share)))
+    if n_estimators + added_estimators > MAX_WARM_START_ESTIMATORS:
+        print(f"{nowtime()} Model would grow past {MAX_WARM_START_ESTIMATORS} estimators, unable to warm start.")
+        return None
+
+    model.set_params(warm_start=True, **{n_estimators_param: n_estimators + added_estimators})
+    model.fit(X_train, Y_train)
+    model.set_params(warm_start=False)
+
+    print(f"{nowtime()} Model warm started with {added_estimators} additional estimators.")
+
+    return model
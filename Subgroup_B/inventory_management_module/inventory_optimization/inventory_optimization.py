@@ -3,6 +3,9 @@ import numpy as np
 import sqlite3
 import os
 import click
+from stock_snapshot import update_stock_snapshot, get_stock_snapshot_query
+from safety_stock import get_history_demand_stats, get_warehouse_shares, get_forecast_demand_stats, calculate_safety_stock
+from inventory_simulation import get_forecast_daily_demand, get_historical_daily_demand, simulate_policies, sample_demand_path, optimize_policies
 
 def nowtime():
 
@@ -91,7 +94,7 @@ def process_stock(stock_data, product_info):
     stock_data["Date"] = pd.to_datetime(stock_data["Date"])
 
     # Drop columns
-    stock_data = stock_data.drop(['Total Sold', 'Date'], axis=1)
+    stock_data = stock_data.drop(['Date'], axis=1)
 
     print(f"{nowtime()} Stock data processed.")
 
@@ -99,20 +102,44 @@ def process_stock(stock_data, product_info):
 
 def get_starting_stock(input_year, conn, product_info):
     """
-    Get the starting stock for each product at the beginning of the year.
+    Get the starting stock for each product at the beginning of the year from the month-start stock snapshot.
     """
 
     starting_date = f'{input_year}-01-01'
-    
-    stock_query = f'''SELECT * FROM stock_data WHERE "Date" = "{starting_date}"'''
+
+    # Bring the snapshot up to date with stock_data
+    update_stock_snapshot(conn)
 
     # Query the stock data
-    stock_data = query_data(conn, stock_query)
+    stock_data = query_data(conn, get_stock_snapshot_query(starting_date))
 
     stock_data = process_stock(stock_data, product_info)
 
     return stock_data
 
+def get_historical_sales(year, conn):
+    """
+    Get the daily quantity sold of every product over a year.
+    """
+
+    sales_query = f'''SELECT "Product Name", "Date", "Total Sold" FROM stock_data WHERE "Date" BETWEEN "{year}-01-01" AND "{year}-12-31"'''
+
+    return query_data(conn, sales_query)
+
+def get_monthly_warehouse_demand(year, conn):
+    """
+    Get the quantity ordered of every product from each warehouse in every month of a year.
+    """
+
+    warehouse_demand_query = f'''
+    SELECT "Product Id", "Warehouse Id", "Order Year-Month", SUM("Total Quantity Purchased") AS "Total Quantity Purchased"
+    FROM cleaned_order_data
+    WHERE "Order Year-Month" BETWEEN '{year}-01' AND '{year}-12'
+    GROUP BY "Product Id", "Warehouse Id", "Order Year-Month";
+    '''
+
+    return query_data(conn, warehouse_demand_query)
+
 def identify_understocked_products(stock_data, forecasted_data):
 
     # Merge stock data and forecasted data
@@ -139,8 +166,17 @@ def identify_understocked_products(stock_data, forecasted_data):
 @click.argument('database_path', type=click.Path())
 @click.argument('product_info_query', type=str)
 @click.argument('input_year', type=int)
-
-def main(output_dir, database_path, product_info_query, input_year):
+@click.option('--simulation-demand', type=click.Choice(['none', 'forecast', 'historical']), default='none',
+              help="Simulate the EOQ and ROP policies over the year against the forecast or against last year's daily sales.")
+@click.option('--optimize-policy', is_flag=True, default=False, help='Search the cost minimising reorder point and order quantity of every product.')
+@click.option('--service-level', type=float, default=0.95, help='Minimum fill rate of the searched policies.')
+@click.option('--workers', type=int, default=None, help='Number of worker processes for the policy search. Defaults to the number of cores.')
+@click.option('--safety-stock-demand', type=click.Choice(['none', 'forecast', 'history']), default='none',
+              help="Calculate the safety stock of every product and warehouse from the variability of the forecast or of last year's orders.")
+@click.option('--cycle-service-level', type=float, default=0.95, help='Probability of not running out of stock during a lead time, used for the safety stock.')
+
+def main(output_dir, database_path, product_info_query, input_year, simulation_demand, optimize_policy, service_level, workers,
+         safety_stock_demand, cycle_service_level):
 
     # Connect to the database
     conn = open_connection(database_path)
@@ -149,10 +185,10 @@ def main(output_dir, database_path, product_info_query, input_year):
     product_info = query_data(conn, product_info_query)
 
     # Load the forecasted data
-    forecasted_data = pd.read_csv(os.path.join(output_dir, "demand_forecast.csv"))
+    monthly_forecast = pd.read_csv(os.path.join(output_dir, "demand_forecast.csv"))
 
     # Preprocess the forecasted data
-    forecasted_data = preprocess_forecasted_data(forecasted_data)
+    forecasted_data = preprocess_forecasted_data(monthly_forecast)
 
     # Calculate EOQ and ROP
     forecasted_data = calculate_EOQ_ROP(forecasted_data, product_info)
@@ -163,6 +199,35 @@ def main(output_dir, database_path, product_info_query, input_year):
     # Identify understocked products
     inventory_data, understocked_products = identify_understocked_products(stock_data, forecasted_data)
 
+    # Simulate the policies over the year
+    if simulation_demand == 'historical':
+        # Replay the daily sales of the last complete year against this year's policies
+        daily_demand = get_historical_daily_demand(get_historical_sales(input_year - 1, conn), inventory_data['Product Name'], input_year - 1)
+    elif simulation_demand == 'forecast' or optimize_policy:
+        daily_demand = get_forecast_daily_demand(monthly_forecast, inventory_data['Product Id'], input_year)
+
+    if simulation_demand != 'none':
+        simulation_results = simulate_policies(inventory_data, daily_demand)
+        simulation_results.to_csv(os.path.join(output_dir, 'product_policy_simulation.csv'), index=False)
+
+    # Search the best policies on a demand path with day to day variability around the forecast
+    if optimize_policy:
+        demand_path = daily_demand if simulation_demand == 'historical' else sample_demand_path(daily_demand)
+        policy_results = optimize_policies(inventory_data, demand_path, service_level=service_level, workers=workers)
+        policy_results.to_csv(os.path.join(output_dir, 'product_optimal_policy.csv'), index=False)
+
+    # Calculate the safety stock of every product and warehouse
+    if safety_stock_demand != 'none':
+        monthly_demand = get_monthly_warehouse_demand(input_year - 1, conn)
+
+        if safety_stock_demand == 'history':
+            demand_stats = get_history_demand_stats(monthly_demand)
+        else:
+            demand_stats = get_forecast_demand_stats(monthly_forecast, get_warehouse_shares(monthly_demand, product_info))
+
+        safety_stock = calculate_safety_stock(demand_stats, product_info, service_level=cycle_service_level)
+        safety_stock.to_csv(os.path.join(output_dir, 'product_warehouse_safety_stock.csv'), index=False)
+
     # Close the connection
     close_connection(conn)
 
@@ -9,6 +9,12 @@ product_info_query='
 # Set up --------------------------------------------------
 inventory_optimization_log="${log_dir}/inventory_optimization.log"
 
+# Policy options
+policy_options=(--simulation-demand "$inventory_simulation_demand")
+[ "$policy_optimization" = "True" ] && policy_options+=(--optimize-policy --service-level "$policy_service_level")
+[ -n "$policy_workers" ] && policy_options+=(--workers "$policy_workers")
+policy_options+=(--safety-stock-demand "$safety_stock_demand" --cycle-service-level "$cycle_service_level")
+
 ## Begin Log
 echo "----- Start Run -----" | tee "$inventory_optimization_log"
 
@@ -17,7 +23,8 @@ python "$inventory_optimization_script" \
     "$year_of_interest_dir" \
     "$database_path" \
     "$product_info_query" \
-    "$input_year" | tee -a "$inventory_optimization_log"
+    "$input_year" \
+    "${policy_options[@]}" | tee -a "$inventory_optimization_log"
 
 # End Log
 echo "----- End Run -----" | tee -a "$inventory_optimization_log"
\ No newline at end of file
@@ -0,0 +1,293 @@
+import pandas as pd
+import numpy as np
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# The worker pools of the policy search and of the demand forecasting are sized by the same helper
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'demand_forecasting'))
+from demand_forecasting_model import get_worker_jobs
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### DAILY DEMAND FUNCTIONS #####
+
+def get_forecast_daily_demand(forecasted_data, product_ids, input_year):
+    """
+    Spread the monthly forecast of every product evenly over the days of each month.
+
+    Parameters:
+    - forecasted_data: Monthly forecast with the columns Order Month, Product Id and Predicted Quantity.
+    - product_ids: Product Ids in the order of the rows of the demand matrix.
+    - input_year: Year of the forecast, used for the number of days in each month.
+
+    Returns:
+    - Array of shape (products, days) with the daily demand of every product.
+    """
+
+    days = pd.date_range(f'{input_year}-01-01', f'{input_year}-12-31')
+
+    monthly_demand = forecasted_data.pivot_table(index='Product Id', columns='Order Month', values='Predicted Quantity', aggfunc='sum')
+    monthly_demand = monthly_demand.reindex(index=product_ids, columns=range(1, 13)).fillna(0).to_numpy(dtype=float)
+
+    return monthly_demand[:, days.month - 1] / days.days_in_month.to_numpy()
+
+def get_historical_daily_demand(sales_data, product_names, year):
+    """
+    Arrange the daily quantities sold of every product into a demand matrix, counting days without sales as zero demand.
+
+    Parameters:
+    - sales_data: Daily sales with the columns Product Name, Date and Total Sold.
+    - product_names: Product Names in the order of the rows of the demand matrix.
+    - year: Year of the sales.
+
+    Returns:
+    - Array of shape (products, days) with the daily demand of every product.
+    """
+
+    days = pd.date_range(f'{year}-01-01', f'{year}-12-31')
+
+    daily_demand = sales_data.assign(Date=pd.to_datetime(sales_data['Date'])).pivot_table(index='Product Name', columns='Date', values='Total Sold', aggfunc='sum')
+    daily_demand = daily_demand.reindex(index=product_names, columns=days).fillna(0)
+
+    return daily_demand.to_numpy(dtype=float)
+
+##### SIMULATION FUNCTIONS #####
+
+def simulate_inventory(daily_demand, starting_stock, reorder_point, order_quantity, lead_time, daily_storage_cost, demand_index=None):
+    """
+    Simulate a continuous review (ROP, Q) inventory policy for every row at once, one day at a time.
+    Each day, orders due that day arrive, demand is served from the stock on hand (unmet demand is lost), holding cost
+    is charged on the stock left at the end of the day, and an order of the order quantity is placed if the stock on hand
+    plus the stock on order is at or below the reorder point. Orders arrive after the lead time, at least one day later.
+
+    Parameters:
+    - daily_demand: Array of shape (rows, days), or (paths, days) when demand_index is given.
+    - starting_stock, reorder_point, order_quantity, lead_time, daily_storage_cost: Arrays with one value per row.
+    - demand_index: Optional row of daily_demand used by each row, so that many policies can share a demand path without copying it.
+
+    Returns:
+    - Dictionary of arrays with the Stockout Days, Unmet Demand, Fill Rate, Holding Cost, Orders and Ending Stock of every row.
+    """
+
+    if demand_index is None:
+        demand_index = np.arange(len(daily_demand))
+
+    n_rows, n_days = len(demand_index), daily_demand.shape[1]
+    rows = np.arange(n_rows)
+
+    reorder_point = np.asarray(reorder_point, dtype=float)
+    order_quantity = np.asarray(order_quantity, dtype=float)
+    daily_storage_cost = np.asarray(daily_storage_cost, dtype=float)
+    lead_time = np.maximum(np.asarray(lead_time, dtype=int), 1)
+
+    # Ring buffer of the quantities arriving on each of the next days
+    pipeline_length = lead_time.max() + 1
+    pipeline = np.zeros((n_rows, pipeline_length))
+
+    on_hand = np.asarray(starting_stock, dtype=float).copy()
+    on_order = np.zeros(n_rows)
+    stockout_days = np.zeros(n_rows, dtype=int)
+    unmet_demand = np.zeros(n_rows)
+    holding_cost = np.zeros(n_rows)
+    orders = np.zeros(n_rows, dtype=int)
+
+    for day in range(n_days):
+
+        # Receive the orders due today
+        slot = day % pipeline_length
+        on_hand += pipeline[:, slot]
+        on_order -= pipeline[:, slot]
+        pipeline[:, slot] = 0
+
+        # Serve the demand, losing what cannot be served
+        demand = daily_demand[demand_index, day]
+        shortfall = np.maximum(demand - on_hand, 0)
+        stockout_days += shortfall > 0
+        unmet_demand += shortfall
+        on_hand = np.maximum(on_hand - demand, 0)
+
+        holding_cost += on_hand * daily_storage_cost
+
+        # Reorder when the inventory position falls to the reorder point
+        reorder = (on_hand + on_order <= reorder_point) & (order_quantity > 0)
+        pipeline[rows[reorder], (day + lead_time[reorder]) % pipeline_length] += order_quantity[reorder]
+        on_order[reorder] += order_quantity[reorder]
+        orders += reorder
+
+    total_demand = daily_demand.sum(axis=1)[demand_index]
+    fill_rate = np.where(total_demand > 0, 1 - unmet_demand / np.where(total_demand > 0, total_demand, 1), 1.0)
+
+    return {
+        'Stockout Days': stockout_days,
+        'Unmet Demand': unmet_demand,
+        'Fill Rate': fill_rate,
+        'Holding Cost': holding_cost,
+        'Orders': orders,
+        'Ending Stock': on_hand
+    }
+
+def simulate_policies(inventory_data, daily_demand):
+    """
+    Simulate the EOQ and ROP policy of every product over the year from its current stock.
+
+    Parameters:
+    - inventory_data: One row per product with the Current Stock, Reorder Point, Economic Order Quantity,
+      Manufacturing Time and Daily Storage Cost columns.
+    - daily_demand: Array of shape (products, days) in the order of the rows of inventory_data.
+
+    Returns:
+    - DataFrame with the simulated stockouts, costs and orders of every product.
+    """
+
+    results = simulate_inventory(
+        daily_demand,
+        starting_stock=inventory_data['Current Stock'].to_numpy(),
+        reorder_point=inventory_data['Reorder Point'].to_numpy(),
+        order_quantity=inventory_data['Economic Order Quantity'].to_numpy(),
+        lead_time=inventory_data['Manufacturing Time'].to_numpy(),
+        daily_storage_cost=inventory_data['Daily Storage Cost'].to_numpy()
+    )
+
+    simulation_results = inventory_data[['Product Name', 'Product Id', 'Warehouse Id', 'Economic Order Quantity', 'Reorder Point', 'Current Stock']].copy()
+    simulation_results['Simulated Demand'] = daily_demand.sum(axis=1)
+    for column, values in results.items():
+        simulation_results[column] = values
+
+    print(f"{nowtime()} Policies of {len(simulation_results)} products simulated over {daily_demand.shape[1]} days, "
+          f"{(simulation_results['Stockout Days'] > 0).sum()} with stockouts.")
+
+    return simulation_results
+
+##### POLICY GRID SEARCH FUNCTIONS #####
+
+# Function to draw a daily demand path around the expected daily demand
+def sample_demand_path(daily_demand, random_state=42):
+
+    return np.random.default_rng(random_state).poisson(daily_demand).astype(float)
+
+def get_policy_grid(daily_demand, order_quantity, reorder_point, lead_time,
+                    safety_multipliers=np.linspace(0, 3, 13), cover_days=(1, 2, 3, 5, 7, 10, 14, 21, 30, 45, 60, 90)):
+    """
+    Build the candidate reorder points and order quantities of every product around its demand. The reorder points
+    are multiples of the demand over the lead time and the order quantities cover a number of days of demand.
+    The closed form EOQ and ROP are always candidates.
+
+    Returns:
+    - Arrays of shape (products, reorder points) and (products, order quantities).
+    """
+
+    mean_daily_demand = daily_demand.mean(axis=1)
+    lead_time_demand = mean_daily_demand * np.maximum(lead_time, 1)
+
+    reorder_points = np.column_stack([reorder_point, np.round(lead_time_demand[:, None] * np.asarray(safety_multipliers))])
+    order_quantities = np.column_stack([order_quantity, np.round(mean_daily_demand[:, None] * np.asarray(cover_days))])
+
+    return reorder_points, np.maximum(order_quantities, 1)
+
+def search_policy_grid(daily_demand, starting_stock, reorder_points, order_quantities, lead_time, daily_storage_cost, order_cost,
+                       service_level=0.95, max_rows=200000):
+    """
+    Simulate every combination of candidate reorder point and order quantity of every product and keep, for each product,
+    the policy with the lowest holding and ordering cost whose fill rate meets the service level. Products for which no
+    policy meets the service level keep the policy with the highest fill rate. Products are simulated in chunks of at
+    most max_rows policies to bound the memory.
+
+    Returns:
+    - Dictionary of arrays with the chosen policy of every product and its simulated results.
+    """
+
+    n_products, n_reorder_points = reorder_points.shape
+    n_order_quantities = order_quantities.shape[1]
+    n_policies = n_reorder_points * n_order_quantities
+    chunk_size = max(1, max_rows // n_policies)
+
+    best_policies = []
+    for chunk_start in range(0, n_products, chunk_size):
+        products = np.arange(chunk_start, min(chunk_start + chunk_size, n_products))
+
+        # One row per (product, reorder point, order quantity)
+        demand_index = np.repeat(products, n_policies)
+        results = simulate_inventory(
+            daily_demand,
+            starting_stock=starting_stock[demand_index],
+            reorder_point=np.repeat(reorder_points[products], n_order_quantities, axis=1).ravel(),
+            order_quantity=np.tile(order_quantities[products], n_reorder_points).ravel(),
+            lead_time=lead_time[demand_index],
+            daily_storage_cost=daily_storage_cost[demand_index],
+            demand_index=demand_index
+        )
+        results = {column: values.reshape(len(products), n_policies) for column, values in results.items()}
+        results['Total Cost'] = results['Holding Cost'] + results['Orders'] * order_cost[products, None]
+
+        feasible = results['Fill Rate'] >= service_level
+        best = np.where(feasible.any(axis=1),
+                        np.where(feasible, results['Total Cost'], np.inf).argmin(axis=1),
+                        results['Fill Rate'].argmax(axis=1))
+
+        chunk_rows = np.arange(len(products))
+        best_policies.append({
+            'Optimal Reorder Point': reorder_points[products, best // n_order_quantities],
+            'Optimal Order Quantity': order_quantities[products, best % n_order_quantities],
+            **{column: values[chunk_rows, best] for column, values in results.items()},
+            'Meets Service Level': feasible[chunk_rows, best]
+        })
+
+    return {column: np.concatenate([chunk[column] for chunk in best_policies]) for column in best_policies[0]}
+
+def optimize_policies(inventory_data, daily_demand, service_level=0.95, workers=None):
+    """
+    Search the best reorder point and order quantity of every product on the demand path, splitting the products
+    into partitions that are searched in parallel worker processes. The closed form policy is simulated on the same
+    path for comparison.
+
+    Parameters:
+    - inventory_data: One row per product with the Current Stock, Reorder Point, Economic Order Quantity,
+      Manufacturing Time, Daily Storage Cost and Manufacturing Cost columns. The Manufacturing Cost is the cost of
+      placing an order, as in the EOQ formula.
+    - daily_demand: Array of shape (products, days) in the order of the rows of inventory_data.
+    - service_level: Minimum fill rate of the chosen policies.
+
+    Returns:
+    - DataFrame with the chosen policy of every product next to the closed form policy.
+    """
+
+    starting_stock = inventory_data['Current Stock'].to_numpy(dtype=float)
+    lead_time = inventory_data['Manufacturing Time'].to_numpy(dtype=int)
+    daily_storage_cost = inventory_data['Daily Storage Cost'].to_numpy(dtype=float)
+    order_cost = inventory_data['Manufacturing Cost'].to_numpy(dtype=float)
+
+    reorder_points, order_quantities = get_policy_grid(daily_demand, inventory_data['Economic Order Quantity'].to_numpy(dtype=float),
+                                                       inventory_data['Reorder Point'].to_numpy(dtype=float), lead_time)
+
+    workers, _ = get_worker_jobs(len(inventory_data), workers)
+    partitions = [partition for partition in np.array_split(np.arange(len(inventory_data)), workers) if len(partition)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(search_policy_grid, daily_demand[partition], starting_stock[partition], reorder_points[partition],
+                            order_quantities[partition], lead_time[partition], daily_storage_cost[partition], order_cost[partition],
+                            service_level=service_level)
+            for partition in partitions
+        ]
+        partition_results = [future.result() for future in futures]
+
+    best_policies = {column: np.concatenate([results[column] for results in partition_results]) for column in partition_results[0]}
+
+    # The closed form policy on the same demand path
+    closed_form = simulate_inventory(daily_demand, starting_stock, reorder_points[:, 0], order_quantities[:, 0], lead_time, daily_storage_cost)
+
+    policy_results = inventory_data[['Product Name', 'Product Id', 'Warehouse Id', 'Economic Order Quantity', 'Reorder Point', 'Current Stock']].copy()
+    policy_results['Closed Form Fill Rate'] = closed_form['Fill Rate']
+    policy_results['Closed Form Total Cost'] = closed_form['Holding Cost'] + closed_form['Orders'] * order_cost
+    for column, values in best_policies.items():
+        policy_results[column] = values
+
+    print(f"{nowtime()} {reorder_points.shape[1] * order_quantities.shape[1]} policies searched for {len(policy_results)} products "
+          f"using {len(partitions)} workers, {policy_results['Meets Service Level'].sum()} meet the {service_level:.0%} service level.")
+
+    return policy_results
@@ -0,0 +1,109 @@
+import pandas as pd
+import numpy as np
+from statistics import NormalDist
+
+# Average number of days in a month, to turn monthly demand statistics into daily ones
+DAYS_PER_MONTH = 365.25 / 12
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### DEMAND STATISTICS FUNCTIONS #####
+
+def get_history_demand_stats(monthly_demand, n_months=12):
+    """
+    Compute the mean and standard deviation of the monthly demand of every (product, warehouse) in one grouped pass.
+    Months without orders count as zero demand, which is handled through the sums instead of filling in the missing months.
+
+    Parameters:
+    - monthly_demand: Quantity ordered per month with the columns Product Id, Warehouse Id and Total Quantity Purchased.
+    - n_months: Number of months in the history window.
+
+    Returns:
+    - DataFrame with the Monthly Demand Mean and Monthly Demand Std of every (product, warehouse).
+    """
+
+    quantities = monthly_demand['Total Quantity Purchased'].astype(float)
+    demand_stats = monthly_demand.assign(**{'Total Quantity Purchased': quantities, 'Squared Quantity': quantities ** 2}) \
+        .groupby(['Product Id', 'Warehouse Id'])[['Total Quantity Purchased', 'Squared Quantity']].sum()
+
+    mean = demand_stats['Total Quantity Purchased'] / n_months
+    variance = (demand_stats['Squared Quantity'] - n_months * mean ** 2) / (n_months - 1)
+
+    return pd.DataFrame({'Monthly Demand Mean': mean, 'Monthly Demand Std': np.sqrt(variance.clip(lower=0))}).reset_index()
+
+def get_warehouse_shares(monthly_demand, product_info):
+    """
+    Get the share of every product's demand ordered from each warehouse. Products without orders are allocated
+    entirely to their warehouse in product_info.
+    """
+
+    warehouse_demand = monthly_demand.groupby(['Product Id', 'Warehouse Id'])['Total Quantity Purchased'].sum()
+    shares = (warehouse_demand / warehouse_demand.groupby(level='Product Id').transform('sum')).rename('Warehouse Share').reset_index()
+
+    unordered_products = product_info.loc[~product_info['Product Id'].isin(shares['Product Id']), ['Product Id', 'Warehouse Id']]
+
+    return pd.concat([shares, unordered_products.assign(**{'Warehouse Share': 1.0})], ignore_index=True)
+
+def get_forecast_demand_stats(forecasted_data, warehouse_shares):
+    """
+    Compute the mean and standard deviation of the monthly forecast of every (product, warehouse), splitting each
+    product's forecast between its warehouses by their share of its demand.
+
+    Parameters:
+    - forecasted_data: Monthly forecast with the columns Order Month, Product Id and Predicted Quantity.
+    - warehouse_shares: Share of every (product, warehouse) in its product's demand.
+
+    Returns:
+    - DataFrame with the Monthly Demand Mean and Monthly Demand Std of every (product, warehouse).
+    """
+
+    forecast_stats = forecasted_data.groupby('Product Id')['Predicted Quantity'].agg(['mean', 'std']).fillna(0).reset_index()
+    demand_stats = warehouse_shares.merge(forecast_stats, how='inner', on='Product Id')
+
+    demand_stats['Monthly Demand Mean'] = demand_stats['mean'] * demand_stats['Warehouse Share']
+    demand_stats['Monthly Demand Std'] = demand_stats['std'] * demand_stats['Warehouse Share']
+
+    return demand_stats[['Product Id', 'Warehouse Id', 'Monthly Demand Mean', 'Monthly Demand Std']]
+
+##### SAFETY STOCK FUNCTIONS #####
+
+def calculate_safety_stock(demand_stats, product_info, service_level=0.95):
+    """
+    Calculate the safety stock and reorder point of every (product, warehouse) for a cycle service level, covering the
+    demand variability over the Manufacturing Time:
+    Safety Stock = z * daily demand std * sqrt(lead time) and Reorder Point = daily demand mean * lead time + Safety Stock.
+
+    Parameters:
+    - demand_stats: Monthly Demand Mean and Monthly Demand Std of every (product, warehouse).
+    - product_info: Product information with the Product Name and Manufacturing Time of every Product Id.
+    - service_level: Probability of not running out of stock during a lead time.
+
+    Returns:
+    - DataFrame with the Safety Stock and Service Level Reorder Point of every (product, warehouse).
+    """
+
+    z = NormalDist().inv_cdf(service_level)
+
+    product_lead_times = product_info.drop_duplicates('Product Id')[['Product Id', 'Product Name', 'Manufacturing Time']]
+    safety_stock = demand_stats.merge(product_lead_times, how='left', on='Product Id')
+
+    lead_time = safety_stock['Manufacturing Time'].fillna(0).to_numpy(dtype=float)
+    daily_mean = safety_stock['Monthly Demand Mean'].to_numpy(dtype=float) / DAYS_PER_MONTH
+    daily_std = safety_stock['Monthly Demand Std'].to_numpy(dtype=float) / np.sqrt(DAYS_PER_MONTH)
+
+    safety_stock['Lead Time Demand'] = np.round(daily_mean * lead_time, 2)
+    safety_stock['Safety Stock'] = np.ceil(z * daily_std * np.sqrt(lead_time))
+    safety_stock['Service Level Reorder Point'] = np.ceil(daily_mean * lead_time + safety_stock['Safety Stock'])
+    safety_stock['Service Level'] = service_level
+
+    safety_stock = safety_stock[['Product Name', 'Product Id', 'Warehouse Id', 'Monthly Demand Mean', 'Monthly Demand Std', 'Manufacturing Time',
+                                 'Lead Time Demand', 'Safety Stock', 'Service Level Reorder Point', 'Service Level']]
+    safety_stock = safety_stock.sort_values(['Product Id', 'Warehouse Id']).reset_index(drop=True)
+
+    print(f"{nowtime()} Safety stock calculated for {len(safety_stock)} product-warehouse pairs at a {service_level:.0%} service level.")
+
+    return safety_stock
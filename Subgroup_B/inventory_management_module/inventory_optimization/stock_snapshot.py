@@ -0,0 +1,89 @@
+import pandas as pd
+
+SNAPSHOT_TABLE = 'monthly_stock_snapshot'
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### INDEX FUNCTIONS #####
+
+def create_stock_indexes(conn):
+    """
+    Index stock_data by date and by product and date.
+
+    Returns:
+    - True if the indexes already existed. stock_data being replaced drops its indexes, so False also means
+      that the snapshot may be out of date and has to be rebuilt.
+    """
+
+    existing = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_stock_data_date'").fetchone() is not None
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_stock_data_date ON stock_data ("Date");')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_stock_data_product_date ON stock_data ("Product Name", "Date");')
+    conn.commit()
+
+    return existing
+
+##### SNAPSHOT FUNCTIONS #####
+
+def update_stock_snapshot(conn):
+    """
+    Keep the month-start stock of every product in the monthly_stock_snapshot table, together with the quantity sold
+    over the month. Only the months from the latest month already in the snapshot onwards are recomputed, since the
+    latest month may have been partial, so the update reads the new daily rows instead of the whole history.
+    """
+
+    rebuild = not create_stock_indexes(conn)
+
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS {SNAPSHOT_TABLE} (
+        "Year" TEXT,
+        "Month" TEXT,
+        "Product Name" TEXT,
+        "Snapshot Date" TEXT,
+        "Stock at Start of Month" INTEGER,
+        "Total Sold" INTEGER,
+        PRIMARY KEY ("Year", "Month", "Product Name")
+    );
+    ''')
+
+    if rebuild:
+        conn.execute(f'DELETE FROM {SNAPSHOT_TABLE};')
+        start_date = '0000-00-00'
+        print(f"{nowtime()} stock_data was recreated, rebuilding the stock snapshot.")
+    else:
+        latest_month = conn.execute(f'SELECT MAX("Year" || \'-\' || "Month") FROM {SNAPSHOT_TABLE};').fetchone()[0]
+        start_date = f'{latest_month}-01' if latest_month else '0000-00-00'
+        conn.execute(f'DELETE FROM {SNAPSHOT_TABLE} WHERE "Year" || \'-\' || "Month" || \'-01\' >= ?;', (start_date,))
+
+    # The stock of the first day of each month is taken from the row holding the MIN("Date") of the group
+    cursor = conn.execute(f'''
+    INSERT INTO {SNAPSHOT_TABLE} ("Year", "Month", "Product Name", "Snapshot Date", "Stock at Start of Month", "Total Sold")
+    SELECT
+        SUBSTR("Date", 1, 4),
+        SUBSTR("Date", 6, 2),
+        "Product Name",
+        MIN("Date"),
+        "Current Stock",
+        SUM("Total Sold")
+    FROM stock_data
+    WHERE "Date" >= ?
+    GROUP BY "Product Name", SUBSTR("Date", 1, 7);
+    ''', (start_date,))
+    conn.commit()
+
+    print(f"{nowtime()} Stock snapshot updated from {start_date} ({cursor.rowcount} product months).")
+
+    return
+
+# Function to get the query of the stock of every product on a month-start date
+def get_stock_snapshot_query(snapshot_date):
+
+    return f'''
+    SELECT "Product Name", "Snapshot Date" AS "Date", "Stock at Start of Month" AS "Current Stock"
+    FROM {SNAPSHOT_TABLE}
+    WHERE "Year" = '{snapshot_date[:4]}' AND "Month" = '{snapshot_date[5:7]}' AND "Snapshot Date" = '{snapshot_date}';
+    '''
@@ -8,6 +8,27 @@
 
 # Variable Set up --------------------------------------------------
 export input_year="$INPUT_YEAR"
+export forecast_backend="${FORECAST_BACKEND:-onehot}"
+export forecast_mode="${FORECAST_MODE:-recursive}"
+export forecast_backtest="${FORECAST_BACKTEST:-False}"
+export search_strategy="${SEARCH_STRATEGY:-grid}"
+export search_max_fits="${SEARCH_MAX_FITS:-}"
+export search_max_time="${SEARCH_MAX_TIME:-}"
+export search_report="${SEARCH_REPORT:-False}"
+export forecast_partition_by="${FORECAST_PARTITION_BY:-none}"
+export forecast_partitions="${FORECAST_PARTITIONS:-4}"
+export forecast_workers="${FORECAST_WORKERS:-}"
+export batch_start_year="${BATCH_START_YEAR:-}"
+export batch_end_year="${BATCH_END_YEAR:-}"
+export backtest_start_year="${BACKTEST_START_YEAR:-}"
+export backtest_end_year="${BACKTEST_END_YEAR:-}"
+export backtest_variants="${BACKTEST_VARIANTS:-}"
+export inventory_simulation_demand="${INVENTORY_SIMULATION_DEMAND:-none}"
+export policy_optimization="${POLICY_OPTIMIZATION:-False}"
+export policy_service_level="${POLICY_SERVICE_LEVEL:-0.95}"
+export policy_workers="${POLICY_WORKERS:-}"
+export safety_stock_demand="${SAFETY_STOCK_DEMAND:-none}"
+export cycle_service_level="${CYCLE_SERVICE_LEVEL:-0.95}"
 
 # Directories --------------------------------------------------
 module_dir="/app/inventory_management_module"
@@ -28,12 +49,26 @@ export database_path="/app/input/supply_chain.db"
 
 # Scripts --------------------------------------------------
 export demand_forecasting_script="${module_dir}/demand_forecasting/demand_forecasting_model.py"
+export batch_demand_forecasting_script="${module_dir}/demand_forecasting/batch_demand_forecasting.py"
+export backtesting_script="${module_dir}/demand_forecasting/backtesting.py"
 export inventory_optimization_script="${module_dir}/inventory_optimization/inventory_optimization.py"
 
 # Forecast Demand --------------------------------------------------
 echo "Running Demand Forecasting Script..."
 "$module_dir"/demand_forecasting/demand_forecasting_model.sh
 
+# Backfill Forecasts --------------------------------------------------
+if [ -n "$batch_start_year" ] && [ -n "$batch_end_year" ]; then
+    echo "Running Batch Demand Forecasting Script..."
+    "$module_dir"/demand_forecasting/batch_demand_forecasting.sh
+fi
+
+# Backtest Model Variants --------------------------------------------------
+if [ -n "$backtest_start_year" ] && [ -n "$backtest_end_year" ]; then
+    echo "Running Backtesting Script..."
+    "$module_dir"/demand_forecasting/backtesting.sh
+fi
+
 # Generate Priority Score --------------------------------------------------
 echo "Running Inventory Optimization Script..."
 "$module_dir"/inventory_optimization/inventory_optimization.sh
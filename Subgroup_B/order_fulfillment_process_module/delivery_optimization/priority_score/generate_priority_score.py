@@ -37,13 +37,22 @@ def open_connection(database_path):
     return conn
 
 # Function to query data from a database
-def query_data(conn, query):
+def query_data(conn, query, params=None):
 
-    df = pd.read_sql_query(query, conn)
+    df = pd.read_sql_query(query, conn, params=params)
     print(f"{nowtime()} Data extracted from database.")
 
     return df
 
+# Function to add a table to a database
+def add_table_to_database(df, table_name, conn):
+    
+    df.to_sql(table_name, conn, if_exists='replace', index=False)
+    conn.commit()
+    print(f"{nowtime()} Table {table_name} added to database.")
+
+    return
+
 # Function to close the sql connection
 def close_connection(conn):
         
@@ -54,6 +63,25 @@ def close_connection(conn):
 
 ##### PRIORITY SCORE FUNCTIONS #####
 
+# Function to merge custom weights into the default weights
+def resolve_weights(weights = None):
+
+    # Default weights
+    default_weights = {
+        'late_delivery_probability': 0.5,   # Higher weight for late delivery probability
+        'Days Till Scheduled Delivery': 0.4, # Higher weight for days till scheduled delivery
+        'Avg Shipping Time': 0.3,           # Moderate weight for average shipping time --> takes into consideration order region 
+        'Order Profit': 0.1            # Lowest weight for Order Profit
+    }
+    
+    # Use custom weights if provided
+    if weights:
+        for key in weights:
+            if key in default_weights:
+                default_weights[key] = weights[key]
+
+    return default_weights
+
 def extract_days_till_scheduled_delivery(df, late_delivery_summary, avg_shipping_time, date_of_interest = None):
 
     # Merge the DataFrames
@@ -91,19 +119,7 @@ def calculate_priority_score(df, weights = None):
     - DataFrame with priority scores.
     """
     
-    # Default weights
-    default_weights = {
-        'late_delivery_probability': 0.5,   # Higher weight for late delivery probability
-        'Days Till Scheduled Delivery': 0.4, # Higher weight for days till scheduled delivery
-        'Avg Shipping Time': 0.3,           # Moderate weight for average shipping time --> takes into consideration order region 
-        'Order Profit': 0.1            # Lowest weight for Order Profit
-    }
-    
-    # Use custom weights if provided
-    if weights:
-        for key in weights:
-            if key in default_weights:
-                default_weights[key] = weights[key]
+    default_weights = resolve_weights(weights)
 
     # Normalize Days Till Scheduled Delivery (lower values should result in higher priority, so use inverse normalization)
     days_till_min = df['Days Till Scheduled Delivery'].min()
@@ -135,6 +151,119 @@ def calculate_priority_score(df, weights = None):
 
     return df
 
+##### SQL PRIORITY SCORE FUNCTIONS #####
+
+# Function to load the priority metric summaries into the database as indexed lookup tables
+def load_reference_tables(conn, late_delivery_summary, avg_shipping_time):
+
+    add_table_to_database(late_delivery_summary, 'late_delivery_summary', conn)
+    add_table_to_database(avg_shipping_time, 'avg_shipping_time', conn)
+
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_late_delivery_summary ON late_delivery_summary ("Product Name", "Shipping Mode")')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_avg_shipping_time ON avg_shipping_time ("Product Name", "Shipping Mode")')
+    conn.commit()
+
+    print(f"{nowtime()} Reference tables indexed.")
+
+    return
+
+def build_priority_score_query(conn, order_query):
+    """
+    Build a single SQL statement that joins the order query to the reference tables, derives the 
+    scheduled delivery date, min-max normalizes the metrics with window aggregates and ranks the orders.
+    The output columns match the ones produced by calculate_priority_score.
+    
+    Parameters:
+    - conn: Connection to the database holding the order data and the reference tables.
+    - order_query: Query returning the orders of interest.
+    
+    Returns:
+    - SQL statement expecting the named parameters date_of_interest, w_late, w_days, w_shipping and w_profit.
+    """
+
+    order_query = order_query.strip().rstrip(';')
+
+    # Get the columns returned by the order query so that Order Profit can be normalized in place
+    order_columns = [col[0] for col in conn.execute(f'SELECT * FROM ({order_query}) LIMIT 0').description]
+    order_select = ',\n        '.join(
+        'n."Order Profit Normalized" AS "Order Profit"' if col == 'Order Profit' else f'n."{col}"'
+        for col in order_columns
+    )
+
+    query = f'''
+    WITH orders AS (
+        {order_query}
+    ),
+    scheduled AS (
+        SELECT
+            o.*,
+            l.late_delivery_probability,
+            COALESCE(a."Avg Shipping Time", o."Days for shipment (scheduled)") AS "Avg Shipping Time",
+            date(o."Order Date", '+' || o."Days for shipment (scheduled)" || ' days') AS "Scheduled Delivery Date",
+            julianday(o."Order Date") + o."Days for shipment (scheduled)" - julianday(:date_of_interest) AS days_till_scheduled_delivery
+        FROM orders o
+        LEFT JOIN late_delivery_summary l
+            ON l."Product Name" = o."Product Name" AND l."Shipping Mode" = o."Shipping Mode"
+        LEFT JOIN avg_shipping_time a
+            ON a."Product Name" = o."Product Name" AND a."Shipping Mode" = o."Shipping Mode"
+    ),
+    floored AS (
+        SELECT
+            s.*,
+            CAST(s.days_till_scheduled_delivery AS INTEGER) - (s.days_till_scheduled_delivery < CAST(s.days_till_scheduled_delivery AS INTEGER)) AS days_till
+        FROM scheduled s
+    ),
+    normalized AS (
+        SELECT
+            f.*,
+            (MAX(f.days_till) OVER () - f.days_till) * 1.0 / NULLIF(MAX(f.days_till) OVER () - MIN(f.days_till) OVER (), 0) AS "Days Till Normalized",
+            (MAX(f."Avg Shipping Time") OVER () - f."Avg Shipping Time") * 1.0 / NULLIF(MAX(f."Avg Shipping Time") OVER () - MIN(f."Avg Shipping Time") OVER (), 0) AS "Avg Shipping Time Normalized",
+            (f."Order Profit" - MIN(f."Order Profit") OVER ()) * 1.0 / NULLIF(MAX(f."Order Profit") OVER () - MIN(f."Order Profit") OVER (), 0) AS "Order Profit Normalized"
+        FROM floored f
+    )
+    SELECT
+        {order_select},
+        n.late_delivery_probability,
+        n."Avg Shipping Time Normalized" AS "Avg Shipping Time",
+        n."Scheduled Delivery Date",
+        n."Days Till Normalized" AS "Days Till Scheduled Delivery",
+        n.late_delivery_probability * :w_late
+            + n."Days Till Normalized" * :w_days
+            + n."Avg Shipping Time Normalized" * :w_shipping
+            + n."Order Profit Normalized" * :w_profit AS priority_score
+    FROM normalized n
+    ORDER BY priority_score DESC;
+    '''
+
+    return query
+
+def calculate_priority_score_sql(conn, order_query, late_delivery_summary, avg_shipping_time, date_of_interest = None, weights = None):
+    """
+    Calculate the priority score inside SQLite and return only the ranked orders.
+    """
+
+    if not date_of_interest:
+        date_of_interest = get_today()
+
+    weights = resolve_weights(weights)
+
+    load_reference_tables(conn, late_delivery_summary, avg_shipping_time)
+
+    query = build_priority_score_query(conn, order_query)
+    params = {
+        'date_of_interest': date_of_interest,
+        'w_late': weights['late_delivery_probability'],
+        'w_days': weights['Days Till Scheduled Delivery'],
+        'w_shipping': weights['Avg Shipping Time'],
+        'w_profit': weights['Order Profit']
+    }
+
+    df = query_data(conn, query, params = params)
+
+    print(f"{nowtime()} Priority scores calculated in database.")
+
+    return df
+
 @click.command()
 @click.argument('output_dir', type=click.Path(exists=True))
 @click.argument('references_dir', type=click.Path(exists=True))
@@ -142,38 +271,48 @@ def calculate_priority_score(df, weights = None):
 @click.argument('date_of_interest', type=str)
 @click.argument('query', type=str)
 @click.option('--weights', type=str, default=None, help='Custom weights for priority score calculation.')
+@click.option('--mode', type=click.Choice(['pandas', 'sql']), default='pandas', help='Compute the priority score in pandas or inside the database.')
 
-def main(output_dir, references_dir, database_path, date_of_interest, query, weights): 
+def main(output_dir, references_dir, database_path, date_of_interest, query, weights, mode): 
     
     # Connect to the database
     conn = open_connection(database_path)
 
-    # Extract data between specified timeframe
-    print(f"{nowtime()} Extracting order data...")
-    df = query_data(conn, query)
-
     # Extracting summaries
     print(f"{nowtime()} Extracting late delivery summaries...")
     late_delivery_summary = pd.read_csv(os.path.join(references_dir, 'late_delivery_summary.csv'))
     print(f"{nowtime()} Late average shipping time...")
     avg_shipping_time = pd.read_csv(os.path.join(references_dir, 'avg_shipping_time.csv'))
 
-    # Extract days till scheduled delivery
-    print(f"{nowtime()} Extracting days till scheduled delivery...")
-    df = extract_days_till_scheduled_delivery(df, late_delivery_summary, avg_shipping_time, date_of_interest = date_of_interest)
-    
     if weights is not None:
         weights = retrieve_weights(weights)
 
-    # Calculate the priority score
-    print(f"{nowtime()} Calculating priority scores...")
-    df = calculate_priority_score(df, weights = weights)
+    if mode == 'sql':
+        # Calculate the priority score inside the database
+        print(f"{nowtime()} Calculating priority scores in database...")
+        df = calculate_priority_score_sql(conn, query, late_delivery_summary, avg_shipping_time, date_of_interest = date_of_interest, weights = weights)
+
+    else:
+        # Extract data between specified timeframe
+        print(f"{nowtime()} Extracting order data...")
+        df = query_data(conn, query)
+
+        # Extract days till scheduled delivery
+        print(f"{nowtime()} Extracting days till scheduled delivery...")
+        df = extract_days_till_scheduled_delivery(df, late_delivery_summary, avg_shipping_time, date_of_interest = date_of_interest)
+
+        # Calculate the priority score
+        print(f"{nowtime()} Calculating priority scores...")
+        df = calculate_priority_score(df, weights = weights)
 
     # Save the priority scores to a CSV file
     df.to_csv(os.path.join(output_dir, f'{date_of_interest}_priority_scores.csv'), index=False)
 
     print(f"{nowtime()} Priority scores saved to CSV.")
 
+    # Close the connection
+    close_connection(conn)
+
     return
 
 if __name__ == "__main__":
@@ -56,7 +56,8 @@ python "$generate_priority_score_script" \
     "$database_path" \
     "$order_date_of_interest" \
     "$delivery_orders_of_interest_query" \
-    --weights "$weights" | tee -a "${generate_priority_score_log_file}"
+    --weights "$weights" \
+    --mode "$priority_score_mode" | tee -a "${generate_priority_score_log_file}"
 
 # End Log
 echo "----- End Run -----" | tee -a "${generate_priority_score_log_file}"
\ No newline at end of file
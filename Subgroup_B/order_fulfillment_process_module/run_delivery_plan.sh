@@ -12,6 +12,7 @@
 export order_date_of_interest="$ORDER_DATE_OF_INTEREST"
 export num_vehicles="$NUM_VEHICLES"
 export vehicle_capacity="$VEHICLE_CAPACITY"
+export priority_score_mode="${PRIORITY_SCORE_MODE:-pandas}"
 
 # Directories --------------------------------------------------
 module_dir="/app/order_fulfillment_process_module"
@@ -0,0 +1,122 @@
+import pandas as pd
+import numpy as np
+
+ELASTICITY_METHODS = ['ratio', 'loglog']
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### LEAST SQUARES FUNCTIONS #####
+
+def grouped_least_squares(X, y, codes, n_groups, min_observations=3):
+    """
+    Solve one ordinary least squares problem per group at once. The normal equations of all groups are accumulated
+    with bincount and solved as a stack, so the cost does not depend on the number of groups.
+
+    Parameters:
+    - X: Array of shape (rows, regressors), including the intercept column.
+    - y: Array of shape (rows,).
+    - codes: Group of every row, from 0 to n_groups - 1.
+    - min_observations: Groups with fewer rows, or with collinear regressors, get NaN coefficients.
+
+    Returns:
+    - Dictionary of arrays: coefficients and std_errors of shape (n_groups, regressors), and observations,
+      r_squared and rmse of shape (n_groups,).
+    """
+
+    n_regressors = X.shape[1]
+
+    XtX = np.empty((n_groups, n_regressors, n_regressors))
+    for i in range(n_regressors):
+        for j in range(i, n_regressors):
+            XtX[:, i, j] = XtX[:, j, i] = np.bincount(codes, weights=X[:, i] * X[:, j], minlength=n_groups)
+    Xty = np.stack([np.bincount(codes, weights=X[:, i] * y, minlength=n_groups) for i in range(n_regressors)], axis=1)
+
+    observations = np.bincount(codes, minlength=n_groups)
+    y_sum = np.bincount(codes, weights=y, minlength=n_groups)
+    yty = np.bincount(codes, weights=y * y, minlength=n_groups)
+
+    # Only solve the groups with enough rows and a well conditioned system, the others stay NaN
+    solvable = observations >= max(min_observations, n_regressors)
+    if solvable.any():
+        solvable[solvable] = np.linalg.cond(XtX[solvable]) < 1e10
+
+    coefficients = np.full((n_groups, n_regressors), np.nan)
+    XtX_inv = np.full((n_groups, n_regressors, n_regressors), np.nan)
+    XtX_inv[solvable] = np.linalg.inv(XtX[solvable])
+    coefficients[solvable] = np.einsum('gij,gj->gi', XtX_inv[solvable], Xty[solvable])
+
+    # Residual and total sums of squares from the accumulated sums
+    rss = yty - 2 * np.einsum('gi,gi->g', coefficients, Xty) + np.einsum('gi,gij,gj->g', coefficients, XtX, coefficients)
+    rss = np.clip(rss, 0, None)
+    tss = yty - y_sum ** 2 / np.maximum(observations, 1)
+
+    degrees_of_freedom = observations - n_regressors
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma2 = np.where(degrees_of_freedom > 0, rss / degrees_of_freedom, np.nan)
+        std_errors = np.sqrt(sigma2[:, None] * np.diagonal(XtX_inv, axis1=1, axis2=2))
+        r_squared = np.where(tss > 0, 1 - rss / tss, np.nan)
+
+    return {
+        'coefficients': coefficients,
+        'std_errors': std_errors,
+        'observations': observations,
+        'r_squared': np.where(solvable, r_squared, np.nan),
+        'rmse': np.sqrt(np.where(solvable, rss / np.maximum(observations, 1), np.nan))
+    }
+
+##### ELASTICITY FUNCTIONS #####
+
+def estimate_elasticities(df, group_keys, quantity, regressor, log_regressor=True, min_observations=3):
+    """
+    Fit log(quantity) = intercept + elasticity * log(regressor) for every group of df in one batched call.
+    With log_regressor=False the regressor enters linearly, e.g. for a discount rate, and the coefficient is a
+    semi-elasticity (relative change in quantity per unit of the regressor).
+
+    Parameters:
+    - df: DataFrame with the group keys, quantity and regressor columns.
+    - group_keys: Columns defining a group, e.g. ['Product_Category', 'price_bins'].
+    - quantity: Demand column, only the rows with a positive quantity (and positive regressor when logged) are used.
+    - regressor: Price or discount column.
+
+    Returns:
+    - DataFrame with one row per group: elasticity, intercept, elasticity_std_error, elasticity_t_stat,
+      observations, r_squared and rmse.
+    """
+
+    quantities = df[quantity].to_numpy(dtype=float)
+    values = df[regressor].to_numpy(dtype=float)
+
+    valid = (quantities > 0) & np.isfinite(values)
+    if log_regressor:
+        valid &= values > 0
+
+    groups = df.loc[valid, group_keys]
+    codes, uniques = pd.MultiIndex.from_frame(groups).factorize(sort=True)
+
+    x = np.log(values[valid]) if log_regressor else values[valid]
+    y = np.log(quantities[valid])
+
+    # Centre the regressor within its group, prices within a price bin vary little and the uncentred normal
+    # equations would be badly conditioned
+    x_mean = np.bincount(codes, weights=x, minlength=len(uniques)) / np.maximum(np.bincount(codes, minlength=len(uniques)), 1)
+    X = np.column_stack([np.ones(len(x)), x - x_mean[codes]])
+
+    fit = grouped_least_squares(X, y, codes, len(uniques), min_observations)
+
+    estimates = pd.DataFrame(list(uniques), columns=group_keys)
+    estimates['elasticity'] = fit['coefficients'][:, 1]
+    estimates['intercept'] = fit['coefficients'][:, 0] - fit['coefficients'][:, 1] * x_mean
+    estimates['elasticity_std_error'] = fit['std_errors'][:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        estimates['elasticity_t_stat'] = estimates['elasticity'] / estimates['elasticity_std_error']
+    estimates['observations'] = fit['observations']
+    estimates['r_squared'] = fit['r_squared']
+    estimates['rmse'] = fit['rmse']
+
+    print(f"{nowtime()} Elasticity of {quantity} to {regressor} estimated for {estimates['elasticity'].notna().sum()} of {len(estimates)} groups.")
+
+    return estimates
@@ -0,0 +1,100 @@
+import pandas as pd
+import json
+import os
+
+FEATURE_SCHEMA_FILE = 'pricing_feature_schema.json'
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### PERSISTENCE FUNCTIONS #####
+
+def load_feature_schema(reference_dir, reset=False):
+    """
+    Load the feature schema saved by a previous run in reference_dir, or start an empty one.
+
+    The schema holds:
+    - categories: the classes of every label encoded column, the code of a class being its position.
+    - dummies: the levels of every one-hot encoded column, the first level being dropped.
+    - columns: the column order of every prepped output.
+    """
+
+    schema_path = os.path.join(reference_dir, FEATURE_SCHEMA_FILE)
+
+    if reset or not os.path.exists(schema_path):
+        return {'categories': {}, 'dummies': {}, 'columns': {}}
+
+    with open(schema_path) as f:
+        schema = json.load(f)
+
+    print(f"{nowtime()} Feature schema loaded from {schema_path}")
+
+    return schema
+
+def save_feature_schema(schema, reference_dir):
+
+    schema_path = os.path.join(reference_dir, FEATURE_SCHEMA_FILE)
+
+    with open(schema_path, 'w') as f:
+        json.dump(schema, f, indent=4)
+
+    print(f"{nowtime()} Feature schema saved to {schema_path}")
+
+    return
+
+##### ENCODING FUNCTIONS #####
+
+# Function to add the values never seen before to a list of classes or levels, sorted after the known ones so that no code or column moves
+def extend_values(known_values, values):
+
+    new_values = sorted(set(pd.Series(values).dropna().astype(str)) - set(known_values))
+
+    return list(known_values) + new_values
+
+def update_feature_schema(schema, categories=None, dummies=None):
+    """
+    Add the new classes of the label encoded columns and the new levels of the one-hot encoded columns to the schema.
+    The first run fits them on sorted values, as LabelEncoder and pd.get_dummies do.
+
+    Parameters:
+    - categories: Dictionary of the values of every label encoded column.
+    - dummies: Dictionary of the values of every one-hot encoded column.
+    """
+
+    for column, values in (categories or {}).items():
+        schema['categories'][column] = extend_values(schema['categories'].get(column, []), values)
+
+    for column, values in (dummies or {}).items():
+        schema['dummies'][column] = extend_values(schema['dummies'].get(column, []), values)
+
+    return schema
+
+# Function to label encode a column with the classes of the schema, the unknown values being coded -1
+def encode_categories(values, schema, column):
+
+    return pd.Index(schema['categories'][column]).get_indexer(values.astype(str))
+
+def encode_dummies(df, schema, columns):
+    """
+    One-hot encode columns with the levels of the schema, like pd.get_dummies(df, columns=columns, drop_first=True)
+    but always giving one column per known level but the first, whether or not the level is present in df.
+    """
+
+    dummies = {f'{column}_{level}': df[column] == level for column in columns for level in schema['dummies'][column][1:]}
+
+    return pd.concat([df.drop(columns=columns), pd.DataFrame(dummies, index=df.index)], axis=1)
+
+def order_columns(df, schema, output):
+    """
+    Order the columns of a prepped output as in the previous runs, the columns never seen before being added at the
+    end and recorded in the schema.
+    """
+
+    known_columns = schema['columns'].get(output, [])
+    new_columns = [column for column in df.columns if column not in known_columns]
+    schema['columns'][output] = known_columns + new_columns
+
+    return df[[column for column in schema['columns'][output] if column in df.columns]]
@@ -0,0 +1,152 @@
+import pandas as pd
+import sql_queries
+import pricing_features
+
+# DataCo category of every Olist English category name
+OLIST_CATEGORY_MAPPING = {
+    'cool_stuff': 'As Seen on  TV!', 'pet_shop': 'Pet Supplies', 'furniture_decor': 'Garden', 'perfumery': 'Health and Beauty',
+    'garden_tools': 'Garden', 'housewares': 'Housewares', 'telephony': 'Consumer Electronics', 'health_beauty': 'Health and Beauty',
+    'books_technical': 'Books', 'fashion_bags_accessories': "Women's Apparel", 'bed_bath_table': 'Health and Beauty',
+    'sports_leisure': 'Sporting Goods', 'consoles_games': 'Video Games', 'office_furniture': 'Office Furniture',
+    'luggage_accessories': 'Accessories', 'food': 'Food', 'agro_industry_and_commerce': 'Industry and Commerce',
+    'electronics': 'Electronics', 'computers_accessories': 'Computers', 'construction_tools_construction': 'Construction Tools',
+    'audio': 'Consumer Electronics', 'baby': 'Baby', 'construction_tools_lights': 'Construction Tools', 'toys': 'Toys',
+    'stationery': 'Office Supplies', 'industry_commerce_and_business': 'Industry and Commerce', 'watches_gifts': 'Accessories',
+    'auto': 'Automotive', 'home_appliances': 'Home Appliances', 'kitchen_dining_laundry_garden_furniture': 'Housewares',
+    'air_conditioning': 'Home Appliances', 'home_confort': 'Housewares', 'fixed_telephony': 'Consumer Electronics',
+    'small_appliances_home_oven_and_coffee': 'Small Appliances', 'diapers_and_hygiene': 'Baby', 'signaling_and_security': 'Electronics',
+    'musical_instruments': 'Music', 'small_appliances': 'Small Appliances', 'costruction_tools_garden': 'Garden', 'art': 'Crafts',
+    'home_construction': 'Crafts', 'books_general_interest': 'Books', 'party_supplies': 'Party Supplies', 'construction_tools_safety': 'Construction Tools',
+    'cine_photo': 'Cameras', 'fashion_underwear_beach': "Women's Apparel", 'fashion_male_clothing': "Men's Clothing", 'food_drink': 'Food',
+    'drinks': 'Beverages', 'furniture_living_room': 'Furniture', 'market_place': 'Market Place', 'music': 'Music', 'fashion_shoes': "Women's Apparel",
+    'flowers': 'Garden', 'home_appliances_2': 'Home Appliances', 'fashio_female_clothing': "Women's Clothing", 'computers': 'Computers',
+    'books_imported': 'Books', 'christmas_supplies': 'Seasonal Items', 'furniture_bedroom': 'Furniture', 'home_comfort_2': 'Housewares',
+    'dvds_blu_ray': 'DVDs', 'cds_dvds_musicals': 'CDs', 'arts_and_craftmanship': 'Crafts', 'furniture_mattress_and_upholstery': 'Furniture',
+    'tablets_printing_image': 'Tablets & Accessories', 'costruction_tools_tools': 'Construction Tools', 'fashion_sport': 'Sporting Goods',
+    'la_cuisine': 'Kitchen', 'security_and_services': 'Electronics', 'fashion_childrens_clothes': "Children's Clothing"
+}
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### SETUP FUNCTIONS #####
+
+# Function to index the Olist join keys
+def create_olist_indexes(conn):
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_olist_orders_order_id ON olist_orders_dataset (order_id);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_olist_order_items_order_id ON olist_order_items_dataset (order_id);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_olist_order_items_product_id ON olist_order_items_dataset (product_id);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_olist_products_product_id ON olist_products_dataset (product_id);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_olist_products_category_name ON olist_products_dataset (product_category_name);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_olist_translation_category_name ON product_category_name_translation (product_category_name);')
+    conn.commit()
+
+    return
+
+# Function to load the category mapping into a temporary table so that it can be joined in SQL
+def create_category_mapping_table(conn, mapping=OLIST_CATEGORY_MAPPING):
+
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS olist_category_mapping (product_category_name_english TEXT PRIMARY KEY, Product_Category TEXT);')
+    conn.execute('DELETE FROM olist_category_mapping;')
+    conn.executemany('INSERT INTO olist_category_mapping VALUES (?, ?);', mapping.items())
+
+    return
+
+# Function to load the price bin edges of every category into a temporary table
+def create_bin_edges_table(conn, categories, edges):
+
+    rows = [(category, price_bin, float(edges[row, price_bin]), float(edges[row, price_bin + 1]))
+            for row, category in enumerate(categories) for price_bin in range(edges.shape[1] - 1)]
+
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS olist_price_bin_edges (Product_Category TEXT, price_bins INTEGER, lower_edge REAL, upper_edge REAL);')
+    conn.execute('DELETE FROM olist_price_bin_edges;')
+    conn.executemany('INSERT INTO olist_price_bin_edges VALUES (?, ?, ?, ?);', rows)
+
+    return
+
+# Function to load the Olist category and price range compared with every product into a temporary table
+def create_price_windows_table(conn, price_windows):
+
+    rows = [(int(product_id), category, float(min_price), float(max_price)) for product_id, category, min_price, max_price
+            in price_windows[['Product Id', 'Product_Category', 'min_price', 'max_price']].itertuples(index=False, name=None)]
+
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS olist_product_price_windows ("Product Id" INTEGER, Product_Category TEXT, min_price REAL, max_price REAL);')
+    conn.execute('CREATE INDEX IF NOT EXISTS temp.idx_olist_product_price_windows ON olist_product_price_windows (Product_Category, min_price);')
+    conn.execute('DELETE FROM olist_product_price_windows;')
+    conn.executemany('INSERT INTO olist_product_price_windows VALUES (?, ?, ?, ?);', rows)
+
+    return
+
+##### EXTRACTION FUNCTIONS #####
+
+def extract_olist_price_bins(conn, start_year=2016, end_year=2018, max_price=800, n_bins=20):
+    """
+    Aggregate the Olist items to (month, category, price bin) inside SQLite. The price range of every category is
+    queried first to compute its bin edges (the same bins as pd.cut over the category's items), then the items are
+    joined to their bin and aggregated, so only the aggregated rows are returned.
+
+    Returns:
+    - DataFrame with the Order Period (YYYYMM integer), Product_Category, price_bins, olist_product_demand,
+      olist_price_before_discount, avg_discount_rate and avg_price_after_discount.
+    """
+
+    create_olist_indexes(conn)
+    create_category_mapping_table(conn)
+
+    price_ranges = pd.read_sql_query(sql_queries.olist_price_range_query(start_year, end_year, max_price), conn)
+    edges = pricing_features.get_category_bin_edges(price_ranges['min_price'].to_numpy(dtype=float), price_ranges['max_price'].to_numpy(dtype=float), n_bins)
+    create_bin_edges_table(conn, price_ranges['Product_Category'], edges)
+
+    olist = pd.read_sql_query(sql_queries.olist_price_bin_query(start_year, end_year, max_price), conn)
+
+    print(f"{nowtime()} Olist items aggregated to {len(olist)} (month, category, price bin) rows.")
+
+    return olist
+
+def extract_olist_monthly(conn, category, min_price, max_price, start_year=2016, end_year=2018):
+    """
+    Aggregate the Olist items of one category within a price range by month of the year inside SQLite.
+
+    Returns:
+    - DataFrame with the Order Month name, olist_product_demand, olist_price_before_discount, olist_avg_discount_rate
+      and olist_avg_price_after_discount.
+    """
+
+    create_olist_indexes(conn)
+    create_category_mapping_table(conn)
+
+    olist = pd.read_sql_query(sql_queries.olist_monthly_query(start_year, end_year), conn, params=(category, min_price, max_price))
+    olist['Order Month'] = pd.to_datetime(olist['Order Month'], format='%m').dt.strftime('%B')
+    olist = olist.sort_values('Order Month').reset_index(drop=True)
+
+    print(f"{nowtime()} Olist {category} items aggregated to {len(olist)} months.")
+
+    return olist
+
+def extract_olist_product_monthly(conn, price_windows, start_year=2016, end_year=2018):
+    """
+    Aggregate by month of the year the Olist items compared with every product in one query, each product being
+    compared with the items of its Olist category priced within its window.
+
+    Parameters:
+    - price_windows: DataFrame with the Product Id, Product_Category, min_price and max_price of every product.
+
+    Returns:
+    - DataFrame with the Product Id, Order Month name, olist_product_demand, olist_price_before_discount,
+      olist_avg_discount_rate and olist_avg_price_after_discount.
+    """
+
+    create_olist_indexes(conn)
+    create_category_mapping_table(conn)
+    create_price_windows_table(conn, price_windows)
+
+    olist = pd.read_sql_query(sql_queries.olist_product_monthly_query(start_year, end_year), conn)
+    olist['Order Month'] = pd.to_datetime(olist['Order Month'], format='%m').dt.strftime('%B')
+
+    print(f"{nowtime()} Olist items aggregated to {len(olist)} (product, month) rows for {len(price_windows)} products.")
+
+    return olist
@@ -0,0 +1,135 @@
+import pandas as pd
+import numpy as np
+from sklearn.preprocessing import LabelEncoder
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import os
+import click
+import pricing_cube
+import olist_extraction
+from preprocessing_single_product import nowtime, open_connection, close_connection, preprocess_products_dataco, classify_seasonality, SINGLE_PRODUCT_NAME, OLIST_CATEGORY, OLIST_MIN_PRICE, OLIST_MAX_PRICE
+
+# Columns identifying a product in the outputs
+PRODUCT_KEYS = ['Product Id', 'Product Name', 'Product_Category']
+
+# Every product is compared with the Olist items priced within this fraction of its average price,
+# which gives about the 30-90 range used for the single product
+OLIST_PRICE_WINDOW = 0.5
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+##### PARTITION FUNCTIONS #####
+
+# Function to assign every product to one of n_partitions partitions
+def get_product_partitions(product_ids, n_partitions):
+
+    return product_ids % n_partitions
+
+# Function to get the Olist category and price range compared with every product
+def get_olist_price_windows(products, window=OLIST_PRICE_WINDOW):
+    """
+    Compare every product with the Olist items of its own category, or of the single product's Olist category when
+    no Olist category maps to it, priced within window of its average price before discount. The single product keeps
+    the Olist category and price range of preprocessing_single_product, so that its rows are the same in both outputs.
+
+    Parameters:
+    - products: product rows of the pricing cube.
+    """
+
+    price_windows = products[['Product Id', 'Product_Category']].copy()
+    price_windows['avg_price'] = pricing_cube.get_cube_means(products, ['unit_price_sum'])['unit_price_sum']
+
+    olist_categories = set(olist_extraction.OLIST_CATEGORY_MAPPING.values())
+    price_windows['Product_Category'] = price_windows['Product_Category'].where(price_windows['Product_Category'].isin(olist_categories), OLIST_CATEGORY)
+    price_windows['min_price'] = price_windows['avg_price'] * (1 - window)
+    price_windows['max_price'] = price_windows['avg_price'] * (1 + window)
+
+    single_product = (products['Product Name'] == SINGLE_PRODUCT_NAME).to_numpy()
+    price_windows.loc[single_product, ['Product_Category', 'min_price', 'max_price']] = [OLIST_CATEGORY, OLIST_MIN_PRICE, OLIST_MAX_PRICE]
+
+    return price_windows
+
+##### PREPROCESSING FUNCTIONS #####
+
+def prepare_partition(partition, monthly, olist_months, reference_dir, seasonality_encoder):
+    """
+    Compute the monthly aggregates, PED inputs and prepped feature rows of the products of one partition, and save
+    them with and without the Olist features.
+
+    Returns:
+    - Number of products and of rows in the partition.
+    """
+
+    dataco_agg = preprocess_products_dataco(monthly, PRODUCT_KEYS)
+    dataco_agg['Seasonality_Encoded'] = seasonality_encoder.transform(dataco_agg['Order Month'].map(classify_seasonality))
+
+    df_prep = dataco_agg.drop(columns=['Order Month', 'dataco_price_before', 'discount_change', 'quantity_change'])
+    df_prep.to_csv(os.path.join(reference_dir, f'dataco_part_{partition:03d}.csv'), index=False)
+
+    merged_df = pd.merge(dataco_agg, olist_months, on=['Product Id', 'Order Month'], how='left')
+    merged_df = merged_df.fillna(0)
+    # Seasonality_Encoded comes after the Olist columns, as in dataco_olist_single_product.csv
+    merged_df['Seasonality_Encoded'] = merged_df.pop('Seasonality_Encoded')
+    merged_prep = merged_df.drop(columns=['Order Month', 'dataco_price_before', 'discount_change', 'quantity_change', 'olist_price_before_discount', 'olist_avg_price_after_discount'])
+    merged_prep.to_csv(os.path.join(reference_dir, f'dataco_olist_part_{partition:03d}.csv'), index=False)
+
+    return dataco_agg['Product Id'].nunique(), len(dataco_agg)
+
+def process_all_products(supply_chain_database_path, brazil_database_path, reference_dir, n_partitions=8, workers=1):
+    """
+    Prepare the single product features of every product, writing one file per partition of products to
+    reference_dir/all_products. With more than one worker the partitions are processed in parallel.
+    """
+
+    output_dir = os.path.join(reference_dir, 'all_products')
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Remove the parts of a previous run, which may have used more partitions
+    for part_path in glob.glob(os.path.join(output_dir, '*_part_*.csv')):
+        os.remove(part_path)
+
+    supply_chain_conn = open_connection(supply_chain_database_path)
+    monthly = pricing_cube.load_pricing_cube(supply_chain_conn, 'month_product')
+    products = pricing_cube.load_pricing_cube(supply_chain_conn, 'product')
+    close_connection(supply_chain_conn)
+
+    olist_conn = open_connection(brazil_database_path)
+    olist_months = olist_extraction.extract_olist_product_monthly(olist_conn, get_olist_price_windows(products))
+    close_connection(olist_conn)
+
+    # The same encoding for every partition, whichever seasons it covers
+    seasonality_encoder = LabelEncoder().fit([classify_seasonality(month) for month in MONTH_NAMES])
+
+    partitions = get_product_partitions(monthly['Product Id'].to_numpy(), n_partitions)
+    olist_partitions = get_product_partitions(olist_months['Product Id'].to_numpy(), n_partitions)
+    tasks = [(partition, monthly[partitions == partition], olist_months[olist_partitions == partition], output_dir, seasonality_encoder)
+             for partition in np.unique(partitions)]
+
+    print(f"{nowtime()} Preparing {len(products)} products in {len(tasks)} partitions with {workers} workers...")
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(prepare_partition, *zip(*tasks)))
+    else:
+        results = [prepare_partition(*task) for task in tasks]
+
+    n_products, n_rows = np.sum(results, axis=0)
+    print(f"{nowtime()} Features of {n_products} products ({n_rows} product months) saved to {output_dir}.")
+
+    return
+
+@click.command()
+@click.argument('supply_chain_database_path', type=click.Path(exists=True))
+@click.argument('brazil_database_path', type=click.Path(exists=True))
+@click.argument('reference_dir', type=click.Path(exists=True))
+@click.option('--partitions', default=8, type=int, help='Number of product partitions written.')
+@click.option('--workers', default=1, type=int, help='Number of worker processes preparing the partitions.')
+
+def main(supply_chain_database_path, brazil_database_path, reference_dir, partitions, workers):
+
+    process_all_products(supply_chain_database_path, brazil_database_path, reference_dir, partitions, workers)
+
+    return
+
+if __name__ == '__main__':
+    main()
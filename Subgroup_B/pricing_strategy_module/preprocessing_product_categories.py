@@ -1,9 +1,12 @@
 import pandas as pd
 import numpy as np
 import sqlite3
-from sklearn.preprocessing import LabelEncoder
 import os
-import sql_queries
+import pricing_cube
+import feature_schema
+import pricing_features
+import olist_extraction
+import elasticity_estimation
 import click
 
 def nowtime():
@@ -22,14 +25,6 @@ def open_connection(database_path):
 
     return conn
 
-# Function to query data from a database
-def query_data(conn, query):
-
-    df = pd.read_sql_query(query, conn)
-    print(f"{nowtime()} Data extracted from database.")
-
-    return df
-
 # Function to close the sql connection
 def close_connection(conn):
         
@@ -54,45 +49,31 @@ def classify_seasonality(date):
         return 'Seasonal - Summer Sales'
     else:
         return 'Regular'
-    
-# Function to merge two dataframes on a specified column
-def merge_olist_df(df1, df2, column, method):
-    merged = df1.merge(df2, on=column, how=method)
-    return merged
+
+# Seasonality of every (month, day), looked up instead of classifying each date
+SEASONALITY_TABLE = pricing_features.get_seasonality_table(classify_seasonality)
 
 # Function to preprocess the data from the DataCo dataset
-def preprocess_dataco(all_data, reference_dir):
-    # Ensure 'Order Date' is in datetime format
-    all_data['Order Date'] = pd.to_datetime(all_data['Order Date'], errors='coerce')
-    all_data['Product Category'] = all_data['Product Category'].str.strip() # remove space at the end
-    all_data.rename(columns={'Product Category': 'Product_Category'}, inplace=True)
-    all_data["Final Price"] = round(all_data["Order Item Total"] / all_data["Total Quantity Purchased"], 2)
-
-    relevant_cols = ['Order Date','Order Month', 'Product Id', 'Product_Category', 'Order Item Discount', 
-                    'Order Item Discount Rate', 'Total Quantity Purchased', 
-                    'Sales', 'Order Item Total', 'Order Profit', 'Final Price']
-    dataco = all_data[relevant_cols]
-
-    dataco['Order Date'] = pd.to_datetime(dataco['Order Date'])
-    dataco = dataco[(dataco['Order Date'].dt.year >= 2016) & 
-                        (dataco['Order Date'].dt.year <= 2018)]
-
-    dataco = dataco.rename(columns={'Sales': 'price_before_discount'})
-    # we decided to remove so that prices can be better binned into price ranges
-    dataco = dataco[dataco['price_before_discount'] <= 800]
-
-    # binning into 20 price ranges
-    dataco['price_bins'] = dataco.groupby(['Product_Category'])['price_before_discount'].transform(
-        lambda x: pd.cut(x, bins=20, labels=False)
-    )
-
-    dataco = dataco.groupby(['Order Date', 'Order Month', 'Product_Category', 'price_bins']).agg({
-        'Order Item Discount': 'mean',
-        'Order Item Discount Rate': 'mean',
-        'Total Quantity Purchased': 'sum', # to represent product demand
-        'price_before_discount': 'mean', 
-        'Final Price' : 'mean'
-    }).reset_index()
+def preprocess_dataco(cube, reference_dir, elasticity_method='ratio'):
+    # The (day, category, price bin) rows of the pricing cube, with 'Order Date' as YYYYMMDD integers and 20 price ranges per category
+    # orders above 800 are left unbinned, we decided to remove them so that prices can be better binned into price ranges
+    cube = cube[cube['price_bins'] != pricing_cube.UNBINNED]
+    means = pricing_cube.get_cube_means(cube, ['discount_sum', 'discount_rate_sum', 'sales_sum', 'final_price_sum']).astype(np.float32)
+
+    dataco = pd.DataFrame({
+        'Order Date': cube['Order Date'],
+        'Order Month': cube['Order Month'],
+        'Product_Category': cube['Product_Category'],
+        'price_bins': cube['price_bins'],
+        'Order Item Discount': means['discount_sum'],
+        'Order Item Discount Rate': means['discount_rate_sum'],
+        'Total Quantity Purchased': cube['quantity'], # to represent product demand
+        'price_before_discount': means['sales_sum'],
+        'Final Price': means['final_price_sum']
+    }).reset_index(drop=True)
+
+    # Parse the integer dates once, on the aggregated rows only
+    dataco['Order Date'] = pd.to_datetime(dataco['Order Date'].astype(str), format='%Y%m%d')
 
     test_dataco = dataco.copy()
 
@@ -115,8 +96,8 @@ def preprocess_dataco(all_data, reference_dir):
     dataco = dataco.sort_values(by=['Product_Category', 'month_number', 'price_bins'])
 
     # Calculate the percentage change in 'avg_order_item_discount' and 'total_quantity_purchased' for each Product Category
-    dataco['discount_change'] = dataco.groupby(['Product_Category', 'price_bins'])['dataco_avg_item_discount'].pct_change().fillna(0)
-    dataco['quantity_change'] = dataco.groupby(['Product_Category', 'price_bins'])['dataco_demand'].pct_change().fillna(0)
+    dataco['discount_change'] = dataco.groupby(['Product_Category', 'price_bins'], observed=True)['dataco_avg_item_discount'].pct_change().fillna(0)
+    dataco['quantity_change'] = dataco.groupby(['Product_Category', 'price_bins'], observed=True)['dataco_demand'].pct_change().fillna(0)
 
     # Calculate the price elasticity of demand (PED) as: % change in quantity / % change in discount
     dataco['price_elasticity_of_demand'] = dataco['quantity_change'] / dataco['discount_change']
@@ -127,12 +108,16 @@ def preprocess_dataco(all_data, reference_dir):
     # Drop the 'month_number' column used for sorting
     dataco = dataco.drop(columns=['month_number'])
 
-    # allocating elastic/inelastic based on PED calculated
-    dataco['price_elasticity'] = dataco['price_elasticity_of_demand'].apply(
-        lambda x: 'Elastic' if abs(x) > 1 else ('Inelastic' if abs(x) < 1 else 'N/A')
-    )
+    if elasticity_method == 'loglog':
+        # Use the elasticity of the demand to the price fitted on each (category, price bin) instead of the month over month ratio
+        estimates = elasticity_estimation.estimate_elasticities(dataco, ['Product_Category', 'price_bins'], 'dataco_demand', 'Final Price')
+        estimates.to_csv(os.path.join(reference_dir, 'dataco_elasticity_estimates.csv'), index=False)
 
-    # manual reassign, since anything with PED=0 was automatically considered Inelastic
+        group_estimates = dataco[['Product_Category', 'price_bins']].merge(estimates, how='left', on=['Product_Category', 'price_bins'])
+        dataco['price_elasticity_of_demand'] = group_estimates['elasticity'].to_numpy()
+
+    # allocating elastic/inelastic based on PED calculated
+    # manual reassign for PED=0 (which would otherwise be considered Inelastic) and PED=1 (neither Elastic nor Inelastic)
     elasticity_mapping = {
         'Accessories': 'Inelastic', 'Baseball & Softball': 'Elastic', 'Boxing & MMA': 'Elastic',
         'Camping & Hiking': 'Elastic', 'Cardio Equipment': 'Elastic', 'Cleats': 'Elastic',
@@ -152,120 +137,53 @@ def preprocess_dataco(all_data, reference_dir):
         "Women's Clothing": 'Inelastic', 'Golf Accessories':'Inelastic'
     }
 
-    dataco.loc[dataco['price_elasticity_of_demand'] == 0, 'price_elasticity'] = dataco['Product_Category'].map(elasticity_mapping)
-    dataco['price_elasticity'] = dataco.apply(
-        lambda row: elasticity_mapping[row['Product_Category']] if row['price_elasticity'] == 'N/A' else row['price_elasticity'],
-        axis=1
-    )
+    dataco['price_elasticity'] = pricing_features.label_price_elasticity(dataco['price_elasticity_of_demand'], dataco['Product_Category'], elasticity_mapping)
     dataco = dataco.drop(columns=['Order Month', 'price_elasticity_of_demand'])
 
-    dataco['Seasonality'] = dataco['Order Date'].apply(classify_seasonality)
-    dataco['Order Date'] = pd.to_datetime(dataco['Order Date'])
-    dataco['Order Date'] = dataco['Order Date'].dt.strftime('%m-%Y')
+    dataco['Seasonality'] = pricing_features.label_seasonality(dataco['Order Date'], SEASONALITY_TABLE)
+    # Integer year-month key of the Olist merge
+    dataco['Order Period'] = dataco['Order Date'].dt.year * 100 + dataco['Order Date'].dt.month
+    dataco = dataco.drop(columns=['Order Date'])
 
     return dataco
 
-# Function to preprocess the data from the Olist dataset
-def preprocess_olist(olist):
-    olist['order_purchase_timestamp'] = pd.to_datetime(olist['order_purchase_timestamp'])
-    olist = olist[(olist['order_purchase_timestamp'].dt.year >= 2016) & 
-                        (olist['order_purchase_timestamp'].dt.year <= 2018)]
-
-    olist.drop(columns=['index_x', 'order_status','order_approved_at',
-        'order_delivered_carrier_date', 'order_delivered_customer_date',
-        'order_estimated_delivery_date', 'index_y', 'seller_id', 
-        'shipping_limit_date', 'freight_value','index', 'product_category_name',
-        'product_name_lenght', 'product_description_lenght',
-        'product_photos_qty', 'product_weight_g', 'product_length_cm',
-        'product_height_cm', 'product_width_cm', 'customer_id'], inplace=True)
-
-    olist = olist[olist['price_before_discount'] <= 800]
-    olist['order_purchase_timestamp'] = pd.to_datetime(olist['order_purchase_timestamp'])
-    olist['order_purchase_timestamp'] = olist['order_purchase_timestamp'].dt.strftime('%m-%Y')
-
-    mapping = {
-        'cool_stuff': 'As Seen on  TV!', 'pet_shop': 'Pet Supplies', 'furniture_decor': 'Garden', 'perfumery': 'Health and Beauty',
-        'garden_tools': 'Garden', 'housewares': 'Housewares', 'telephony': 'Consumer Electronics', 'health_beauty': 'Health and Beauty',
-        'books_technical': 'Books', 'fashion_bags_accessories': "Women's Apparel", 'bed_bath_table': 'Health and Beauty',
-        'sports_leisure': 'Sporting Goods', 'consoles_games': 'Video Games', 'office_furniture': 'Office Furniture',
-        'luggage_accessories': 'Accessories', 'food': 'Food', 'agro_industry_and_commerce': 'Industry and Commerce',
-        'electronics': 'Electronics', 'computers_accessories': 'Computers', 'construction_tools_construction': 'Construction Tools',
-        'audio': 'Consumer Electronics', 'baby': 'Baby', 'construction_tools_lights': 'Construction Tools', 'toys': 'Toys',
-        'stationery': 'Office Supplies', 'industry_commerce_and_business': 'Industry and Commerce', 'watches_gifts': 'Accessories',
-        'auto': 'Automotive', 'home_appliances': 'Home Appliances', 'kitchen_dining_laundry_garden_furniture': 'Housewares',
-        'air_conditioning': 'Home Appliances', 'home_confort': 'Housewares', 'fixed_telephony': 'Consumer Electronics',
-        'small_appliances_home_oven_and_coffee': 'Small Appliances', 'diapers_and_hygiene': 'Baby', 'signaling_and_security': 'Electronics',
-        'musical_instruments': 'Music', 'small_appliances': 'Small Appliances', 'costruction_tools_garden': 'Garden', 'art': 'Crafts',
-        'home_construction': 'Crafts', 'books_general_interest': 'Books', 'party_supplies': 'Party Supplies', 'construction_tools_safety': 'Construction Tools',
-        'cine_photo': 'Cameras', 'fashion_underwear_beach': "Women's Apparel", 'fashion_male_clothing': "Men's Clothing", 'food_drink': 'Food',
-        'drinks': 'Beverages', 'furniture_living_room': 'Furniture', 'market_place': 'Market Place', 'music': 'Music', 'fashion_shoes': "Women's Apparel",
-        'flowers': 'Garden', 'home_appliances_2': 'Home Appliances', 'fashio_female_clothing': "Women's Clothing", 'computers': 'Computers',
-        'books_imported': 'Books', 'christmas_supplies': 'Seasonal Items', 'furniture_bedroom': 'Furniture', 'home_comfort_2': 'Housewares',
-        'dvds_blu_ray': 'DVDs', 'cds_dvds_musicals': 'CDs', 'arts_and_craftmanship': 'Crafts', 'furniture_mattress_and_upholstery': 'Furniture',
-        'tablets_printing_image': 'Tablets & Accessories', 'costruction_tools_tools': 'Construction Tools', 'fashion_sport': 'Sporting Goods',
-        'la_cuisine': 'Kitchen', 'security_and_services': 'Electronics', 'fashion_childrens_clothes': "Children's Clothing"
-    }
-
-    olist['Product_Category'] = olist['product_category_name_english'].map(mapping)
-    olist = olist.drop(columns=['product_category_name_english'])
-
-    olist['price_bins'] = olist.groupby('Product_Category')['price_before_discount'].transform(
-        lambda x: pd.cut(x, bins=20, labels=False)
-    )
-
-    olist = olist.groupby(['order_purchase_timestamp', 'Product_Category', 'price_bins']).agg(
-        product_demand=('order_item_id', 'sum'),                     # Sum of 'order_item_id' as 'product_demand'
-        avg_price_before_discount=('price_before_discount', 'mean'), # Average of 'price_before_discount'
-        avg_discount_rate=('discount_rate', 'mean'),                 # Average of 'discount_rate'
-        avg_price_after_discount=('price_after_discount', 'mean')    # Average of 'price_after_discount'
-    ).reset_index()
-
-    olist = olist.rename(columns={'order_purchase_timestamp': 'Order Date', 'product_demand':'olist_product_demand', 'avg_price_before_discount':'olist_price_before_discount', })
-
-    return olist
-
-def process_supply_chain_data(supply_chain_database_path, reference_dir):
+def process_supply_chain_data(supply_chain_database_path, reference_dir, elasticity_method='ratio', reset_schema=False):
 
     supply_chain_conn = open_connection(supply_chain_database_path)
 
-    all_data = query_data(supply_chain_conn, sql_queries.supply_chain_query())
+    cube = pricing_cube.load_pricing_cube(supply_chain_conn, 'day_category_bin')
 
-    dataco = preprocess_dataco(all_data, reference_dir)
+    dataco = preprocess_dataco(cube, reference_dir, elasticity_method)
 
     close_connection(supply_chain_conn)
 
-    df_prep = dataco.drop(columns=['Order Date', 'dataco_avg_item_discount', 'dataco_price_before', 'discount_change', 'quantity_change'])
+    df_prep = dataco.drop(columns=['Order Period', 'dataco_avg_item_discount', 'dataco_price_before', 'discount_change', 'quantity_change'])
 
-    # Use one-hot encoding to create binary columns for each unique category in 'Seasonality' and 'elasticity'
-    df_prep = pd.get_dummies(df_prep, columns=['Seasonality', 'price_elasticity'], drop_first=True)
+    # Encode with the categories and levels of the previous runs, only adding the new ones, so that the codes and columns do not move
+    schema = feature_schema.load_feature_schema(reference_dir, reset_schema)
+    schema = feature_schema.update_feature_schema(schema, categories={'Product_Category': dataco['Product_Category']},
+                                                  dummies={'Seasonality': dataco['Seasonality'], 'price_elasticity': dataco['price_elasticity']})
 
-    le = LabelEncoder()
-    df_prep['Product_Category_Encoded'] = le.fit_transform(df_prep['Product_Category'])
+    # Use one-hot encoding to create binary columns for each known category in 'Seasonality' and 'elasticity'
+    df_prep = feature_schema.encode_dummies(df_prep, schema, ['Seasonality', 'price_elasticity'])
+
+    df_prep['Product_Category_Encoded'] = feature_schema.encode_categories(df_prep['Product_Category'], schema, 'Product_Category')
     df_prep = df_prep.drop(columns=['Product_Category'])
+    df_prep = feature_schema.order_columns(df_prep, schema, 'dataco_prepped.csv')
 
     df_prep.to_csv(os.path.join(reference_dir, 'dataco_prepped.csv'), index=False)
+    feature_schema.save_feature_schema(schema, reference_dir)
 
     print(f"{nowtime()} DataCo data preprocessed.")
 
-    return dataco, le 
+    return dataco, schema
 
 def process_olist_data(olist_database_path):
 
     olist_conn = open_connection(olist_database_path)
 
-    olist_items = query_data(olist_conn, sql_queries.olist_query1())
-    olist_products = query_data(olist_conn, sql_queries.olist_query2())
-    olist_translate = query_data(olist_conn, sql_queries.olist_query3())
-    olist_orders = query_data(olist_conn, sql_queries.olist_query4())
-
-    olist_translated = merge_olist_df(olist_products, olist_translate, 'product_category_name', 'inner')
-    olist_translated = olist_translated[['product_id', 'product_category_name_english']]
-
-    olist = merge_olist_df(olist_orders, olist_items, 'order_id', 'inner')
-    olist = merge_olist_df(olist, olist_products, 'product_id', 'inner')
-    olist = merge_olist_df(olist, olist_translated, 'product_id', 'inner')
-
-    olist = preprocess_olist(olist)
+    # The joins, filters, price binning and aggregation run in SQLite
+    olist = olist_extraction.extract_olist_price_bins(olist_conn)
 
     close_connection(olist_conn)
 
@@ -273,19 +191,26 @@ def process_olist_data(olist_database_path):
 
     return olist
 
-def merge_dataco_olist(dataco, olist, le, reference_dir):
+def merge_dataco_olist(dataco, olist, schema, reference_dir):
+
+    # Join on integer category codes and year-months, the Olist categories unknown to DataCo get the code -1 and match no row
+    dataco = dataco.assign(Product_Category_Encoded=feature_schema.encode_categories(dataco['Product_Category'], schema, 'Product_Category'))
+    olist_codes = feature_schema.encode_categories(olist['Product_Category'], schema, 'Product_Category')
+    olist = olist.drop(columns=['Product_Category']).assign(Product_Category_Encoded=olist_codes)
 
-    merged_df = pd.merge(dataco, olist, on=['Product_Category', 'Order Date', 'price_bins'], how='left')
+    merged_df = pd.merge(dataco, olist, on=['Product_Category_Encoded', 'Order Period', 'price_bins'], how='left')
     merged_df = merged_df.fillna(0)
 
-    merged_df['Product_Category_Encoded'] = le.fit_transform(merged_df['Product_Category'])
-    merged_prep = merged_df.drop(columns=['Order Date', 'Product_Category', 'dataco_avg_item_discount', 'dataco_price_before', 'discount_change', 'quantity_change',
+    merged_df['Product_Category_Encoded'] = merged_df.pop('Product_Category_Encoded')
+    merged_prep = merged_df.drop(columns=['Order Period', 'Product_Category', 'dataco_avg_item_discount', 'dataco_price_before', 'discount_change', 'quantity_change',
                                         'avg_price_after_discount'])
 
-    merged_prep = pd.get_dummies(merged_prep, columns=['Seasonality', 'price_elasticity'], drop_first=True)
+    merged_prep = feature_schema.encode_dummies(merged_prep, schema, ['Seasonality', 'price_elasticity'])
     merged_prep = merged_prep.rename(columns={'avg_discount_rate': 'olist_avg_discount_rate'})
+    merged_prep = feature_schema.order_columns(merged_prep, schema, 'dataco_olist_prepped.csv')
 
     merged_prep.to_csv(os.path.join(reference_dir, 'dataco_olist_prepped.csv'), index=False)
+    feature_schema.save_feature_schema(schema, reference_dir)
 
     print(f"{nowtime()} DataCo and Olist data merged and preprocessed.")
 
@@ -295,14 +220,18 @@ def merge_dataco_olist(dataco, olist, le, reference_dir):
 @click.argument('supply_chain_database_path', type=click.Path(exists=True))
 @click.argument('olist_database_path', type=click.Path(exists=True))
 @click.argument('reference_dir', type=click.Path(exists=True))
+@click.option('--elasticity-method', default='ratio', type=click.Choice(elasticity_estimation.ELASTICITY_METHODS),
+              help='ratio: month over month % change in demand over % change in discount. loglog: log-log price elasticity fitted per category and price bin.')
+@click.option('--reset-feature-schema', is_flag=True, default=False,
+              help='Refit the category codes, dummy levels and column orders instead of reusing those saved in reference_dir.')
 
-def main(supply_chain_database_path, olist_database_path, reference_dir):
+def main(supply_chain_database_path, olist_database_path, reference_dir, elasticity_method, reset_feature_schema):
 
-    dataco, le = process_supply_chain_data(supply_chain_database_path, reference_dir)
+    dataco, schema = process_supply_chain_data(supply_chain_database_path, reference_dir, elasticity_method, reset_feature_schema)
 
     olist = process_olist_data(olist_database_path)
 
-    merge_dataco_olist(dataco, olist, le, reference_dir)
+    merge_dataco_olist(dataco, olist, schema, reference_dir)
 
     return
 
@@ -2,7 +2,8 @@ import pandas as pd
 import numpy as np
 import sqlite3
 from sklearn.preprocessing import LabelEncoder
-import sql_queries
+import pricing_cube
+import olist_extraction
 import os
 import click
 
@@ -12,6 +13,14 @@ def nowtime():
 
     return f"[{time}]"
 
+# Product priced by this module
+SINGLE_PRODUCT_NAME = "Perfect Fitness Perfect Rip Deck"
+
+# Olist category and price range closest to the product
+OLIST_CATEGORY = 'Sporting Goods'
+OLIST_MIN_PRICE = 30
+OLIST_MAX_PRICE = 90
+
 ##### SQL FUNCTIONS #####
 
 # Function to connect to a database
@@ -22,14 +31,6 @@ def open_connection(database_path):
 
     return conn
 
-# Function to query data from a database
-def query_data(conn, query):
-
-    df = pd.read_sql_query(query, conn)
-    print(f"{nowtime()} Data extracted from database.")
-
-    return df
-
 # Function to close the sql connection
 def close_connection(conn):
         
@@ -40,41 +41,26 @@ def close_connection(conn):
 
 ##### DATA PREPROCESSING #####
 
-# Function to preprocess the DataCo data
-def preprocess_single_product_dataco(all_data):
-    # Ensure 'Order Date' is in datetime format
-    all_data['Order Date'] = pd.to_datetime(all_data['Order Date'], errors='coerce')
-    all_data['Product Category'] = all_data['Product Category'].str.strip() # remove space at the end
-    all_data.rename(columns={'Product Category': 'Product_Category'}, inplace=True)
-    all_data["Final Price"] = round(all_data["Order Item Total"] / all_data["Total Quantity Purchased"], 2)
-
-    relevant_cols = ['Index','Order Date','Order Month', 'Product Id','Product Name', 'Product_Category', 'Order Item Discount', 
-                    'Order Item Discount Rate', 'Total Quantity Purchased', 
-                    'Sales', 'Order Item Total', 'Order Profit', 'Final Price']
-    dataco = all_data[relevant_cols]
-
-    dataco['Order Date'] = pd.to_datetime(dataco['Order Date'])
-    dataco = dataco[(dataco['Order Date'].dt.year >= 2016) & 
-                        (dataco['Order Date'].dt.year <= 2018)]
-
-    dataco = dataco.rename(columns={'Sales': 'price_before_discount'})
-
-    # preparing single product data
-    # Filter the DataFrame based on the Product Name
-    dataco_filtered = dataco[dataco['Product Name'] == "Perfect Fitness Perfect Rip Deck"]
-
-    dataco_filtered['Order Item Discount'] = dataco_filtered['Order Item Discount']/dataco_filtered['Total Quantity Purchased']
-    dataco_filtered['Order Item Discount Rate'] = dataco_filtered['Order Item Discount Rate']/dataco_filtered['Total Quantity Purchased']
-    dataco_filtered['price_before_discount'] = dataco_filtered['price_before_discount']/dataco_filtered['Total Quantity Purchased']
-    dataco_filtered['Order Item Total'] = dataco_filtered['Order Item Total']/dataco_filtered['Total Quantity Purchased']
-
-    dataco_filtered_agg = dataco_filtered.groupby(['Order Month']).agg({
-        'Order Item Discount': 'mean',
-        'Order Item Discount Rate': 'mean',
-        'Total Quantity Purchased': 'sum', # to represent product demand
-        'price_before_discount': 'mean', 
-        'Final Price' : 'mean'
-    }).reset_index()
+# Function to preprocess the DataCo data of one or more products
+def preprocess_products_dataco(monthly, product_keys=[]):
+    """
+    Average the (month, product) rows of the pricing cube and compute the month over month PED of every product in one grouped pass.
+
+    Parameters:
+    - monthly: month_product rows of the pricing cube.
+    - product_keys: Columns identifying a product, kept in the output. Empty when all the rows are of one product.
+    """
+
+    # The discounts and the price before discount are averaged per item purchased
+    means = pricing_cube.get_cube_means(monthly, ['unit_discount_sum', 'unit_discount_rate_sum', 'unit_price_sum', 'final_price_sum'])
+
+    dataco_filtered_agg = monthly[product_keys + ['Order Month']].assign(**{
+        'Order Item Discount': means['unit_discount_sum'],
+        'Order Item Discount Rate': means['unit_discount_rate_sum'],
+        'Total Quantity Purchased': monthly['quantity'], # to represent product demand
+        'price_before_discount': means['unit_price_sum'],
+        'Final Price': means['final_price_sum'].astype(np.float32)
+    }).reset_index(drop=True)
 
     dataco_filtered_agg.rename(columns={'Order Item Discount': 'dataco_avg_item_discount', 'Order Item Discount Rate': 'dataco_avg_item_discount_rate', 'Total Quantity Purchased': 'dataco_demand', 'price_before_discount': 'dataco_price_before'}, inplace=True)
 
@@ -89,12 +75,18 @@ def preprocess_single_product_dataco(all_data):
     # Apply this mapping to a new column for sorting
     dataco_filtered_agg['month_number'] = dataco_filtered_agg['Order Month'].map(month_order)
 
-    # Sort by Product Category and Order Month (numerically)
-    dataco_filtered_agg = dataco_filtered_agg.sort_values(by=['month_number'])
+    # Sort by product and Order Month (numerically)
+    dataco_filtered_agg = dataco_filtered_agg.sort_values(by=product_keys + ['month_number'])
 
-    # Calculate the percentage change in 'avg_order_item_discount' and 'total_quantity_purchased' for each Product Category
-    dataco_filtered_agg['discount_change'] = dataco_filtered_agg['dataco_avg_item_discount'].pct_change().fillna(0)
-    dataco_filtered_agg['quantity_change'] = dataco_filtered_agg['dataco_demand'].pct_change().fillna(0)
+    # Calculate the percentage change in 'avg_order_item_discount' and 'total_quantity_purchased' for each product
+    if product_keys:
+        products = dataco_filtered_agg.groupby(product_keys, observed=True)
+        discount, demand = products['dataco_avg_item_discount'], products['dataco_demand']
+    else:
+        discount, demand = dataco_filtered_agg['dataco_avg_item_discount'], dataco_filtered_agg['dataco_demand']
+
+    dataco_filtered_agg['discount_change'] = discount.pct_change().fillna(0)
+    dataco_filtered_agg['quantity_change'] = demand.pct_change().fillna(0)
 
     # Calculate the price elasticity of demand (PED) as: % change in quantity / % change in discount
     dataco_filtered_agg['price_elasticity_of_demand'] = dataco_filtered_agg['quantity_change'] / dataco_filtered_agg['discount_change']
@@ -109,66 +101,10 @@ def preprocess_single_product_dataco(all_data):
 
     return dataco_filtered_agg
 
-# Function to preprocess the Olist data
-def preprocess_single_product_olist(olist):
-    olist['order_purchase_timestamp'] = pd.to_datetime(olist['order_purchase_timestamp'])
-    olist = olist[(olist['order_purchase_timestamp'].dt.year >= 2016) & 
-                        (olist['order_purchase_timestamp'].dt.year <= 2018)]
-
-    olist.drop(columns=['index_x', 'order_status','order_approved_at',
-        'order_delivered_carrier_date', 'order_delivered_customer_date',
-        'order_estimated_delivery_date', 'index_y', 'seller_id', 
-        'shipping_limit_date', 'freight_value','index', 'product_category_name',
-        'product_name_lenght', 'product_description_lenght',
-        'product_photos_qty', 'product_weight_g', 'product_length_cm',
-        'product_height_cm', 'product_width_cm', 'customer_id'], inplace=True)
-
-    olist['order_purchase_timestamp'] = pd.to_datetime(olist['order_purchase_timestamp'])
-    olist['order_purchase_timestamp'] = olist['order_purchase_timestamp'].dt.strftime('%m-%Y')
-
-    mapping = {
-        'cool_stuff': 'As Seen on  TV!', 'pet_shop': 'Pet Supplies', 'furniture_decor': 'Garden', 'perfumery': 'Health and Beauty',
-        'garden_tools': 'Garden', 'housewares': 'Housewares', 'telephony': 'Consumer Electronics', 'health_beauty': 'Health and Beauty',
-        'books_technical': 'Books', 'fashion_bags_accessories': "Women's Apparel", 'bed_bath_table': 'Health and Beauty',
-        'sports_leisure': 'Sporting Goods', 'consoles_games': 'Video Games', 'office_furniture': 'Office Furniture',
-        'luggage_accessories': 'Accessories', 'food': 'Food', 'agro_industry_and_commerce': 'Industry and Commerce',
-        'electronics': 'Electronics', 'computers_accessories': 'Computers', 'construction_tools_construction': 'Construction Tools',
-        'audio': 'Consumer Electronics', 'baby': 'Baby', 'construction_tools_lights': 'Construction Tools', 'toys': 'Toys',
-        'stationery': 'Office Supplies', 'industry_commerce_and_business': 'Industry and Commerce', 'watches_gifts': 'Accessories',
-        'auto': 'Automotive', 'home_appliances': 'Home Appliances', 'kitchen_dining_laundry_garden_furniture': 'Housewares',
-        'air_conditioning': 'Home Appliances', 'home_confort': 'Housewares', 'fixed_telephony': 'Consumer Electronics',
-        'small_appliances_home_oven_and_coffee': 'Small Appliances', 'diapers_and_hygiene': 'Baby', 'signaling_and_security': 'Electronics',
-        'musical_instruments': 'Music', 'small_appliances': 'Small Appliances', 'costruction_tools_garden': 'Garden', 'art': 'Crafts',
-        'home_construction': 'Crafts', 'books_general_interest': 'Books', 'party_supplies': 'Party Supplies', 'construction_tools_safety': 'Construction Tools',
-        'cine_photo': 'Cameras', 'fashion_underwear_beach': "Women's Apparel", 'fashion_male_clothing': "Men's Clothing", 'food_drink': 'Food',
-        'drinks': 'Beverages', 'furniture_living_room': 'Furniture', 'market_place': 'Market Place', 'music': 'Music', 'fashion_shoes': "Women's Apparel",
-        'flowers': 'Garden', 'home_appliances_2': 'Home Appliances', 'fashio_female_clothing': "Women's Clothing", 'computers': 'Computers',
-        'books_imported': 'Books', 'christmas_supplies': 'Seasonal Items', 'furniture_bedroom': 'Furniture', 'home_comfort_2': 'Housewares',
-        'dvds_blu_ray': 'DVDs', 'cds_dvds_musicals': 'CDs', 'arts_and_craftmanship': 'Crafts', 'furniture_mattress_and_upholstery': 'Furniture',
-        'tablets_printing_image': 'Tablets & Accessories', 'costruction_tools_tools': 'Construction Tools', 'fashion_sport': 'Sporting Goods',
-        'la_cuisine': 'Kitchen', 'security_and_services': 'Electronics', 'fashion_childrens_clothes': "Children's Clothing"
-    }
-
-    olist['Product_Category'] = olist['product_category_name_english'].map(mapping)
-    olist = olist.drop(columns=['product_category_name_english'])
-
-    # filter to get as close products to dataco as possible
-    olist_filtered = olist[(olist['price_before_discount'] >= 30) & (olist['price_before_discount'] <= 90) & (olist['Product_Category']=="Sporting Goods")]
-    olist_filtered['order_purchase_timestamp'] = pd.to_datetime(olist_filtered['order_purchase_timestamp'], format='%m-%Y')
-    olist_filtered['Order Month'] = olist_filtered['order_purchase_timestamp'].dt.strftime('%B')
-
-    olist_filtered_agg = olist_filtered.groupby(['Order Month']).agg(
-        product_demand=('order_item_id', 'sum'),                     # Sum of 'order_item_id' as 'product_demand'
-        avg_price_before_discount=('price_before_discount', 'mean'), # Average of 'price_before_discount'
-        avg_discount_rate=('discount_rate', 'mean'),                 # Average of 'discount_rate'
-        avg_price_after_discount=('price_after_discount', 'mean')    # Average of 'price_after_discount'
-    ).reset_index()
-
-    olist_filtered_agg = olist_filtered_agg.rename(columns={'product_demand':'olist_product_demand', 'avg_price_before_discount':'olist_price_before_discount', 'avg_discount_rate':'olist_avg_discount_rate', 'avg_price_after_discount':'olist_avg_price_after_discount'})
-
-    print(f"{nowtime()} Olist data preprocessed.")
-
-    return olist_filtered_agg
+# Function to preprocess the DataCo data of the single product
+def preprocess_single_product_dataco(monthly):
+    # The cube rows of the product already cover its 2016-2018 orders only
+    return preprocess_products_dataco(monthly)
 
 # Function to classify the seasonality of a month
 def classify_seasonality(month_name):
@@ -183,11 +119,6 @@ def classify_seasonality(month_name):
     else:
         return 'Regular'
     
-# Function to merge two DataFrames
-def merge_olist_df(df1, df2, column, method):
-    merged = df1.merge(df2, on=column, how=method)
-    return merged
-    
 # Function to preprocess the DataCo data
 def process_supply_chain_data(supply_chain_database_path, reference_dir):
 
@@ -195,10 +126,10 @@ def process_supply_chain_data(supply_chain_database_path, reference_dir):
     supply_chain_conn = open_connection(supply_chain_database_path)
 
     # Extract data from the database
-    all_data = query_data(supply_chain_conn, sql_queries.supply_chain_query())
+    monthly = pricing_cube.load_pricing_cube(supply_chain_conn, 'month_product', product_name=SINGLE_PRODUCT_NAME)
 
     # Preprocess the DataCo data
-    dataco_filtered_agg = preprocess_single_product_dataco(all_data)
+    dataco_filtered_agg = preprocess_single_product_dataco(monthly)
 
     # Apply 
     single_product_df_prep = dataco_filtered_agg.copy()
@@ -221,19 +152,8 @@ def process_olist_data(brazil_database_path, reference_dir, dataco_filtered_agg)
 
     olist_conn = open_connection(brazil_database_path)
 
-    olist_items = query_data(olist_conn, sql_queries.olist_query1())
-    olist_products = query_data(olist_conn, sql_queries.olist_query2())
-    olist_translate = query_data(olist_conn, sql_queries.olist_query3())
-    olist_orders = query_data(olist_conn, sql_queries.olist_query4())
-
-    olist_translated = merge_olist_df(olist_products, olist_translate, 'product_category_name', 'inner')
-    olist_translated = olist_translated[['product_id', 'product_category_name_english']]
-
-    olist = merge_olist_df(olist_orders, olist_items, 'order_id', 'inner')
-    olist = merge_olist_df(olist, olist_products, 'product_id', 'inner')
-    olist = merge_olist_df(olist, olist_translated, 'product_id', 'inner')
-
-    olist_filtered_agg = preprocess_single_product_olist(olist)
+    # Olist items priced like the product, aggregated by month in SQLite
+    olist_filtered_agg = olist_extraction.extract_olist_monthly(olist_conn, OLIST_CATEGORY, OLIST_MIN_PRICE, OLIST_MAX_PRICE)
 
     merged_df = pd.merge(dataco_filtered_agg, olist_filtered_agg, on=['Order Month'], how='left')
     merged_df = merged_df.fillna(0)
@@ -0,0 +1,272 @@
+import pandas as pd
+import numpy as np
+from sklearn.tree import DecisionTreeRegressor
+import joblib
+import os
+import click
+import pricing_cube
+import feature_schema
+from preprocessing_product_categories import nowtime, open_connection, close_connection
+
+# Columns of the prepped files the engine works with
+SEGMENT_KEYS = ['Product_Category_Encoded', 'price_bins']
+DEMAND_COLUMN = 'dataco_demand'
+DISCOUNT_COLUMN = 'dataco_avg_item_discount_rate'
+PRICE_COLUMN = 'Final Price'
+
+OBJECTIVES = ['revenue', 'profit']
+
+# Demand model saved to pricing_results_dir and reused by the later runs
+DEMAND_MODEL_FILE = 'demand_model.pkl'
+
+
+##### DEMAND MODEL FUNCTIONS #####
+
+def train_demand_model(df_prep, max_depth=8):
+    """
+    Fit a decision tree predicting the demand of a (category, price bin) month from the other prepped features,
+    which include the discount rate and the Final Price the engine varies.
+    """
+
+    X = df_prep.drop(columns=[DEMAND_COLUMN])
+    y = df_prep[DEMAND_COLUMN]
+
+    model = DecisionTreeRegressor(max_depth=max_depth, random_state=42)
+    model.fit(X, y)
+
+    print(f"{nowtime()} Demand model trained on {len(X)} rows and {X.shape[1]} features.")
+
+    return model
+
+def check_model_features(model, df_prep):
+    """
+    Check that the demand model was fitted on the features of the prepped file, i.e. every prepped column but the
+    demand, including the discount rate the engine varies.
+    """
+
+    model_columns = list(getattr(model, 'feature_names_in_', []))
+    prepped_columns = [column for column in df_prep.columns if column != DEMAND_COLUMN]
+
+    missing = [column for column in prepped_columns if column not in model_columns]
+    extra = [column for column in model_columns if column not in prepped_columns]
+
+    if missing or extra:
+        raise ValueError(f"The demand model does not match the prepped features, missing features: {missing}, unexpected features: {extra}. "
+                         "Retrain it with --retrain-model or pass a matching --model-path.")
+    if DISCOUNT_COLUMN not in model_columns:
+        raise ValueError(f"The demand model has no '{DISCOUNT_COLUMN}' feature to evaluate the candidate discounts on.")
+
+    return
+
+def get_demand_model(df_prep, pricing_results_dir, model_path=None, retrain=False):
+    """
+    Load the demand model at model_path, or else the one saved in pricing_results_dir by a previous run. A model is
+    only trained on the prepped features, and saved to pricing_results_dir, when retrain is set or none was saved yet.
+    """
+
+    if model_path is not None:
+        if retrain:
+            raise ValueError("A demand model to load and retraining the model cannot be both requested.")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"No demand model found at {model_path}.")
+    else:
+        model_path = os.path.join(pricing_results_dir, DEMAND_MODEL_FILE)
+
+        if retrain or not os.path.exists(model_path):
+            model = train_demand_model(df_prep)
+            joblib.dump(model, model_path)
+            print(f"{nowtime()} Demand model saved to {model_path}")
+
+            return model
+
+    model = joblib.load(model_path)
+    print(f"{nowtime()} Demand model loaded from {model_path}")
+
+    check_model_features(model, df_prep)
+
+    return model
+
+##### SEGMENT FUNCTIONS #####
+
+def get_segment_prices(cube, schema):
+    """
+    Get the unit list price, unit cost and current discount rate of every (category, price bin) from the category_bin
+    rows of the pricing cube, encoding the categories with the feature schema of the prepped files.
+    """
+
+    cube = cube[cube['price_bins'] != pricing_cube.UNBINNED]
+    means = pricing_cube.get_cube_means(cube, ['unit_price_sum', 'unit_cost_sum', 'discount_rate_sum'])
+
+    segments = cube[['Product_Category', 'price_bins']].assign(
+        list_price=means['unit_price_sum'],
+        unit_cost=means['unit_cost_sum'],
+        current_discount_rate=means['discount_rate_sum']
+    ).reset_index(drop=True)
+    segments['Product_Category_Encoded'] = feature_schema.encode_categories(segments['Product_Category'], schema, 'Product_Category')
+
+    return segments
+
+def get_segment_features(df_prep, feature_columns, seasonality='Regular'):
+    """
+    Build the baseline feature row of every (category, price bin) from its prepped months: the mean of the numeric
+    features, the most frequent value of the dummy columns, and the Seasonality dummies of the season priced for.
+    The discount and price columns are overwritten by the engine.
+
+    Returns:
+    - DataFrame with the segment keys and feature_columns, one row per segment.
+    """
+
+    segment_features = df_prep.groupby(SEGMENT_KEYS)[[column for column in feature_columns if column not in SEGMENT_KEYS]].mean()
+
+    dummy_columns = [column for column in segment_features.columns if df_prep[column].dtype == bool]
+    segment_features[dummy_columns] = segment_features[dummy_columns] >= 0.5
+
+    season_columns = [column for column in feature_columns if column.startswith('Seasonality_')]
+    for column in season_columns:
+        segment_features[column] = column == f'Seasonality_{seasonality}'
+
+    return segment_features.reset_index()
+
+def get_segments(supply_chain_database_path, schema, df_prep, feature_columns, seasonality='Regular'):
+    """
+    Get the baseline feature row, unit list price and unit cost of every (category, price bin) found both in the
+    prepped features and in the pricing cube. The season priced for has to be a Seasonality level of the feature
+    schema, any other season would get the dummies of the dropped reference season.
+    """
+
+    seasons = schema['dummies']['Seasonality']
+    if seasonality not in seasons:
+        raise ValueError(f"Unknown seasonality '{seasonality}'. Choose from {seasons}.")
+
+    supply_chain_conn = open_connection(supply_chain_database_path)
+    cube = pricing_cube.load_pricing_cube(supply_chain_conn, 'category_bin')
+    close_connection(supply_chain_conn)
+
+    segment_prices = get_segment_prices(cube, schema)
+    segment_features = get_segment_features(df_prep, feature_columns, seasonality)
+
+    return segment_features.merge(segment_prices, how='inner', on=SEGMENT_KEYS)
+
+##### OPTIMIZATION FUNCTIONS #####
+
+def evaluate_price_grid(model, segment_features, list_prices, unit_costs, discount_grid, batch_rows=1_000_000):
+    """
+    Predict the demand of every segment at every candidate discount, scoring the segment x discount rows in batches
+    of at most batch_rows rows, one predict call each.
+
+    Parameters:
+    - model: Fitted regressor with feature_names_in_.
+    - segment_features: Baseline feature rows of the segments, with the model's feature columns.
+    - list_prices, unit_costs: Arrays of the unit list price and unit cost of each segment.
+    - discount_grid: Array of the candidate discount rates.
+
+    Returns:
+    - Dictionary of arrays of shape (segments, candidates): price, demand, revenue and profit.
+    """
+
+    feature_columns = list(getattr(model, 'feature_names_in_', []))
+    if DISCOUNT_COLUMN not in feature_columns:
+        raise ValueError(f"The demand model has no '{DISCOUNT_COLUMN}' feature to evaluate the candidate discounts on.")
+
+    features = segment_features[feature_columns].to_numpy(dtype=float)
+    discount_index = feature_columns.index(DISCOUNT_COLUMN)
+    price_index = feature_columns.index(PRICE_COLUMN) if PRICE_COLUMN in feature_columns else None
+
+    n_segments, n_candidates = len(features), len(discount_grid)
+    prices = list_prices[:, None] * (1 - discount_grid[None, :])
+    demand = np.empty((n_segments, n_candidates))
+
+    segments_per_batch = max(1, batch_rows // n_candidates)
+    for start in range(0, n_segments, segments_per_batch):
+        stop = min(start + segments_per_batch, n_segments)
+
+        # Every segment's row repeated once per candidate discount
+        X = np.repeat(features[start:stop], n_candidates, axis=0)
+        X[:, discount_index] = np.tile(discount_grid, stop - start)
+        if price_index is not None:
+            X[:, price_index] = prices[start:stop].ravel()
+
+        demand[start:stop] = model.predict(pd.DataFrame(X, columns=feature_columns)).reshape(stop - start, n_candidates)
+
+    demand = np.clip(demand, 0, None)
+
+    return {
+        'price': prices,
+        'demand': demand,
+        'revenue': prices * demand,
+        'profit': (prices - unit_costs[:, None]) * demand
+    }
+
+def optimize_prices(model, segments, discount_grid, objective='revenue', batch_rows=1_000_000):
+    """
+    Find the discount maximising the predicted revenue or profit of every segment over discount_grid.
+
+    Parameters:
+    - model: Fitted demand regressor with feature_names_in_.
+    - segments: DataFrame with the segment keys, the model's feature columns, list_price and unit_cost.
+    - discount_grid: Array of the candidate discount rates.
+    - objective: 'revenue' or 'profit'.
+
+    Returns:
+    - DataFrame of segments with the optimal discount, price, demand, revenue and profit.
+    """
+
+    grid = evaluate_price_grid(model, segments, segments['list_price'].to_numpy(dtype=float), segments['unit_cost'].to_numpy(dtype=float),
+                               discount_grid, batch_rows)
+
+    best = np.argmax(grid[objective], axis=1)
+    rows = np.arange(len(best))
+
+    optimal_prices = segments[['Product_Category', *SEGMENT_KEYS, 'list_price', 'unit_cost', 'current_discount_rate']].copy()
+    optimal_prices['optimal_discount_rate'] = discount_grid[best]
+    optimal_prices['optimal_price'] = grid['price'][rows, best]
+    optimal_prices['predicted_demand'] = grid['demand'][rows, best]
+    optimal_prices['predicted_revenue'] = grid['revenue'][rows, best]
+    optimal_prices['predicted_profit'] = grid['profit'][rows, best]
+
+    print(f"{nowtime()} Optimal {objective} prices found for {len(optimal_prices)} segments over {len(discount_grid)} candidate discounts.")
+
+    return optimal_prices
+
+def run_price_optimization(supply_chain_database_path, reference_dir, pricing_results_dir, prepped_file='dataco_prepped.csv', model_path=None, retrain_model=False,
+                           objective='revenue', min_discount=0.0, max_discount=0.5, grid_size=201, seasonality='Regular', batch_rows=1_000_000):
+
+    df_prep = pd.read_csv(os.path.join(reference_dir, prepped_file))
+    model = get_demand_model(df_prep, pricing_results_dir, model_path, retrain_model)
+
+    schema = feature_schema.load_feature_schema(reference_dir)
+    segments = get_segments(supply_chain_database_path, schema, df_prep, list(model.feature_names_in_), seasonality)
+
+    discount_grid = np.linspace(min_discount, max_discount, grid_size)
+    optimal_prices = optimize_prices(model, segments, discount_grid, objective, batch_rows)
+
+    optimal_prices.to_csv(os.path.join(pricing_results_dir, 'optimal_prices.csv'), index=False)
+    print(f"{nowtime()} Optimal prices saved to {pricing_results_dir}")
+
+    return optimal_prices
+
+@click.command()
+@click.argument('supply_chain_database_path', type=click.Path(exists=True))
+@click.argument('reference_dir', type=click.Path(exists=True))
+@click.argument('pricing_results_dir', type=click.Path(exists=True))
+@click.option('--prepped-file', default='dataco_prepped.csv', type=click.Choice(['dataco_prepped.csv', 'dataco_olist_prepped.csv']),
+              help='Prepped features of reference_dir the demand model is trained on and the segments are built from.')
+@click.option('--model-path', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Fitted demand model to load. Defaults to the model saved in pricing_results_dir, a decision tree being trained on the prepped file if there is none.')
+@click.option('--retrain-model', is_flag=True, default=False, help='Train the demand model on the prepped file again and save it to pricing_results_dir.')
+@click.option('--objective', default='revenue', type=click.Choice(OBJECTIVES), help='Quantity maximised by the optimal price of each segment.')
+@click.option('--min-discount', default=0.0, type=float, help='Smallest candidate discount rate.')
+@click.option('--max-discount', default=0.5, type=float, help='Largest candidate discount rate.')
+@click.option('--grid-size', default=201, type=int, help='Number of candidate discount rates.')
+@click.option('--seasonality', default='Regular', type=str, help='Season the prices are optimized for, one of the Seasonality levels of the feature schema.')
+@click.option('--batch-rows', default=1_000_000, type=int, help='Maximum number of segment x discount rows scored per predict call.')
+
+def main(supply_chain_database_path, reference_dir, pricing_results_dir, prepped_file, model_path, retrain_model, objective, min_discount, max_discount, grid_size, seasonality, batch_rows):
+
+    run_price_optimization(supply_chain_database_path, reference_dir, pricing_results_dir, prepped_file, model_path, retrain_model,
+                           objective, min_discount, max_discount, grid_size, seasonality, batch_rows)
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import pandas as pd
+import numpy as np
+import sqlite3
+import click
+import pricing_data_loader
+import pricing_features
+import sql_queries
+
+CUBE_TABLE = 'pricing_cube'
+
+# Table holding the fingerprint of the orders the cube was built from
+CUBE_SOURCE_TABLE = 'pricing_cube_source'
+
+# Columns of cleaned_order_data aggregated into the cube
+CUBE_COLUMNS = ['Order Date', 'Order Month', 'Product Id', 'Product Name', 'Product Category', 'Order Item Discount',
+                'Order Item Discount Rate', 'Total Quantity Purchased', 'Sales', 'Order Item Total', 'Order Profit']
+
+# Keys of every granularity of the cube, the first one being the grain the orders are aggregated to
+CUBE_GRAINS = {
+    'day_product_bin': ['Order Date', 'Order Month', 'Product Id', 'Product Name', 'Product_Category', 'price_bins'],
+    'day_category_bin': ['Order Date', 'Order Month', 'Product_Category', 'price_bins'],
+    'month_category_bin': ['Order Month', 'Product_Category', 'price_bins'],
+    'month_product': ['Order Month', 'Product Id', 'Product Name', 'Product_Category'],
+    'category_bin': ['Product_Category', 'price_bins'],
+    'product': ['Product Id', 'Product Name', 'Product_Category'],
+    'category': ['Product_Category']
+}
+
+# Additive measures of the cube, the means of any granularity are the sums over order_count
+CUBE_MEASURES = ['order_count', 'quantity', 'discount_sum', 'discount_rate_sum', 'sales_sum', 'final_price_sum',
+                 'unit_discount_sum', 'unit_discount_rate_sum', 'unit_price_sum', 'unit_cost_sum']
+
+# Price bin of the orders above the binned price range
+UNBINNED = -1
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+##### CUBE FUNCTIONS #####
+
+# Function to compute the measures of every order, the unit measures being per item purchased
+def get_order_measures(all_data):
+
+    quantities = all_data['Total Quantity Purchased'].astype(float)
+
+    return pd.DataFrame({
+        'order_count': 1,
+        'quantity': all_data['Total Quantity Purchased'].astype(np.int64),
+        'discount_sum': all_data['Order Item Discount'].astype(float),
+        'discount_rate_sum': all_data['Order Item Discount Rate'].astype(float),
+        'sales_sum': all_data['Sales'].astype(float),
+        'final_price_sum': all_data['Final Price'].astype(float),
+        'unit_discount_sum': all_data['Order Item Discount'].astype(float) / quantities,
+        'unit_discount_rate_sum': all_data['Order Item Discount Rate'].astype(float) / quantities,
+        'unit_price_sum': all_data['Sales'].astype(float) / quantities,
+        'unit_cost_sum': (all_data['Order Item Total'].astype(float) - all_data['Order Profit'].astype(float)) / quantities
+    }, index=all_data.index)
+
+def build_pricing_cube(all_data, max_price=800, n_bins=20):
+    """
+    Aggregate the orders to (day, product, price bin) in a single grouped pass, then roll the sums up to the
+    coarser granularities of CUBE_GRAINS. The price bins are those of the categories preprocessor: n_bins bins
+    per category over the orders priced up to max_price, the other orders getting the bin -1.
+
+    Returns:
+    - DataFrame with a grain column, the keys of every grain (missing for the keys it rolls up) and CUBE_MEASURES.
+    """
+
+    binned = all_data['Sales'] <= max_price
+    price_bins = pd.Series(UNBINNED, index=all_data.index)
+    price_bins[binned] = pricing_features.bin_prices_per_category(all_data.loc[binned, 'Sales'], all_data.loc[binned, 'Product Category'], n_bins)
+
+    orders = get_order_measures(all_data)
+    keys = all_data[['Order Date', 'Order Month', 'Product Id', 'Product Name', 'Product Category']].rename(columns={'Product Category': 'Product_Category'})
+    orders = pd.concat([keys, orders.assign(price_bins=price_bins.astype(np.int64))], axis=1)
+
+    base_grain, *rollup_grains = CUBE_GRAINS
+    base = orders.groupby(CUBE_GRAINS[base_grain], observed=True)[CUBE_MEASURES].sum().reset_index()
+
+    grains = [base.assign(grain=base_grain)]
+    for grain in rollup_grains:
+        grains.append(base.groupby(CUBE_GRAINS[grain], observed=True)[CUBE_MEASURES].sum().reset_index().assign(grain=grain))
+
+    cube = pd.concat(grains, ignore_index=True)
+    # The rolled up keys are missing, nullable integers keep the others integer in SQLite
+    cube = cube[['grain'] + CUBE_GRAINS[base_grain] + CUBE_MEASURES].astype({'Order Date': 'Int64', 'Product Id': 'Int64', 'price_bins': 'Int64'})
+
+    print(f"{nowtime()} Pricing cube of {len(base)} (day, product, price bin) rows rolled up to {len(CUBE_GRAINS)} granularities ({len(cube)} rows).")
+
+    return cube
+
+##### PERSISTENCE FUNCTIONS #####
+
+# Function to get the fingerprint of the orders of start_year to end_year, per product
+def get_source_fingerprint(conn, start_year=2016, end_year=2018):
+
+    fingerprint = pd.read_sql_query(sql_queries.pricing_order_fingerprint_query(start_year, end_year), conn)
+
+    return fingerprint.assign(start_year=start_year, end_year=end_year)
+
+# Function to read the fingerprint saved with the cube, None if the database has no cube or no fingerprint
+def get_cube_fingerprint(conn):
+
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if not {CUBE_TABLE, CUBE_SOURCE_TABLE} <= tables:
+        return None
+
+    cube_fingerprint = pd.read_sql_query(f'SELECT * FROM {CUBE_SOURCE_TABLE}', conn)
+
+    return cube_fingerprint if not cube_fingerprint.empty else None
+
+# Function to check that two fingerprints are the same, the totals up to the rounding of the floating point sums
+def fingerprints_match(cube_fingerprint, source_fingerprint):
+
+    if list(cube_fingerprint.columns) != list(source_fingerprint.columns) or len(cube_fingerprint) != len(source_fingerprint):
+        return False
+
+    totals = [column for column in cube_fingerprint.columns if column.endswith('_total')]
+    keys = [column for column in cube_fingerprint.columns if column not in totals]
+
+    return (cube_fingerprint[keys].astype(str).equals(source_fingerprint[keys].astype(str))
+            and np.allclose(cube_fingerprint[totals], source_fingerprint[totals], rtol=1e-9, atol=1e-6))
+
+def update_pricing_cube(conn, start_year=2016, end_year=2018):
+    """
+    Rebuild the pricing_cube table of the supply chain database from the orders of start_year to end_year, and save
+    the fingerprint of these orders to the pricing_cube_source table.
+    """
+
+    fingerprint = get_source_fingerprint(conn, start_year, end_year)
+    all_data = pricing_data_loader.load_pricing_order_data(conn, CUBE_COLUMNS, start_year, end_year)
+
+    cube = build_pricing_cube(all_data)
+    cube = cube.astype({'Product Name': object, 'Product_Category': object})
+
+    cube.to_sql(CUBE_TABLE, conn, if_exists='replace', index=False)
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{CUBE_TABLE}_grain ON {CUBE_TABLE} (grain, "Product Name");')
+    fingerprint.to_sql(CUBE_SOURCE_TABLE, conn, if_exists='replace', index=False)
+    conn.commit()
+
+    print(f"{nowtime()} Pricing cube saved to the {CUBE_TABLE} table.")
+
+    return
+
+def load_pricing_cube(conn, grain, product_name=None):
+    """
+    Read one granularity of the pricing cube, building the cube first if the database has none and rebuilding it if
+    the orders of cleaned_order_data no longer match the fingerprint saved with it.
+
+    Parameters:
+    - grain: Key of CUBE_GRAINS.
+    - product_name: Only read the rows of this product when given, for the grains with a Product Name.
+
+    Returns:
+    - DataFrame with the keys of the grain and CUBE_MEASURES, sorted by the keys.
+    """
+
+    cube_fingerprint = get_cube_fingerprint(conn)
+    if cube_fingerprint is None:
+        print(f"{nowtime()} No pricing cube found, building it.")
+        update_pricing_cube(conn)
+    elif not fingerprints_match(cube_fingerprint, get_source_fingerprint(conn, *cube_fingerprint.loc[0, ['start_year', 'end_year']])):
+        print(f"{nowtime()} The orders changed since the pricing cube was built, rebuilding it.")
+        update_pricing_cube(conn, *cube_fingerprint.loc[0, ['start_year', 'end_year']])
+
+    keys = ', '.join(f'"{key}"' for key in CUBE_GRAINS[grain])
+    measures = ', '.join(CUBE_MEASURES)
+    product_filter = 'AND "Product Name" = ?' if product_name is not None else ''
+    params = (grain, product_name) if product_name is not None else (grain,)
+
+    cube = pd.read_sql_query(f'SELECT {keys}, {measures} FROM {CUBE_TABLE} WHERE grain = ? {product_filter} ORDER BY {keys}', conn, params=params)
+
+    print(f"{nowtime()} {len(cube)} {grain} rows read from the pricing cube.")
+
+    return cube
+
+# Function to get the mean of the cube sums over the orders of each row
+def get_cube_means(cube, measures):
+
+    return cube[measures].div(cube['order_count'], axis=0)
+
+@click.command()
+@click.argument('supply_chain_database_path', type=click.Path(exists=True))
+
+def main(supply_chain_database_path):
+
+    conn = sqlite3.connect(supply_chain_database_path)
+    print(f"{nowtime()} Connected to database at {supply_chain_database_path}")
+
+    update_pricing_cube(conn)
+
+    conn.close()
+    print(f"{nowtime()} Connection to database closed.")
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import pandas as pd
+import numpy as np
+import sql_queries
+
+# Columns of cleaned_order_data used by the pricing preprocessors
+PRICING_COLUMNS = ['Order Date', 'Order Month', 'Product Id', 'Product Category', 'Order Item Discount',
+                   'Order Item Discount Rate', 'Total Quantity Purchased', 'Sales', 'Order Item Total', 'Order Profit']
+
+# Compact dtypes of the loaded columns, prices are kept in single precision
+PRICING_DTYPES = {
+    'Index': np.int32,
+    'Order Date': np.int32,
+    'Product Id': np.int32,
+    'Product Name': 'category',
+    'Product Category': 'category',
+    'Order Item Discount': np.float32,
+    'Order Item Discount Rate': np.float32,
+    'Total Quantity Purchased': np.int32,
+    'Sales': np.float32,
+    'Order Item Total': np.float32,
+    'Order Profit': np.float32,
+    'Final Price': np.float32
+}
+
+def nowtime():
+
+    time = pd.Timestamp('now').strftime('%Y-%m-%d %H:%M:%S')
+
+    return f"[{time}]"
+
+def load_pricing_order_data(conn, columns=PRICING_COLUMNS, start_year=2016, end_year=2018, product_name=None):
+    """
+    Load the orders used for pricing, reading only the needed columns and filtering the years in SQL.
+
+    Parameters:
+    - conn: Connection to the supply chain database.
+    - columns: Columns of cleaned_order_data to load.
+    - start_year, end_year: First and last year of orders to keep.
+    - product_name: Only load the orders of this product when given.
+
+    Returns:
+    - DataFrame with a categorical Product Category, float32 prices, the unit Final Price of each order and the
+      Order Date as a YYYYMMDD integer.
+    """
+
+    query = sql_queries.pricing_order_data_query(columns, start_year, end_year, product_name)
+    params = (product_name,) if product_name is not None else None
+
+    df = pd.read_sql_query(query, conn, params=params)
+
+    # The unit price is rounded in double precision, before the prices are narrowed
+    if {'Order Item Total', 'Total Quantity Purchased'} <= set(df.columns):
+        df['Final Price'] = round(df['Order Item Total'] / df['Total Quantity Purchased'], 2)
+
+    df = df.astype({column: dtype for column, dtype in PRICING_DTYPES.items() if column in df.columns})
+
+    print(f"{nowtime()} {len(df)} orders from {start_year} to {end_year} loaded ({df.memory_usage(deep=True).sum() / 1e6:.1f} MB).")
+
+    return df
@@ -0,0 +1,86 @@
+import pandas as pd
+import numpy as np
+
+##### PRICE BINNING #####
+
+def get_category_bin_edges(mn, mx, n_bins=20):
+    """
+    Compute the edges of n_bins equal-width bins for every category from arrays of the category min and max prices,
+    with the same end point adjustments as pd.cut: a single-valued range is widened, otherwise the first edge is
+    moved slightly below the min so that the min falls in the first right-closed bin.
+
+    Returns:
+    - Array of shape (number of categories, n_bins + 1).
+    """
+
+    flat = mn == mx
+    mn_padding = np.where(mn != 0, 0.001 * np.abs(mn), 0.001).astype(mn.dtype)
+    mx_padding = np.where(mx != 0, 0.001 * np.abs(mx), 0.001).astype(mx.dtype)
+    mn, mx = np.where(flat, mn - mn_padding, mn), np.where(flat, mx + mx_padding, mx)
+
+    edges = np.linspace(mn, mx, n_bins + 1, endpoint=True, axis=1)
+    edges[~flat, 0] -= ((mx - mn) * 0.001)[~flat]
+
+    return edges
+
+def bin_prices_per_category(prices, categories, n_bins=20):
+    """
+    Assign every price to one of n_bins equal-width bins spanning the price range of its category, giving the same
+    bins as pd.cut(x, bins=n_bins, labels=False) applied to each category. The edges of all categories are computed
+    at once from their grouped min and max, and each price is searched among the edges of its own category.
+
+    Parameters:
+    - prices: Series of prices.
+    - categories: Series of the category of each price, aligned with prices.
+    - n_bins: Number of bins per category.
+
+    Returns:
+    - Series of bin numbers from 0 to n_bins - 1, aligned with prices.
+    """
+
+    codes, uniques = pd.factorize(categories, sort=True)
+    values = prices.to_numpy()
+
+    price_range = prices.groupby(codes).agg(['min', 'max']).reindex(range(len(uniques)))
+    edges = get_category_bin_edges(price_range['min'].to_numpy(), price_range['max'].to_numpy(), n_bins)
+
+    # Right-closed bins, so the bin of a price is the number of its category's edges strictly below it (searchsorted side='left')
+    ids = (values[:, None] > edges[codes]).sum(axis=1)
+
+    bins = ids - 1
+    outside = (ids == 0) | (ids == n_bins + 1) | (codes == -1)
+    if outside.any():
+        bins = np.where(outside, np.nan, bins)
+
+    return pd.Series(bins, index=prices.index)
+
+##### CALENDAR AND ELASTICITY LABELS #####
+
+def get_seasonality_table(classify_seasonality):
+    """
+    Tabulate a date-based seasonality classifier into a (month, day) lookup array, using a leap year so that
+    every calendar day is covered.
+    """
+
+    table = np.full((13, 32), None, dtype=object)
+    for date in pd.date_range('2016-01-01', '2016-12-31'):
+        table[date.month, date.day] = classify_seasonality(date)
+
+    return table
+
+def label_seasonality(order_dates, seasonality_table):
+
+    return pd.Series(seasonality_table[order_dates.dt.month.to_numpy(), order_dates.dt.day.to_numpy()], index=order_dates.index)
+
+def label_price_elasticity(price_elasticity_of_demand, categories, elasticity_mapping):
+    """
+    Label each price elasticity of demand as 'Elastic' when |PED| > 1 and 'Inelastic' when |PED| < 1. A PED of
+    exactly 0 or 1, or a missing PED, is not informative, so those rows take the manual label of their category.
+    """
+
+    ped = price_elasticity_of_demand.to_numpy()
+    category_labels = categories.astype(object).map(elasticity_mapping).to_numpy()
+
+    labels = np.where(np.abs(ped) > 1, 'Elastic', np.where((np.abs(ped) < 1) & (ped != 0), 'Inelastic', category_labels))
+
+    return pd.Series(labels, index=price_elasticity_of_demand.index)
@@ -5,6 +5,17 @@
 : "${OUTPUT_DIR:?Environment variable OUTPUT_DIR not set}"
 : "${RUN_NOTEBOOKS:?Environment variable RUN_NOTEBOOKS not set}"
 
+# Variable Set up --------------------------------------------------
+export pricing_all_products="${PRICING_ALL_PRODUCTS:-False}"
+export pricing_partitions="${PRICING_PARTITIONS:-8}"
+export pricing_workers="${PRICING_WORKERS:-1}"
+export pricing_elasticity_method="${PRICING_ELASTICITY_METHOD:-ratio}"
+export pricing_reset_feature_schema="${PRICING_RESET_FEATURE_SCHEMA:-False}"
+export pricing_optimization="${PRICING_OPTIMIZATION:-False}"
+export pricing_objective="${PRICING_OBJECTIVE:-revenue}"
+export pricing_grid_size="${PRICING_GRID_SIZE:-201}"
+export pricing_what_if_scenarios="${PRICING_WHAT_IF_SCENARIOS:-}"
+
 # Directories --------------------------------------------------
 module_dir="/app/pricing_strategy_module"
 export output_dir="/app/output/pricing_strategy_module"
@@ -23,8 +34,12 @@ export brazil_database_path="/app/input/brazil_dataset.db"
 
 # Scripts --------------------------------------------------
 export PED_analysis_script="${module_dir}/PED_analysis.ipynb"
+export pricing_cube_script="${module_dir}/pricing_cube.py"
 export preprocessing_product_categories_script="${module_dir}/preprocessing_product_categories.py"
 export preprocessing_single_product_script="${module_dir}/preprocessing_single_product.py"
+export preprocessing_all_products_script="${module_dir}/preprocessing_all_products.py"
+export price_optimization_script="${module_dir}/price_optimization.py"
+export what_if_simulator_script="${module_dir}/what_if_simulator.py"
 export pricing_for_product_categories_script="${module_dir}/pricing_for_product_categories.ipynb"
 export pricing_for_single_product_script="${module_dir}/pricing_for_single_product.ipynb"
 
@@ -37,14 +52,45 @@ fi
 
 jupyter nbconvert --to html --output "${report_dir}"/PED_analysis_report.html "${PED_analysis_script}"
 
+# Pricing Cube --------------------------------------------------
+echo "Building the Pricing Cube..."
+python "$pricing_cube_script" "$supply_chain_database_path"
+
 # Preprocessing for product categories --------------------------------------------------
 echo "Running Preprocessing for product categories..."
-python "$preprocessing_product_categories_script" "$supply_chain_database_path" "$brazil_database_path" "$reference_dir"
+if [ "$pricing_reset_feature_schema" = "True" ]; then
+    python "$preprocessing_product_categories_script" "$supply_chain_database_path" "$brazil_database_path" "$reference_dir" --elasticity-method "$pricing_elasticity_method" --reset-feature-schema
+else
+    python "$preprocessing_product_categories_script" "$supply_chain_database_path" "$brazil_database_path" "$reference_dir" --elasticity-method "$pricing_elasticity_method"
+fi
 
 # Preprocessing for single product --------------------------------------------------
 echo "Running Preprocessing for single product..."
 python "$preprocessing_single_product_script" "$supply_chain_database_path" "$brazil_database_path" "$reference_dir"
 
+# Preprocessing for all products --------------------------------------------------
+if [ "$pricing_all_products" = "True" ]; then
+    echo "Running Preprocessing for all products..."
+    python "$preprocessing_all_products_script" "$supply_chain_database_path" "$brazil_database_path" "$reference_dir" --partitions "$pricing_partitions" --workers "$pricing_workers"
+fi
+
+# Price Optimization --------------------------------------------------
+if [ "$pricing_optimization" = "True" ]; then
+    echo "Running Price Optimization..."
+    python "$price_optimization_script" "$supply_chain_database_path" "$reference_dir" "$pricing_results_dir" --objective "$pricing_objective" --grid-size "$pricing_grid_size" --retrain-model
+fi
+
+# What-if Simulation --------------------------------------------------
+if [ -n "$pricing_what_if_scenarios" ]; then
+    echo "Running What-if Simulation..."
+    if [ "$pricing_optimization" = "True" ]; then
+        # Score the scenarios with the model the optimization step just trained
+        python "$what_if_simulator_script" "$supply_chain_database_path" "$reference_dir" "$pricing_results_dir" "$pricing_what_if_scenarios" --model-path "$pricing_results_dir/demand_model.pkl"
+    else
+        python "$what_if_simulator_script" "$supply_chain_database_path" "$reference_dir" "$pricing_results_dir" "$pricing_what_if_scenarios"
+    fi
+fi
+
 # Pricing for Product Categories --------------------------------------------------
 echo "Running Pricing for Product Categories Script..."
 
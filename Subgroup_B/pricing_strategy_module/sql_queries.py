@@ -1,30 +1,130 @@
+def olist_priced_items_cte(start_year, end_year):
+    """
+    Join the orders placed from start_year to end_year to their items, products, English category names and mapped
+    DataCo categories, keeping only the columns used for pricing.
+    """
 
-def supply_chain_query():
-    return """
-    SELECT * 
-    FROM cleaned_order_data
+    return f"""
+    WITH priced_items AS (
+        SELECT
+            o.order_purchase_timestamp,
+            i.order_item_id,
+            i.price_before_discount,
+            i.discount_rate,
+            i.price_after_discount,
+            m.Product_Category
+        FROM olist_orders_dataset o
+        JOIN olist_order_items_dataset i ON i.order_id = o.order_id
+        JOIN olist_products_dataset p ON p.product_id = i.product_id
+        JOIN product_category_name_translation t ON t.product_category_name = p.product_category_name
+        JOIN olist_category_mapping m ON m.product_category_name_english = t.product_category_name_english
+        WHERE o.order_purchase_timestamp >= '{start_year}-01-01' AND o.order_purchase_timestamp < '{end_year + 1}-01-01'
+    )
+    """
+
+def olist_price_range_query(start_year, end_year, max_price):
+    return olist_priced_items_cte(start_year, end_year) + f"""
+    SELECT Product_Category, MIN(price_before_discount) AS min_price, MAX(price_before_discount) AS max_price
+    FROM priced_items
+    WHERE price_before_discount <= {max_price}
+    GROUP BY Product_Category
+    ORDER BY Product_Category
     """
 
-def olist_query1():
-    return """
-    SELECT * 
-    FROM olist_order_items_dataset
+def olist_price_bin_query(start_year, end_year, max_price):
+    return olist_priced_items_cte(start_year, end_year) + f"""
+    SELECT
+        CAST(STRFTIME('%Y%m', pi.order_purchase_timestamp) AS INTEGER) AS "Order Period",
+        pi.Product_Category,
+        e.price_bins,
+        SUM(pi.order_item_id) AS olist_product_demand,
+        AVG(pi.price_before_discount) AS olist_price_before_discount,
+        AVG(pi.discount_rate) AS avg_discount_rate,
+        AVG(pi.price_after_discount) AS avg_price_after_discount
+    FROM priced_items pi
+    JOIN olist_price_bin_edges e
+        ON e.Product_Category = pi.Product_Category
+        AND pi.price_before_discount > e.lower_edge
+        AND pi.price_before_discount <= e.upper_edge
+    WHERE pi.price_before_discount <= {max_price}
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
     """
 
-def olist_query2():
-    return """
-    SELECT * 
-    FROM olist_products_dataset
+def olist_monthly_query(start_year, end_year):
+    return olist_priced_items_cte(start_year, end_year) + """
+    SELECT
+        STRFTIME('%m', order_purchase_timestamp) AS "Order Month",
+        SUM(order_item_id) AS olist_product_demand,
+        AVG(price_before_discount) AS olist_price_before_discount,
+        AVG(discount_rate) AS olist_avg_discount_rate,
+        AVG(price_after_discount) AS olist_avg_price_after_discount
+    FROM priced_items
+    WHERE Product_Category = ? AND price_before_discount BETWEEN ? AND ?
+    GROUP BY 1
     """
 
-def olist_query3():
-    return """
-    SELECT * 
-    FROM product_category_name_translation
+def olist_product_monthly_query(start_year, end_year):
+    return olist_priced_items_cte(start_year, end_year) + """
+    SELECT
+        w."Product Id",
+        STRFTIME('%m', pi.order_purchase_timestamp) AS "Order Month",
+        SUM(pi.order_item_id) AS olist_product_demand,
+        AVG(pi.price_before_discount) AS olist_price_before_discount,
+        AVG(pi.discount_rate) AS olist_avg_discount_rate,
+        AVG(pi.price_after_discount) AS olist_avg_price_after_discount
+    FROM priced_items pi
+    JOIN olist_product_price_windows w
+        ON w.Product_Category = pi.Product_Category
+        AND pi.price_before_discount BETWEEN w.min_price AND w.max_price
+    GROUP BY 1, 2
     """
 
-def olist_query4():
-    return """
-    SELECT * 
-    FROM olist_orders_dataset
-    """
\ No newline at end of file
+def pricing_order_data_query(columns, start_year, end_year, product_name=None):
+    """
+    Select only the given columns of the orders placed from start_year to end_year. The product category is
+    trimmed and the order date is returned as a YYYYMMDD integer.
+    """
+
+    expressions = {
+        'Product Category': 'TRIM("Product Category") AS "Product Category"',
+        'Order Date': 'CAST(STRFTIME(\'%Y%m%d\', "Order Date") AS INTEGER) AS "Order Date"'
+    }
+    select = ',\n        '.join(expressions.get(column, f'"{column}"') for column in columns)
+    product_filter = 'AND "Product Name" = ?' if product_name is not None else ''
+
+    return f"""
+    SELECT
+        {select}
+    FROM cleaned_order_data
+    WHERE "Order Date" >= '{start_year}-01-01' AND "Order Date" < '{end_year + 1}-01-01'
+    {product_filter}
+    """
+
+def pricing_order_fingerprint_query(start_year, end_year):
+    """
+    Fingerprint the orders placed from start_year to end_year per product: their count, last Index and last Order
+    Date change when orders are added, removed or reloaded, and the totals of the aggregated columns change when
+    orders are corrected in place, an order moved to another product or category moving its totals to another row.
+    """
+
+    return f"""
+    SELECT
+        "Product Id",
+        "Product Name",
+        TRIM("Product Category") AS "Product Category",
+        COUNT(*) AS order_count,
+        MAX("Index") AS max_index,
+        MAX("Order Date") AS max_order_date,
+        TOTAL(CAST(STRFTIME('%Y%m%d', "Order Date") AS INTEGER)) AS order_date_total,
+        TOTAL("Order Item Discount") AS discount_total,
+        TOTAL("Order Item Discount Rate") AS discount_rate_total,
+        TOTAL("Total Quantity Purchased") AS quantity_total,
+        TOTAL("Sales") AS sales_total,
+        TOTAL("Order Item Total") AS order_item_total,
+        TOTAL("Order Profit") AS profit_total
+    FROM cleaned_order_data
+    WHERE "Order Date" >= '{start_year}-01-01' AND "Order Date" < '{end_year + 1}-01-01'
+    GROUP BY "Product Id", "Product Name", TRIM("Product Category")
+    ORDER BY "Product Id", "Product Name", TRIM("Product Category")
+    """
@@ -0,0 +1,130 @@
+import pandas as pd
+import numpy as np
+import os
+import click
+import feature_schema
+from price_optimization import nowtime, get_demand_model, get_segments, SEGMENT_KEYS, DISCOUNT_COLUMN, PRICE_COLUMN
+
+# Columns of a scenario table
+SCENARIO_COLUMNS = ['Product_Category', 'price_bins', 'discount_rate', 'Seasonality']
+
+##### SIMULATION FUNCTIONS #####
+
+def build_scenario_features(scenarios, segments, schema, feature_columns):
+    """
+    Build the feature matrix of the scenarios in the layout of the prepped files. Every scenario starts from the
+    baseline feature row of its (category, price bin), then takes its discount rate, the resulting Final Price and
+    the Seasonality dummies of its season.
+
+    Returns:
+    - Array of shape (scenarios, features), the unit list price and unit cost of every scenario, and a mask of the
+      scenarios whose category, price bin and season are known.
+    """
+
+    codes = feature_schema.encode_categories(scenarios['Product_Category'], schema, 'Product_Category')
+    segment_index = pd.MultiIndex.from_frame(segments[SEGMENT_KEYS])
+    rows = segment_index.get_indexer(pd.MultiIndex.from_arrays([codes, scenarios['price_bins'].to_numpy()]))
+
+    seasons = scenarios['Seasonality'].astype(str)
+    known = (rows >= 0) & seasons.isin(schema['dummies']['Seasonality']).to_numpy()
+    rows = np.where(known, rows, 0)
+
+    discount_rates = scenarios['discount_rate'].to_numpy(dtype=float)
+    list_prices = segments['list_price'].to_numpy(dtype=float)[rows]
+    unit_costs = segments['unit_cost'].to_numpy(dtype=float)[rows]
+
+    X = segments[feature_columns].to_numpy(dtype=float)[rows]
+    X[:, feature_columns.index(DISCOUNT_COLUMN)] = discount_rates
+    if PRICE_COLUMN in feature_columns:
+        X[:, feature_columns.index(PRICE_COLUMN)] = list_prices * (1 - discount_rates)
+
+    for i, column in enumerate(feature_columns):
+        if column.startswith('Seasonality_'):
+            X[:, i] = seasons.to_numpy() == column[len('Seasonality_'):]
+
+    return X, list_prices, unit_costs, known
+
+def simulate_scenarios(model, scenarios, segments, schema):
+    """
+    Predict the demand, revenue and profit of every scenario in one vectorized predict call.
+
+    Parameters:
+    - model: Fitted demand regressor with feature_names_in_.
+    - scenarios: DataFrame with the SCENARIO_COLUMNS.
+    - segments: Baseline features, list prices and unit costs of the segments, from price_optimization.get_segments.
+    - schema: Feature schema of the prepped files.
+
+    Returns:
+    - The scenarios with their predicted_price, predicted_demand, predicted_revenue and predicted_profit, missing for
+      the scenarios of an unknown category, price bin or season.
+    """
+
+    feature_columns = list(model.feature_names_in_)
+    X, list_prices, unit_costs, known = build_scenario_features(scenarios, segments, schema, feature_columns)
+
+    demand = np.clip(model.predict(pd.DataFrame(X, columns=feature_columns)), 0, None)
+    prices = list_prices * (1 - scenarios['discount_rate'].to_numpy(dtype=float))
+
+    results = scenarios[SCENARIO_COLUMNS].copy()
+    results['predicted_price'] = np.where(known, prices, np.nan)
+    results['predicted_demand'] = np.where(known, demand, np.nan)
+    results['predicted_revenue'] = np.where(known, prices * demand, np.nan)
+    results['predicted_profit'] = np.where(known, (prices - unit_costs) * demand, np.nan)
+
+    return results
+
+def run_what_if_simulation(supply_chain_database_path, reference_dir, pricing_results_dir, scenarios_path, output_path=None,
+                           prepped_file='dataco_prepped.csv', model_path=None, retrain_model=False, chunk_rows=500_000):
+    """
+    Simulate the scenarios of a CSV file chunk by chunk, appending the results of every chunk to output_path, so that
+    only chunk_rows scenarios are held in memory whatever the size of the file.
+    """
+
+    if output_path is None:
+        output_path = os.path.join(pricing_results_dir, 'what_if_results.csv')
+
+    df_prep = pd.read_csv(os.path.join(reference_dir, prepped_file))
+    model = get_demand_model(df_prep, pricing_results_dir, model_path, retrain_model)
+    schema = feature_schema.load_feature_schema(reference_dir)
+
+    segments = get_segments(supply_chain_database_path, schema, df_prep, list(model.feature_names_in_))
+
+    n_scenarios, n_unknown = 0, 0
+    chunks = pd.read_csv(scenarios_path, usecols=SCENARIO_COLUMNS, dtype={'Product_Category': str, 'Seasonality': str}, chunksize=chunk_rows)
+    for i, scenarios in enumerate(chunks):
+        results = simulate_scenarios(model, scenarios, segments, schema)
+        results.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+        n_scenarios += len(results)
+        n_unknown += results['predicted_demand'].isna().sum()
+        print(f"{nowtime()} {n_scenarios} scenarios simulated.")
+
+    if n_unknown:
+        print(f"{nowtime()} {n_unknown} scenarios have an unknown category, price bin or season and were not scored.")
+
+    print(f"{nowtime()} What-if results saved to {output_path}")
+
+    return
+
+@click.command()
+@click.argument('supply_chain_database_path', type=click.Path(exists=True))
+@click.argument('reference_dir', type=click.Path(exists=True))
+@click.argument('pricing_results_dir', type=click.Path(exists=True))
+@click.argument('scenarios_path', type=click.Path(exists=True))
+@click.option('--output-path', default=None, type=click.Path(), help='CSV file the results are written to. Defaults to pricing_results_dir/what_if_results.csv.')
+@click.option('--prepped-file', default='dataco_prepped.csv', type=click.Choice(['dataco_prepped.csv', 'dataco_olist_prepped.csv']),
+              help='Prepped features of reference_dir the demand model is trained on and the segments are built from.')
+@click.option('--model-path', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Fitted demand model to load. Defaults to the model saved in pricing_results_dir, a decision tree being trained on the prepped file if there is none.')
+@click.option('--retrain-model', is_flag=True, default=False, help='Train the demand model on the prepped file again and save it to pricing_results_dir.')
+@click.option('--chunk-rows', default=500_000, type=int, help='Number of scenarios read, scored and written at a time.')
+
+def main(supply_chain_database_path, reference_dir, pricing_results_dir, scenarios_path, output_path, prepped_file, model_path, retrain_model, chunk_rows):
+
+    run_what_if_simulation(supply_chain_database_path, reference_dir, pricing_results_dir, scenarios_path, output_path,
+                           prepped_file, model_path, retrain_model, chunk_rows)
+
+    return
+
+if __name__ == '__main__':
+    main()
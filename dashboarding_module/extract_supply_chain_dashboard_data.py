@@ -8,6 +8,14 @@ import click
 
 ##### SUPPLIER PERFORMANCE DATA #####
 
+# Function to check that the month-start stock snapshot exists and is up to date with stock_data
+def snapshot_is_current(supply_chain_conn):
+
+    if pd.read_sql_query(sql_queries.stock_snapshot_exists_query(), supply_chain_conn).empty:
+        return False
+
+    return bool(pd.read_sql_query(sql_queries.stock_snapshot_is_current_query(), supply_chain_conn)['is_current'].iloc[0])
+
 def extract_supply_chain_data(supply_chain_database_path):
 
     supply_chain_conn = sqlite3.connect(supply_chain_database_path)
@@ -18,8 +26,12 @@ def extract_supply_chain_data(supply_chain_database_path):
     # All stock Data #
     stock_data = pd.read_sql_query(sql_queries.all_stock_data_query(), supply_chain_conn)
 
-    # Monthly stock Data #
-    monthly_stock_data = pd.read_sql_query(sql_queries.monthly_stock_data_query(), supply_chain_conn)
+    # Monthly stock Data, read from the month-start snapshot kept by the inventory management module when it exists #
+    # and covers every daily row, the snapshot only being updated when the inventory management module runs #
+    if snapshot_is_current(supply_chain_conn):
+        monthly_stock_data = pd.read_sql_query(sql_queries.monthly_stock_data_query(), supply_chain_conn)
+    else:
+        monthly_stock_data = pd.read_sql_query(sql_queries.monthly_stock_data_from_daily_query(), supply_chain_conn)
 
     # Product Info #
     product_info = pd.read_sql_query(sql_queries.product_info_query(), supply_chain_conn)
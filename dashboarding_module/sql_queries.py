@@ -4,7 +4,43 @@ def order_data_query():
 def all_stock_data_query():
     return "SELECT * FROM stock_data"
 
+def stock_snapshot_exists_query():
+    return "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'monthly_stock_snapshot'"
+
+def stock_snapshot_is_current_query():
+    """
+    Check that the snapshot covers the daily rows appended to stock_data since it was updated: its latest month has to
+    be the latest month of stock_data, with the same products and the same quantity sold.
+    """
+
+    return """
+    WITH latest AS (
+        SELECT MAX("Year" || '-' || "Month") AS latest_month FROM monthly_stock_snapshot
+    ),
+    snapshot AS (
+        SELECT COUNT(*) AS products, SUM("Total Sold") AS total_sold
+        FROM monthly_stock_snapshot, latest
+        WHERE "Year" || '-' || "Month" = latest.latest_month
+    ),
+    daily AS (
+        SELECT MAX("Date") AS last_date, COUNT(DISTINCT "Product Name") AS products, SUM("Total Sold") AS total_sold
+        FROM stock_data, latest
+        WHERE "Date" >= latest.latest_month || '-01'
+    )
+    SELECT
+        COALESCE(SUBSTR(daily.last_date, 1, 7) = latest.latest_month AND daily.products = snapshot.products
+                 AND daily.total_sold = snapshot.total_sold, 0) AS is_current
+    FROM latest, snapshot, daily;
+    """
+
 def monthly_stock_data_query():
+    return """
+    SELECT "Product Name", "Year", "Month", "Stock at Start of Month", "Total Sold"
+    FROM monthly_stock_snapshot
+    ORDER BY "Product Name", "Year", "Month";
+    """
+
+def monthly_stock_data_from_daily_query():
     return """
     SELECT 
         "Product Name",